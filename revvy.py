@@ -8,6 +8,7 @@ from revvy.functions import getserial, read_json
 from revvy.bluetooth.longmessage import LongMessageHandler, LongMessageStorage, LongMessageType, LongMessageStatus
 from revvy.hardware_dependent.rrrc_transport_i2c import RevvyTransportI2C
 from revvy.robot_config import empty_robot_config
+from revvy.scripting.script_cache import ScriptCache
 from revvy.utils import *
 from revvy.mcu.rrrc_transport import *
 from revvy.mcu.rrrc_control import *
@@ -156,10 +157,28 @@ def start_revvy(config: RobotConfig = None):
         bootloader_control = BootloaderControl(transport.bind(0x2B))
 
         updater = McuUpdater(robot_control, bootloader_control)
-        update_manager = McuUpdateManager(os.path.join(package_data_dir, 'firmware'), updater)
+
+        # MCU is in bootloader mode during the transfer so there is no LED ring to show progress on
+        last_progress = [-1]
+
+        def print_update_progress(sent, total):
+            progress = 100 * sent // total if total else 100
+            if progress // 10 != last_progress[0] // 10:
+                print('Firmware update: {}%'.format(progress))
+            last_progress[0] = progress
+
+        updater.on_progress(print_update_progress)
+        update_manager = McuUpdateManager(os.path.join(package_data_dir, 'firmware'), updater, device_storage)
         update_manager.update_if_necessary()
 
-        robot = RobotManager(robot_control, ble, sound_paths, manifest['version'], initial_config)
+        script_cache = ScriptCache(device_storage)
+        robot = RobotManager(robot_control, ble, sound_paths, manifest['version'], initial_config, script_cache,
+                             device_storage)
+
+        # REVVY_CONTROLLER_LOG names a file to record the remote controller messages into, for replay_controller.py
+        controller_log = os.environ.get('REVVY_CONTROLLER_LOG')
+        if controller_log:
+            robot.record_controller_input(open(controller_log, 'wb'))
 
         lmi = LongMessageImplementation(robot, config is not None)
         long_message_handler.on_upload_started(lmi.on_upload_started)
@@ -5,8 +5,10 @@ import struct
 import traceback
 
 from pybleno import Bleno, BlenoPrimaryService, Characteristic, Descriptor
+from revvy.bluetooth.events import EventQueue, create_ble_event_dispatcher
 from revvy.bluetooth.longmessage import LongMessageError, LongMessageProtocol
-from revvy.functions import bits_to_bool_list
+from revvy.bluetooth.notifications import NotificationScheduler
+from revvy.bluetooth.telemetry import encode_telemetry_frames
 from revvy.robot.remote_controller import RemoteControllerCommand
 
 
@@ -51,24 +53,30 @@ class Observable:
 
 
 class LongMessageCharacteristic(Characteristic):
-    def __init__(self, handler):
+    """Reads and writes are handled in order on the event queue, the responses are sent when they are done"""
+
+    def __init__(self, handler, events: EventQueue):
         super().__init__({
             'uuid':       'd59bb321-7218-4fb9-abac-2f6814f31a4d',
             'properties': ['read', 'write'],
             'value':      None
         })
         self._handler = LongMessageProtocol(handler)
+        self._events = events
 
     def onReadRequest(self, offset, callback):
         if offset:
             callback(Characteristic.RESULT_ATTR_NOT_LONG)
-        else:
-            try:
-                value = self._handler.handle_read()
-                callback(Characteristic.RESULT_SUCCESS, value)
+        elif not self._events.put(lambda: self._handle_read(callback)):
+            callback(Characteristic.RESULT_UNLIKELY_ERROR)
 
-            except LongMessageError:
-                callback(Characteristic.RESULT_UNLIKELY_ERROR)
+    def _handle_read(self, callback):
+        try:
+            value = self._handler.handle_read()
+            callback(Characteristic.RESULT_SUCCESS, value)
+
+        except LongMessageError:
+            callback(Characteristic.RESULT_UNLIKELY_ERROR)
 
     @staticmethod
     def _translate_result(result):
@@ -80,16 +88,19 @@ class LongMessageCharacteristic(Characteristic):
             return Characteristic.RESULT_UNLIKELY_ERROR
 
     def onWriteRequest(self, data, offset, without_response, callback):
-        result = Characteristic.RESULT_UNLIKELY_ERROR
-        try:
-            if offset:
-                result = Characteristic.RESULT_ATTR_NOT_LONG
+        if offset:
+            callback(Characteristic.RESULT_ATTR_NOT_LONG)
 
-            elif len(data) < 1:
-                result = Characteristic.RESULT_INVALID_ATTRIBUTE_LENGTH
+        elif len(data) < 1:
+            callback(Characteristic.RESULT_INVALID_ATTRIBUTE_LENGTH)
 
-            else:
-                result = self._translate_result(self._handler.handle_write(data[0], data[1:]))
+        elif not self._events.put(lambda: self._handle_write(data, callback)):
+            callback(Characteristic.RESULT_UNLIKELY_ERROR)
+
+    def _handle_write(self, data, callback):
+        result = Characteristic.RESULT_UNLIKELY_ERROR
+        try:
+            result = self._translate_result(self._handler.handle_write(data[0], data[1:]))
 
         except LongMessageError:
             print(traceback.format_exc())
@@ -98,11 +109,11 @@ class LongMessageCharacteristic(Characteristic):
 
 
 class LongMessageService(BlenoPrimaryService):
-    def __init__(self, handler):
+    def __init__(self, handler, events: EventQueue):
         super().__init__({
             'uuid':            '97148a03-5b9d-11e9-8647-d663bd873d93',
             'characteristics': [
-                LongMessageCharacteristic(handler),
+                LongMessageCharacteristic(handler, events),
             ]})
 
 
@@ -135,9 +146,11 @@ class MobileToBrainFunctionCharacteristic(Characteristic):
 
 
 class BrainToMobileFunctionCharacteristic(Characteristic):
-    def __init__(self, uuid, description):
+    def __init__(self, uuid, description, notifications: NotificationScheduler, min_interval=0.0, queue_length=1):
         self._value = []
-        self._updateValueCallback = None
+        self._notifications = notifications
+        self._notification = notifications.create_slot(min_interval, queue_length)
+        self.subscribed_callback = lambda: None
         super().__init__({
             'uuid':        uuid,
             'properties':  ['read', 'notify'],
@@ -157,16 +170,18 @@ class BrainToMobileFunctionCharacteristic(Characteristic):
             callback(Characteristic.RESULT_SUCCESS, self._value)
 
     def onSubscribe(self, max_value_size, update_value_callback):
-        self._updateValueCallback = update_value_callback
+        self._notification.subscribe(max_value_size, update_value_callback)
+        self.subscribed_callback()
 
     def onUnsubscribe(self):
-        self._updateValueCallback = None
+        self._notification.unsubscribe()
+
+    def onNotify(self):
+        self._notifications.notification_sent()
 
     def update(self, value):
         self._value = value
-
-        if self._updateValueCallback:
-            self._updateValueCallback(value)
+        self._notification.update(value)
 
 
 class SensorCharacteristic(BrainToMobileFunctionCharacteristic):
@@ -180,47 +195,69 @@ class MotorCharacteristic(BrainToMobileFunctionCharacteristic):
     pass
 
 
+class TelemetryCharacteristic(BrainToMobileFunctionCharacteristic):
+    """Aggregated telemetry, split into as many frames as needed to fit into a notification"""
+
+    def __init__(self, uuid, description, notifications: NotificationScheduler):
+        super().__init__(uuid, description, notifications, queue_length=8)
+
+    def update_fields(self, fields):
+        for frame in encode_telemetry_frames(fields, self._notification.max_value_size):
+            self.update(list(frame))
+
+
 class LiveMessageService(BlenoPrimaryService):
-    def __init__(self):
+    def __init__(self, events: EventQueue, notifications: NotificationScheduler):
         self._message_handler = lambda x: None
+        self._events = events
 
         self._sensor_characteristics = [
-            SensorCharacteristic('135032e6-3e86-404f-b0a9-953fd46dcb17', b'Sensor 1'),
-            SensorCharacteristic('36e944ef-34fe-4de2-9310-394d482e20e6', b'Sensor 2'),
-            SensorCharacteristic('b3a71566-9af2-4c9d-bc4a-6f754ab6fcf0', b'Sensor 3'),
-            SensorCharacteristic('9ace575c-0b70-4ed5-96f1-979a8eadbc6b', b'Sensor 4'),
+            SensorCharacteristic('135032e6-3e86-404f-b0a9-953fd46dcb17', b'Sensor 1', notifications),
+            SensorCharacteristic('36e944ef-34fe-4de2-9310-394d482e20e6', b'Sensor 2', notifications),
+            SensorCharacteristic('b3a71566-9af2-4c9d-bc4a-6f754ab6fcf0', b'Sensor 3', notifications),
+            SensorCharacteristic('9ace575c-0b70-4ed5-96f1-979a8eadbc6b', b'Sensor 4', notifications),
         ]
 
         self._motor_characteristics = [
-            MotorCharacteristic('4bdfb409-93cc-433a-83bd-7f4f8e7eaf54', b'Motor 1'),
-            MotorCharacteristic('454885b9-c9d1-4988-9893-a0437d5e6e9f', b'Motor 2'),
-            MotorCharacteristic('00fcd93b-0c3c-4940-aac1-b4c21fac3420', b'Motor 3'),
-            MotorCharacteristic('49aaeaa4-bb74-4f84-aa8f-acf46e5cf922', b'Motor 4'),
-            MotorCharacteristic('ceea8e45-5ff9-4325-be13-48cf40c0e0c3', b'Motor 5'),
-            MotorCharacteristic('8e4c474f-188e-4d2a-910a-cf66f674f569', b'Motor 6'),
+            MotorCharacteristic('4bdfb409-93cc-433a-83bd-7f4f8e7eaf54', b'Motor 1', notifications),
+            MotorCharacteristic('454885b9-c9d1-4988-9893-a0437d5e6e9f', b'Motor 2', notifications),
+            MotorCharacteristic('00fcd93b-0c3c-4940-aac1-b4c21fac3420', b'Motor 3', notifications),
+            MotorCharacteristic('49aaeaa4-bb74-4f84-aa8f-acf46e5cf922', b'Motor 4', notifications),
+            MotorCharacteristic('ceea8e45-5ff9-4325-be13-48cf40c0e0c3', b'Motor 5', notifications),
+            MotorCharacteristic('8e4c474f-188e-4d2a-910a-cf66f674f569', b'Motor 6', notifications),
         ]
 
+        self._telemetry_characteristic = TelemetryCharacteristic('b1fe5911-b4ad-48f8-b839-fcf77bd7b9ce', b'Telemetry',
+                                                                 notifications)
+
         super().__init__({
             'uuid':            'd2d5558c-5b9d-11e9-8647-d663bd873d93',
             'characteristics': [
                 MobileToBrainFunctionCharacteristic('7486bec3-bb6b-4abd-a9ca-20adc281a0a4', 20, 20, b'simpleControl',
                                                     self.simple_control_callback),
                 *self._sensor_characteristics,
-                *self._motor_characteristics
+                *self._motor_characteristics,
+                self._telemetry_characteristic
             ]
         })
 
     def register_message_handler(self, callback):
         self._message_handler = callback
 
+    def on_subscribed(self, callback):
+        """Register a callback that is called when the phone subscribes to a sensor, motor or telemetry value"""
+        for characteristic in [*self._sensor_characteristics, *self._motor_characteristics,
+                               self._telemetry_characteristic]:
+            characteristic.subscribed_callback = callback
+
     def simple_control_callback(self, data):
         # print(repr(data))
         # counter = data[0]
-        analog_values = data[1:11]
+        analog_values = bytes(data[1:11])
         button_values = self.extract_button_states(data[11:15])
 
-        self._message_handler(RemoteControllerCommand(analog=analog_values, buttons=button_values))
-        return True
+        command = RemoteControllerCommand(analog=analog_values, buttons=button_values)
+        return self._events.put(lambda: self._message_handler(command))
 
     def update_sensor(self, sensor, value):
         if 0 < sensor <= len(self._sensor_characteristics):
@@ -231,9 +268,13 @@ class LiveMessageService(BlenoPrimaryService):
             data = list(struct.pack(">flb", speed, position, power))
             self._motor_characteristics[motor - 1].update(data)
 
+    def update_telemetry(self, fields):
+        self._telemetry_characteristic.update_fields(fields)
+
     @staticmethod
     def extract_button_states(data):
-        return bits_to_bool_list(data)
+        """Button states as a bitmask, bit n is button n"""
+        return int.from_bytes(bytes(data), byteorder='little')
 # Device Information Service
 
 
@@ -284,14 +325,36 @@ class VersionCharacteristic(Characteristic):
         self._version = version.encode("utf-8")
 
 
+class ErrorSummaryCharacteristic(Characteristic):
+    """Number of stored MCU errors, see encode_error_summary"""
+
+    def __init__(self, uuid):
+        super().__init__({
+            'uuid':       uuid,
+            'properties': ['read'],
+            'value':      None
+        })
+        self._summary = b''
+
+    def onReadRequest(self, offset, callback):
+        if offset:
+            callback(Characteristic.RESULT_ATTR_NOT_LONG)
+        else:
+            callback(Characteristic.RESULT_SUCCESS, self._summary)
+
+    def update(self, summary):
+        self._summary = summary
+
+
 class SystemIdCharacteristic(Characteristic):
-    def __init__(self, system_id: Observable):
+    def __init__(self, system_id: Observable, events: EventQueue):
         super().__init__({
             'uuid':       '2A23',
             'properties': ['read', 'write'],
             'value':      None
         })
         self._system_id = system_id
+        self._events = events
 
     def onReadRequest(self, offset, callback):
         if offset:
@@ -304,21 +367,28 @@ class SystemIdCharacteristic(Characteristic):
             callback(Characteristic.RESULT_ATTR_NOT_LONG)
         else:
             try:
-                self._system_id.update(data.decode('utf-8'))
-                callback(Characteristic.RESULT_SUCCESS)
+                system_id = data.decode('utf-8')
             except UnicodeDecodeError:
                 callback(Characteristic.RESULT_UNLIKELY_ERROR)
+            else:
+                if not self._events.put(lambda: self._update(system_id, callback)):
+                    callback(Characteristic.RESULT_UNLIKELY_ERROR)
+
+    def _update(self, system_id, callback):
+        self._system_id.update(system_id)
+        callback(Characteristic.RESULT_SUCCESS)
 
 
 class RevvyDeviceInformationService(BleService):
-    def __init__(self, device_name: Observable, serial):
+    def __init__(self, device_name: Observable, serial, events: EventQueue):
         hw = VersionCharacteristic('2A27')
         fw = VersionCharacteristic('2A26')
         sw = VersionCharacteristic('2A28')
         serial = SerialNumberCharacteristic(serial)
         manufacturer_name = ManufacturerNameCharacteristic(b'RevolutionRobotics')
         model_number = ModelNumberCharacteristic(b'RevvyAlpha')
-        system_id = SystemIdCharacteristic(device_name)
+        system_id = SystemIdCharacteristic(device_name, events)
+        mcu_errors = ErrorSummaryCharacteristic('55b11797-06d4-4fbc-aec3-cbb83b2ec490')
 
         super().__init__('180A', {
             'hw_version': hw,
@@ -327,13 +397,14 @@ class RevvyDeviceInformationService(BleService):
             'serial_number': serial,
             'manufacturer_name': manufacturer_name,
             'model_number': model_number,
-            'system_id': system_id
+            'system_id': system_id,
+            'mcu_errors': mcu_errors
         })
 
 
 class CustomBatteryLevelCharacteristic(Characteristic):
     """Custom battery service that contains 2 characteristics"""
-    def __init__(self, uuid, description):
+    def __init__(self, uuid, description, notifications: NotificationScheduler):
         super().__init__({
             'uuid':        uuid,
             'properties':  ['read', 'notify'],
@@ -346,7 +417,8 @@ class CustomBatteryLevelCharacteristic(Characteristic):
             ]
         })
 
-        self._updateValueCallback = None
+        self._notifications = notifications
+        self._notification = notifications.create_slot(min_interval=1.0)
         self._value = 99  # initial value only
 
     def onReadRequest(self, offset, callback):
@@ -356,22 +428,24 @@ class CustomBatteryLevelCharacteristic(Characteristic):
             callback(Characteristic.RESULT_SUCCESS, [self._value])
 
     def onSubscribe(self, max_value_size, update_value_callback):
-        self._updateValueCallback = update_value_callback
+        self._notification.subscribe(max_value_size, update_value_callback)
 
     def onUnsubscribe(self):
-        self._updateValueCallback = None
+        self._notification.unsubscribe()
+
+    def onNotify(self):
+        self._notifications.notification_sent()
 
     def update_value(self, value):
         self._value = value
-
-        if self._updateValueCallback:
-            self._updateValueCallback([value])
+        self._notification.update([value])
 
 
 class CustomBatteryService(BleService):
-    def __init__(self):
-        main = CustomBatteryLevelCharacteristic('2A19', b'Main battery percentage')
-        motor = CustomBatteryLevelCharacteristic('00002a19-0000-1000-8000-00805f9b34fa', b'Motor battery percentage')
+    def __init__(self, notifications: NotificationScheduler):
+        main = CustomBatteryLevelCharacteristic('2A19', b'Main battery percentage', notifications)
+        motor = CustomBatteryLevelCharacteristic('00002a19-0000-1000-8000-00805f9b34fa', b'Motor battery percentage',
+                                                 notifications)
 
         super().__init__('180F', {
             'main_battery': main,
@@ -387,10 +461,13 @@ class RevvyBLE:
 
         device_name.subscribe(self._device_name_changed)
 
-        dis = RevvyDeviceInformationService(device_name, serial)
-        bas = CustomBatteryService()
-        live = LiveMessageService()
-        long = LongMessageService(long_message_handler)
+        self._events = create_ble_event_dispatcher()
+        self._notifications = NotificationScheduler()
+
+        dis = RevvyDeviceInformationService(device_name, serial, self._events['settings'])
+        bas = CustomBatteryService(self._notifications)
+        live = LiveMessageService(self._events['control'], self._notifications)
+        long = LongMessageService(long_message_handler, self._events['upload'])
 
         self._named_services = {
             'device_information_service': dis,
@@ -410,6 +487,10 @@ class RevvyBLE:
     def __getitem__(self, item):
         return self._named_services[item]
 
+    @property
+    def event_metrics(self):
+        return self._events.metrics
+
     def _device_name_changed(self, name):
         self._deviceName = name
         os.environ["BLENO_DEVICE_NAME"] = self._deviceName
@@ -444,8 +525,12 @@ class RevvyBLE:
         self._bleno.on('disconnect', lambda x: callback(False))
 
     def start(self):
+        self._events.start()
+        self._notifications.start()
         self._bleno.start()
 
     def stop(self):
         self._bleno.stopAdvertising()
         self._bleno.disconnect()
+        self._events.stop()
+        self._notifications.stop()
@@ -0,0 +1,145 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import time
+import traceback
+from collections import deque
+from threading import Condition
+
+from revvy.thread_wrapper import ThreadWrapper, ThreadContext
+
+
+class EventQueueMetrics:
+    def __init__(self):
+        self.enqueued = 0
+        self.handled = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self.blocked_time = 0.0
+
+    def as_dict(self):
+        return {
+            'enqueued': self.enqueued,
+            'handled': self.handled,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+            'max_depth': self.max_depth,
+            'blocked_time': self.blocked_time
+        }
+
+
+class EventQueue:
+    """
+    Bounded queue of events that are handled in order by a worker thread
+
+    Events are callables. When the queue is full, the policy decides what happens to a new event:
+     - drop_oldest: the oldest waiting event is discarded, the caller never waits
+     - block: the caller waits until there is space in the queue
+    Events that are put into a stopped queue are rejected.
+    """
+
+    drop_oldest = 'drop_oldest'
+    block = 'block'
+
+    def __init__(self, name, max_length, policy):
+        assert policy in (self.drop_oldest, self.block)
+        assert max_length > 0
+
+        self._name = name
+        self._max_length = max_length
+        self._policy = policy
+        self._events = deque()
+        self._changed = Condition()
+        self._stopped = False
+        self._metrics = EventQueueMetrics()
+        self._thread = ThreadWrapper(self._handle_events, name)
+
+    @property
+    def depth(self):
+        return len(self._events)
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    def put(self, event):
+        """Queue an event, return False if it was rejected"""
+        with self._changed:
+            if len(self._events) >= self._max_length:
+                if self._policy == self.drop_oldest:
+                    self._events.popleft()
+                    self._metrics.dropped += 1
+                else:
+                    start = time.perf_counter()
+                    self._changed.wait_for(lambda: self._stopped or len(self._events) < self._max_length)
+                    self._metrics.blocked_time += time.perf_counter() - start
+
+            if self._stopped:
+                self._metrics.rejected += 1
+                return False
+
+            self._events.append(event)
+            self._metrics.enqueued += 1
+            self._metrics.max_depth = max(self._metrics.max_depth, len(self._events))
+            self._changed.notify_all()
+
+        return True
+
+    def start(self):
+        return self._thread.start()
+
+    def stop(self):
+        """Stop handling events, the queue can't be restarted"""
+        with self._changed:
+            self._stopped = True
+            self._events.clear()
+            self._changed.notify_all()
+        self._thread.exit()
+
+    def _handle_events(self, ctx: ThreadContext):
+        while not ctx.stop_requested:
+            ctx.wait_for(self._changed, lambda: self._events)
+            with self._changed:
+                event = self._events.popleft()
+                self._changed.notify_all()
+
+            # noinspection PyBroadException
+            try:
+                event()
+            except Exception:
+                print('{}: event failed'.format(self._name))
+                print(traceback.format_exc())
+            finally:
+                self._metrics.handled += 1
+
+
+class EventDispatcher:
+    """Named event queues that decouple BLE callbacks from the robot code handling them"""
+
+    def __init__(self, queues: dict):
+        self._queues = queues
+
+    def __getitem__(self, item):
+        return self._queues[item]
+
+    @property
+    def metrics(self):
+        return {name: {'depth': queue.depth, **queue.metrics.as_dict()} for name, queue in self._queues.items()}
+
+    def start(self):
+        for queue in self._queues.values():
+            queue.start()
+
+    def stop(self):
+        for queue in self._queues.values():
+            queue.stop()
+
+
+def create_ble_event_dispatcher():
+    return EventDispatcher({
+        # only the latest controller messages are relevant, an old one is worth less than the BLE stack's time
+        'control':  EventQueue('BleControlEvents', max_length=2, policy=EventQueue.drop_oldest),
+        # uploads must not lose data, the phone waits for the write responses anyway
+        'upload':   EventQueue('BleUploadEvents', max_length=4, policy=EventQueue.block),
+        'settings': EventQueue('BleSettingsEvents', max_length=4, policy=EventQueue.block)
+    })
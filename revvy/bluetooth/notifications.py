@@ -0,0 +1,135 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import time
+import traceback
+from collections import deque
+from threading import Condition
+
+from revvy.thread_wrapper import ThreadWrapper, ThreadContext
+
+
+class NotificationSlot:
+    """
+    Notification state of a single characteristic
+
+    queue_length is the number of values that may wait to be sent. With the default of 1 only the latest value is sent,
+    longer queues are needed when consecutive values carry different data, like the parts of a split frame.
+    """
+
+    def __init__(self, scheduler, min_interval=0.0, queue_length=1):
+        self._scheduler = scheduler
+        self.min_interval = min_interval
+        self.next_send = 0.0
+        self.values = deque(maxlen=queue_length)
+        self.last_value = None
+        self.callback = None
+        self.max_value_size = 20
+
+    def subscribe(self, max_value_size, callback):
+        self._scheduler.subscribe(self, max_value_size, callback)
+
+    def unsubscribe(self):
+        self._scheduler.subscribe(self, self.max_value_size, None)
+
+    def update(self, value):
+        self._scheduler.update(self, value)
+
+
+class NotificationScheduler:
+    """
+    Sends characteristic notifications one by one from a background thread
+
+    Values that are equal to the previous one are skipped, and each characteristic is notified at most once every
+    min_interval seconds. At most max_outstanding notifications may be in flight: a slot is freed when the BLE stack
+    reports the notification as sent, or after send_timeout seconds if it never does. Values longer than the
+    subscriber's max_value_size are truncated.
+    """
+
+    def __init__(self, max_outstanding=1, send_timeout=0.02, name='BleNotificationThread'):
+        self._max_outstanding = max_outstanding
+        self._send_timeout = send_timeout
+        self._slots = []
+        self._next_slot = 0
+        self._outstanding = deque()
+        self._changed = Condition()
+        self._dirty = False
+        self._thread = ThreadWrapper(self._send_notifications, name)
+
+    def create_slot(self, min_interval=0.0, queue_length=1):
+        slot = NotificationSlot(self, min_interval, queue_length)
+        with self._changed:
+            self._slots.append(slot)
+        return slot
+
+    def subscribe(self, slot: NotificationSlot, max_value_size, callback):
+        with self._changed:
+            slot.callback = callback
+            slot.max_value_size = max_value_size
+            slot.values.clear()
+            slot.last_value = None
+
+    def update(self, slot: NotificationSlot, value):
+        with self._changed:
+            if slot.callback is None or value == slot.last_value:
+                return
+
+            slot.values.append(value)
+            slot.last_value = value
+            self._dirty = True
+            self._changed.notify_all()
+
+    def notification_sent(self):
+        with self._changed:
+            if self._outstanding:
+                self._outstanding.popleft()
+                self._dirty = True
+                self._changed.notify_all()
+
+    def start(self):
+        return self._thread.start()
+
+    def stop(self):
+        self._thread.exit()
+
+    def _take_next(self, now):
+        """Select the next value to send, or the time to wait before trying again"""
+        while self._outstanding and self._outstanding[0] + self._send_timeout <= now:
+            self._outstanding.popleft()
+
+        if len(self._outstanding) >= self._max_outstanding:
+            return None, None, self._outstanding[0] + self._send_timeout - now
+
+        wait_time = None
+        slot_count = len(self._slots)
+        for i in range(slot_count):
+            # round robin so that a frequently updated characteristic can't starve the others
+            slot = self._slots[(self._next_slot + i) % slot_count]
+            if not slot.values or slot.callback is None:
+                continue
+
+            if slot.next_send <= now:
+                self._next_slot = (self._next_slot + i + 1) % slot_count
+                slot.next_send = now + slot.min_interval
+                self._outstanding.append(now)
+                return slot.callback, slot.values.popleft()[:slot.max_value_size], None
+
+            remaining = slot.next_send - now
+            wait_time = remaining if wait_time is None else min(wait_time, remaining)
+
+        return None, None, wait_time
+
+    def _send_notifications(self, ctx: ThreadContext):
+        while not ctx.stop_requested:
+            with self._changed:
+                callback, value, wait_time = self._take_next(time.monotonic())
+                if callback is None:
+                    self._dirty = False
+
+            if callback is None:
+                ctx.wait_for(self._changed, lambda: self._dirty, wait_time)
+            else:
+                # noinspection PyBroadException
+                try:
+                    callback(value)
+                except Exception:
+                    print(traceback.format_exc())
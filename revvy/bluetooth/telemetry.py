@@ -0,0 +1,291 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import struct
+import time
+import traceback
+from threading import Condition
+
+from revvy.thread_wrapper import ThreadWrapper, ThreadContext
+
+
+class TelemetryChannel:
+    """
+    Rate limit and deadband settings of a single telemetry value
+
+    Values are tuples. deadband is either None, in which case every change is sent, or a tuple with a threshold for
+    each field. A field with a threshold of 0 is sent on any change.
+    """
+
+    def __init__(self, send, min_interval=0.1, deadband=None):
+        self.send = send
+        self.min_interval = min_interval
+        self.deadband = deadband
+
+        self.pending = None
+        self.last_sent = None
+        self.next_send = 0.0
+
+    def is_significant(self, value):
+        """
+        >>> channel = TelemetryChannel(print, deadband=(0, 5))
+        >>> channel.last_sent = (1, 100)
+        >>> channel.is_significant((1, 104))
+        False
+        >>> channel.is_significant((2, 100))
+        True
+        """
+        if self.last_sent is None:
+            return True
+
+        if self.deadband is None:
+            return value != self.last_sent
+
+        for new, old, threshold in zip(value, self.last_sent, self.deadband):
+            if abs(new - old) > threshold if threshold else new != old:
+                return True
+
+        return False
+
+    def resend(self):
+        """Send the last value again, unless a newer one is already waiting"""
+        if self.pending is None:
+            self.pending = self.last_sent
+        self.last_sent = None
+
+
+telemetry_frame_version = 1
+telemetry_frame_header = struct.Struct('<BH')  # version, bitmap of the included fields
+telemetry_frame_max_fields = 16
+
+
+def encode_telemetry_frames(fields, max_size=20):
+    """
+    Pack field payloads into versioned frames of at most max_size bytes
+
+    fields maps field indexes to encoded payloads. Fields are placed in index order, a new frame is started when the
+    next one does not fit. Every frame starts with the version and the bitmap of the fields it contains.
+
+    >>> encode_telemetry_frames({0: b'ab', 3: b'c'})
+    [b'\\x01\\t\\x00abc']
+    >>> encode_telemetry_frames({0: b'ab', 3: b'c'}, max_size=5)
+    [b'\\x01\\x01\\x00ab', b'\\x01\\x08\\x00c']
+    """
+    frames = []
+    bitmap = 0
+    payload = b''
+    for index in sorted(fields):
+        data = fields[index]
+        if payload and telemetry_frame_header.size + len(payload) + len(data) > max_size:
+            frames.append(telemetry_frame_header.pack(telemetry_frame_version, bitmap) + payload)
+            bitmap = 0
+            payload = b''
+
+        bitmap |= 1 << index
+        payload += data
+
+    if payload:
+        frames.append(telemetry_frame_header.pack(telemetry_frame_version, bitmap) + payload)
+
+    return frames
+
+
+motor_telemetry = struct.Struct('<flb')  # speed, position, power
+
+
+def encode_motor_telemetry(value):
+    """
+    >>> encode_motor_telemetry((20, 1.5, -100))
+    b'\\x00\\x00\\xc0?\\x9c\\xff\\xff\\xff\\x14'
+    """
+    (power, speed, position) = value
+    return motor_telemetry.pack(speed, position, power)
+
+
+def encode_sensor_telemetry(value):
+    """
+    >>> encode_sensor_telemetry((1, 2))
+    b'\\x02\\x01\\x02'
+    """
+    return bytes([len(value), *value])
+
+
+def encode_imu_telemetry(value):
+    """Yaw angle and relative yaw angle"""
+    return struct.pack('<ll', *value)
+
+
+class TelemetryFrame:
+    """
+    Collects the changed values of several channels so that they can be sent together in one notification
+
+    send is called with a dict that maps field indexes to the encoded payloads of the changed fields. Values are
+    encoded on the sending thread, a value that can't be encoded is dropped without affecting the other fields.
+    """
+
+    def __init__(self, send, min_interval=0.02):
+        self.send = send
+        self.min_interval = min_interval
+        self.next_send = 0.0
+        self._fields = {}
+
+    def add_field(self, key, encode, deadband=None):
+        index = len(self._fields)
+        assert index < telemetry_frame_max_fields
+        self._fields[key] = (index, encode, TelemetryChannel(None, deadband=deadband))
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    @property
+    def pending(self):
+        return any(channel.pending is not None for _, _, channel in self._fields.values())
+
+    def update(self, key, value):
+        _, _, channel = self._fields[key]
+        if channel.is_significant(value):
+            channel.pending = value
+            return True
+        else:
+            channel.pending = None
+            return False
+
+    def take(self):
+        """Return the changed values, they are only encoded in send_values() so that encoding can't fail here"""
+        values = {}
+        for index, encode, channel in self._fields.values():
+            if channel.pending is not None:
+                values[index] = (encode, channel.pending)
+                channel.last_sent = channel.pending
+                channel.pending = None
+
+        return values
+
+    def send_values(self, values):
+        """Encode the values returned by take() and send them, fields that can't be encoded are left out"""
+        fields = {}
+        for index, (encode, value) in values.items():
+            try:
+                fields[index] = encode(value)
+            except (struct.error, ValueError):
+                print('Telemetry field {} can not be encoded: {}'.format(index, value))
+
+        if fields:
+            self.send(fields)
+
+    def reset(self):
+        for _, _, channel in self._fields.values():
+            channel.resend()
+
+
+class TelemetryPublisher:
+    """
+    Collects live values and sends them from a background thread
+
+    publish() only stores the latest value of a channel, so a fast producer never waits for the notification to be
+    sent. Values that are within the deadband of the last sent value are dropped, and each channel is sent at most
+    once every min_interval seconds.
+
+    Frames receive the values of their fields in addition to the channels, a key does not need a channel to be
+    published into a frame.
+    """
+
+    def __init__(self, name='TelemetryThread'):
+        self._channels = {}
+        self._frames = []
+        self._changed = Condition()
+        self._dirty = False
+        self._thread = ThreadWrapper(self._send_pending, name)
+
+    def add_channel(self, key, send, min_interval=0.1, deadband=None):
+        with self._changed:
+            self._channels[key] = TelemetryChannel(send, min_interval, deadband)
+
+    def add_frame(self, frame: TelemetryFrame):
+        with self._changed:
+            self._frames.append(frame)
+
+    def publish(self, key, value):
+        value = tuple(value)
+        with self._changed:
+            changed = False
+            channel = self._channels.get(key)
+            if channel:
+                if channel.is_significant(value):
+                    channel.pending = value
+                    changed = True
+                else:
+                    # the value went back near the last sent one, the pending update is no longer needed
+                    channel.pending = None
+
+            for frame in self._frames:
+                if key in frame:
+                    changed |= frame.update(key, value)
+
+            if changed:
+                self._dirty = True
+                self._changed.notify()
+
+    def reset(self):
+        """Send the last values again, e.g. to a new subscriber that has not received them yet"""
+        with self._changed:
+            for channel in self._channels.values():
+                channel.resend()
+                channel.next_send = 0.0
+            for frame in self._frames:
+                frame.reset()
+                frame.next_send = 0.0
+
+            self._dirty = True
+            self._changed.notify()
+
+    def start(self):
+        return self._thread.start()
+
+    def stop(self):
+        self._thread.exit()
+
+    def _take_due(self, now):
+        """Collect the pending values that can be sent now, and the time until the next one becomes due"""
+        due = []
+        wait_time = None
+        for channel in self._channels.values():
+            if channel.pending is None:
+                continue
+
+            if channel.next_send <= now:
+                due.append((channel.send, channel.pending))
+                channel.last_sent = channel.pending
+                channel.next_send = now + channel.min_interval
+                channel.pending = None
+            else:
+                remaining = channel.next_send - now
+                wait_time = remaining if wait_time is None else min(wait_time, remaining)
+
+        for frame in self._frames:
+            if not frame.pending:
+                continue
+
+            if frame.next_send <= now:
+                due.append((frame.send_values, frame.take()))
+                frame.next_send = now + frame.min_interval
+            else:
+                remaining = frame.next_send - now
+                wait_time = remaining if wait_time is None else min(wait_time, remaining)
+
+        self._dirty = False
+        return due, wait_time
+
+    def _send_pending(self, ctx: ThreadContext):
+        while not ctx.stop_requested:
+            with self._changed:
+                due, wait_time = self._take_due(time.monotonic())
+
+            for send, value in due:
+                # noinspection PyBroadException
+                try:
+                    send(value)
+                except Exception:
+                    print(traceback.format_exc())
+
+            if not due:
+                ctx.wait_for(self._changed, lambda: self._dirty, wait_time)
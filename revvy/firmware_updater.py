@@ -3,23 +3,99 @@
 import binascii
 import json
 import os
+import struct
 import time
 import traceback
 from json import JSONDecodeError
 
-from revvy.file_storage import IntegrityError
-from revvy.version import Version
-from revvy.functions import split, bytestr_hash
+from revvy.file_storage import IntegrityError, StorageInterface, StorageError
+from revvy.version import Version, FormatError
+from revvy.functions import bytestr_hash
+from revvy.mcu.commands import CommandStatusError
 from revvy.mcu.rrrc_control import BootloaderControl, RevvyControl
 
 op_mode_application = 0xAA
 op_mode_bootloader = 0xBB
 
+patch_magic = b'RFWP'
+patch_header = struct.Struct('<4sL')  # magic, length of the patched image
+patch_block_header = struct.Struct('<LL')  # offset, length
+
+
+def create_firmware_patch(base, target, block_size=256):
+    """
+    Create a block-level patch that transforms the base image into the target image
+
+    >>> patch = create_firmware_patch(b'aaaabbbbcccc', b'aaaaBBBBcccc', block_size=4)
+    >>> len(patch) == patch_header.size + patch_block_header.size + 4
+    True
+    >>> apply_firmware_patch(b'aaaabbbbcccc', patch)
+    b'aaaaBBBBcccc'
+    """
+    blocks = []
+    start = None
+    for offset in range(0, len(target), block_size):
+        changed = target[offset:offset + block_size] != base[offset:offset + block_size]
+        if changed and start is None:
+            start = offset
+        elif not changed and start is not None:
+            blocks.append((start, offset))
+            start = None
+    if start is not None:
+        blocks.append((start, len(target)))
+
+    patch = bytearray(patch_header.pack(patch_magic, len(target)))
+    for (start, end) in blocks:
+        patch += patch_block_header.pack(start, end - start)
+        patch += target[start:end]
+
+    return bytes(patch)
+
+
+def apply_firmware_patch(base, patch):
+    """
+    Apply a patch created by create_firmware_patch to the base image
+
+    >>> apply_firmware_patch(b'abcd', create_firmware_patch(b'abcd', b'abcdef'))
+    b'abcdef'
+    >>> apply_firmware_patch(b'abcdef', create_firmware_patch(b'abcdef', b'abc'))
+    b'abc'
+    """
+    (magic, length) = patch_header.unpack_from(patch, 0)
+    if magic != patch_magic:
+        raise IntegrityError('Invalid firmware patch')
+
+    image = bytearray(base[:length])
+    image += b'\xFF' * (length - len(image))  # erased flash
+
+    idx = patch_header.size
+    while idx < len(patch):
+        (offset, block_length) = patch_block_header.unpack_from(patch, idx)
+        idx += patch_block_header.size
+        block = patch[idx:idx + block_length]
+        if len(block) != block_length or offset + block_length > length:
+            raise IntegrityError('Invalid firmware patch block')
+        image[offset:offset + block_length] = block
+        idx += block_length
+
+    return bytes(image)
+
 
 class McuUpdater:
+    max_chunk_size = 255  # limited by the payload size of a single command
+    min_chunk_size = 32
+    chunk_grow_threshold = 16  # successful writes needed before the chunk size is increased again
+    max_chunk_errors = 10  # rejected chunks tolerated in a single transfer
+    max_transfer_attempts = 3
+
     def __init__(self, robot_control: RevvyControl, bootloader_control: BootloaderControl):
         self._robot = robot_control
         self._bootloader = bootloader_control
+        self._progress_callback = lambda sent, total: None
+
+    def on_progress(self, callback):
+        """Register a function that is called with (sent bytes, total bytes) after each acknowledged chunk"""
+        self._progress_callback = callback
 
     def _read_operation_mode(self):
         # TODO: implement timeout in case MCU has no bootloader and firmware
@@ -63,6 +139,16 @@ class McuUpdater:
         else:
             return self._bootloader.get_hardware_version()
 
+    def read_firmware_version(self):
+        """
+        Read the version of the running firmware, or None if the MCU is in bootloader mode
+        """
+        mode = self._read_operation_mode()
+        if mode == op_mode_application:
+            return self._robot.get_firmware_version()
+        else:
+            return None
+
     def is_update_needed(self, fw_version: Version):
         """
         Compare firmware version to the currently running one
@@ -88,30 +174,83 @@ class McuUpdater:
             mode = self._read_operation_mode()
             assert mode == op_mode_bootloader
 
+    def _send_image(self, data):
+        """
+        Send the firmware image to the bootloader
+
+        Chunks are written back-to-back and only the bootloader's answer decides how to continue: a rejected chunk
+        is resent from the last acknowledged offset using a smaller chunk size, and the chunk size is grown back
+        after a run of accepted writes.
+        """
+        total = len(data)
+        image = memoryview(data)
+
+        offset = 0
+        chunk_size = self.max_chunk_size
+        accepted = 0
+        errors = 0
+
+        self._progress_callback(0, total)
+        while offset < total:
+            chunk = image[offset:offset + chunk_size]
+            try:
+                self._bootloader.send_firmware(chunk)
+            except CommandStatusError:
+                # the bootloader answered with an error status, so the chunk was not written
+                errors += 1
+                if errors > self.max_chunk_errors:
+                    raise
+                accepted = 0
+                chunk_size = max(self.min_chunk_size, chunk_size // 2)
+                print('Chunk at offset {} rejected, resending with chunk size {}'.format(offset, chunk_size))
+                continue
+
+            offset += len(chunk)
+            accepted += 1
+            if accepted >= self.chunk_grow_threshold and chunk_size < self.max_chunk_size:
+                accepted = 0
+                chunk_size = min(self.max_chunk_size, chunk_size * 2)
+
+            self._progress_callback(offset, total)
+
+    def _transfer_image(self, data):
+        checksum = binascii.crc32(data)
+        print("Image info: size: {} checksum: {}".format(len(data), checksum))
+
+        # init update
+        print("Initializing update")
+        self._bootloader.send_init_update(len(data), checksum)
+
+        # send data
+        print('Sending data')
+        start = time.time()
+        self._send_image(data)
+        duration = time.time() - start
+        speed = int(len(data) / max(duration, 0.001))
+        print('Data transfer took {} seconds ({} bytes/s)'.format(round(duration, 1), speed))
+
     def update_firmware(self, new_version: Version, data):
         """
         Compare firmware version and burn it in case the version differs
+
+        A transport error leaves the bootloader in an unknown state (the last chunk may or may not have been written)
+        so in that case the transfer is restarted from the beginning.
         """
 
         if self.is_update_needed(new_version):
             self.reboot_to_bootloader()
 
-            checksum = binascii.crc32(data)
-            print("Image info: size: {} checksum: {}".format(len(data), checksum))
-
-            # init update
-            print("Initializing update")
-            self._bootloader.send_init_update(len(data), checksum)
-
-            # split data into chunks
-            chunks = split(data, chunk_size=255)
-
-            # send data
-            print('Sending data')
-            start = time.time()
-            for chunk in chunks:
-                self._bootloader.send_firmware(chunk)
-            print('Data transfer took {} seconds'.format(round(time.time() - start, 1)))
+            attempt = 1
+            while True:
+                try:
+                    self._transfer_image(data)
+                    break
+                except OSError:
+                    if attempt >= self.max_transfer_attempts:
+                        raise
+                    attempt += 1
+                    print('Firmware transfer failed, restarting (attempt {})'.format(attempt))
+                    traceback.print_exc()
 
             self._finalize_update()
 
@@ -120,9 +259,34 @@ class McuUpdater:
 
 
 class McuUpdateManager:
-    def __init__(self, fw_dir, updater):
+    """
+    Keeps the MCU firmware up to date
+
+    When a storage is given, a copy of the image running on the MCU is kept there. Patches listed in the catalog
+    are applied to this copy, so a firmware package only needs to ship the changed blocks relative to the firmware
+    it replaces. The full image is used when no patch matches the stored copy.
+    """
+
+    def __init__(self, fw_dir, updater, storage: StorageInterface = None):
         self._fw_dir = fw_dir
         self._updater = updater
+        self._storage = storage
+        self._image_name = 'mcu-firmware'
+
+    def _read_patches(self, patches):
+        result = []
+        for patch in patches:
+            try:
+                result.append({
+                    'base_version': Version(patch['base_version']),
+                    'base_crc': patch['base_crc'],
+                    'file': os.path.join(self._fw_dir, patch['filename']),
+                    'md5': patch['md5'],
+                    'length': patch['length'],
+                })
+            except KeyError:
+                print('Ignoring invalid firmware patch entry: {}'.format(patch))
+        return result
 
     def _read_catalog(self):
         try:
@@ -135,26 +299,88 @@ class McuUpdateManager:
                 'file': os.path.join(self._fw_dir, fw_metadata[version]['filename']),
                 'md5': fw_metadata[version]['md5'],
                 'length': fw_metadata[version]['length'],
+                'patches': self._read_patches(fw_metadata[version].get('patches', [])),
             } for version in fw_metadata}
 
         except (IOError, JSONDecodeError, KeyError):
             return {}
 
     @staticmethod
-    def _read_firmware(fw_data):
-        with open(fw_data['file'], "rb") as f:
-            firmware_binary = f.read()
+    def _read_file(file_data):
+        with open(file_data['file'], "rb") as f:
+            data = f.read()
 
-        if len(firmware_binary) != fw_data['length']:
-            print('Firmware file length check failed, aborting')
-            raise IntegrityError("Firmware file length does not match")
+        if len(data) != file_data['length']:
+            raise IntegrityError("File length does not match")
 
-        checksum = bytestr_hash(firmware_binary)
-        if checksum != fw_data['md5']:
+        if bytestr_hash(data) != file_data['md5']:
+            raise IntegrityError("File checksum does not match")
+
+        return data
+
+    @staticmethod
+    def _read_firmware(fw_data):
+        try:
+            return McuUpdateManager._read_file(fw_data)
+        except IntegrityError:
             print('Firmware file integrity check failed, aborting')
-            raise IntegrityError("Firmware file checksum does not match")
+            raise
 
-        return firmware_binary
+    def _read_stored_version(self):
+        """Return the version of the stored copy of the flashed image, or None"""
+        if self._storage is None:
+            return None
+
+        # FileStorage only converts a missing file to StorageError, a corrupt metadata file raises JSONDecodeError
+        try:
+            return Version(self._storage.read_metadata(self._image_name)['version'])
+        except (StorageError, JSONDecodeError, KeyError, FormatError):
+            return None
+
+    def _read_stored_image(self):
+        try:
+            return self._storage.read(self._image_name)
+        except (StorageError, JSONDecodeError):
+            return None
+
+    def _store_image(self, version, image):
+        if self._storage is not None:
+            print('Storing firmware image {}'.format(version))
+            self._storage.write(self._image_name, image, metadata={'version': str(version)})
+
+    def _patch_firmware(self, fw_data, current_version, base_image):
+        """Build the new firmware image from the stored copy of the current one, or return None"""
+        for patch in fw_data['patches']:
+            if patch['base_version'] != current_version or patch['base_crc'] != binascii.crc32(base_image):
+                continue
+
+            try:
+                image = apply_firmware_patch(base_image, self._read_file(patch))
+            except (IOError, IntegrityError, struct.error):
+                print('Firmware patch {} could not be applied'.format(patch['file']))
+                continue
+
+            if len(image) == fw_data['length'] and bytestr_hash(image) == fw_data['md5']:
+                print('Using firmware patch {}'.format(patch['file']))
+                return image
+
+            print('Firmware patch {} produced an invalid image'.format(patch['file']))
+
+        return None
+
+    def _select_image(self, fw_data):
+        current_version = self._updater.read_firmware_version()
+        stored_version = self._read_stored_version()
+
+        if current_version is not None and stored_version is not None:
+            if current_version != fw_data['version'] and stored_version == current_version:
+                stored_image = self._read_stored_image()
+                if stored_image is not None:
+                    image = self._patch_firmware(fw_data, current_version, stored_image)
+                    if image is not None:
+                        return image
+
+        return self._read_firmware(fw_data)
 
     def update_if_necessary(self):
         hw_version = self._updater.read_hardware_version()
@@ -163,9 +389,14 @@ class McuUpdateManager:
 
         try:
             fw_data = firmware_collection[hw_version]
-            firmware_binary = self._read_firmware(fw_data)
+            firmware_binary = self._select_image(fw_data)
             self._updater.update_firmware(fw_data['version'], firmware_binary)
 
+            # keep a copy of the running image as the base of future patches
+            stored_version = self._read_stored_version()
+            if stored_version is None or stored_version != fw_data['version']:
+                self._store_image(fw_data['version'], firmware_binary)
+
         except KeyError:
             traceback.format_exc()
             print('No firmware for the hardware ({})'.format(hw_version))
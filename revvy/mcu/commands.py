@@ -13,6 +13,11 @@ class UnknownCommandError(Exception):
     pass
 
 
+class CommandStatusError(ValueError):
+    """The MCU answered a command with an error status"""
+    pass
+
+
 class Command:
     """A generic command towards the MCU"""
     def __init__(self, transport: RevvyTransport):
@@ -33,7 +38,7 @@ class Command:
             except KeyError:
                 status = 'Unknown status (code {})'.format(response.status)
 
-            raise ValueError('Command status: {} payload: {}'.format(status, repr(response.payload)))
+            raise CommandStatusError('Command status: {} payload: {}'.format(status, repr(response.payload)))
 
     def _send(self, payload=None):
         """Send the command with the given payload and process the response"""
@@ -0,0 +1,328 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import enum
+import hashlib
+import json
+import os
+import struct
+from collections import namedtuple, defaultdict, deque
+from json import JSONDecodeError
+
+from revvy.file_storage import StorageInterface, StorageError
+from revvy.mcu.rrrc_control import RevvyControl
+
+
+class ErrorType(enum.IntEnum):
+    HardFault = 0
+    StackOverflow = 1
+    AssertFailure = 2
+    TestError = 3
+    ImuError = 4
+
+
+hw_formats = {
+    0: '1.0.0',
+    1: '1.0.1',
+    2: '2.0.0'
+}
+
+fw_formats = {
+    0: '0.1.{}',
+    1: '0.1.{}',
+    2: '0.2.{}'
+}
+
+ErrorRecord = namedtuple('ErrorRecord', ['error_id', 'hw', 'fw', 'data'])
+
+
+def parse_error_record(raw):
+    """
+    >>> parse_error_record(bytes([3, 2, 0, 0, 0, 5, 0, 0, 0, 1, 2]))
+    ErrorRecord(error_id=3, hw=2, fw=5, data=b'\\x01\\x02')
+    """
+    raw = bytes(raw)
+    (error_id, hw, fw) = struct.unpack_from('<BLL', raw)
+    return ErrorRecord(error_id, hw, fw, raw[9:])
+
+
+def hw_version_string(record: ErrorRecord):
+    return hw_formats.get(record.hw)
+
+
+def fw_version_string(record: ErrorRecord):
+    """
+    >>> fw_version_string(ErrorRecord(0, 2, 5, b''))
+    '0.2.5'
+    >>> fw_version_string(ErrorRecord(0, 7, 5, b'')) is None
+    True
+    """
+    fw_format = fw_formats.get(record.hw)
+    return fw_format.format(record.fw) if fw_format else None
+
+
+def error_address(record: ErrorRecord):
+    """The program counter of a hard fault, None for other errors"""
+    if record.error_id == ErrorType.HardFault and len(record.data) >= 4:
+        return int.from_bytes(record.data[0:4], byteorder='little')
+    return None
+
+
+def read_error_records(control: RevvyControl, start=0):
+    """
+    Read the error memory of the MCU, starting at the given index
+
+    Records are yielded as (index, raw record) pairs as soon as their page is received.
+    """
+    error_count = control.error_memory_read_count()
+
+    index = start
+    while index < error_count:
+        records = control.error_memory_read_errors(index)
+        if not records:
+            break
+
+        for record in records:
+            yield index, bytes(record)
+            index += 1
+
+
+class ErrorLog:
+    """
+    Append-only file of error records collected from many robots
+
+    Each entry stores the source (e.g. the robot's serial number) and the raw record. An entry is only written once:
+    records are deduplicated by the hash of their source and contents. The records are indexed by error type,
+    firmware version and address when the log is opened, so queries don't need to parse every entry.
+
+    A partially written entry at the end of the file (e.g. after a power loss) is dropped.
+    """
+
+    magic = b'REL1'
+    entry_header = struct.Struct('<BB')  # source length, record length
+
+    def __init__(self, path):
+        self._path = path
+        self._entries = []
+        self._hashes = set()
+        self._by_type = defaultdict(list)
+        self._by_fw = defaultdict(list)
+        self._by_address = defaultdict(list)
+        self._by_source = defaultdict(list)
+
+        valid_length = self._load()
+        if valid_length is not None and valid_length != os.path.getsize(path):
+            print('ErrorLog: dropping incomplete entry at the end of {}'.format(path))
+            os.truncate(path, valid_length)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _hash(source, raw):
+        return hashlib.blake2b(source.encode('utf-8') + b'\0' + raw, digest_size=8).digest()
+
+    def _load(self):
+        try:
+            with open(self._path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        if not data:
+            return None
+
+        if data[0:len(self.magic)] != self.magic:
+            raise ValueError('{} is not an error log'.format(self._path))
+
+        offset = len(self.magic)
+        while offset + self.entry_header.size <= len(data):
+            (source_length, record_length) = self.entry_header.unpack_from(data, offset)
+            end = offset + self.entry_header.size + source_length + record_length
+            if end > len(data):
+                break
+
+            source_start = offset + self.entry_header.size
+            source = data[source_start:source_start + source_length].decode('utf-8')
+            raw = data[source_start + source_length:end]
+            self._index(source, raw)
+            offset = end
+
+        return offset
+
+    def _index(self, source, raw):
+        record = parse_error_record(raw)
+        idx = len(self._entries)
+
+        self._entries.append((source, record))
+        self._hashes.add(self._hash(source, raw))
+        self._by_type[record.error_id].append(idx)
+        self._by_fw[fw_version_string(record)].append(idx)
+        self._by_address[error_address(record)].append(idx)
+        self._by_source[source].append(idx)
+
+    def append(self, source, records):
+        """Add the raw records of source to the log, return the number of new records"""
+        encoded_source = source.encode('utf-8')
+        new_entries = []
+        for raw in records:
+            raw = bytes(raw)
+            entry_hash = self._hash(source, raw)
+            if entry_hash not in self._hashes:
+                new_entries.append(self.entry_header.pack(len(encoded_source), len(raw)) + encoded_source + raw)
+                self._index(source, raw)
+
+        if new_entries:
+            is_new_file = not os.path.isfile(self._path) or os.path.getsize(self._path) == 0
+            with open(self._path, 'ab') as f:
+                if is_new_file:
+                    f.write(self.magic)
+                f.write(b''.join(new_entries))
+
+        return len(new_entries)
+
+    def query(self, error_type=None, fw_version=None, address=None, source=None):
+        """Return the (source, ErrorRecord) entries that match every given filter, in the order they were added"""
+        filters = [
+            (self._by_type, error_type),
+            (self._by_fw, fw_version),
+            (self._by_address, address),
+            (self._by_source, source)
+        ]
+
+        selected = None
+        for index, key in filters:
+            if key is not None:
+                matches = set(index.get(key, []))
+                selected = matches if selected is None else selected & matches
+
+        if selected is None:
+            return list(self._entries)
+
+        return [self._entries[idx] for idx in sorted(selected)]
+
+
+def encode_error_summary(total, counts):
+    """
+    Number of records in total and of each known error type, as little endian 16 bit numbers
+
+    >>> encode_error_summary(2, [1, 0, 0, 1, 0])
+    b'\\x02\\x00\\x01\\x00\\x00\\x00\\x00\\x00\\x01\\x00\\x00\\x00'
+    """
+    return struct.pack('<{}H'.format(1 + len(counts)), *(min(count, 0xFFFF) for count in [total, *counts]))
+
+
+def _encode_records(records):
+    return b''.join(bytes([len(record)]) + record for record in records)
+
+
+def _decode_records(data):
+    records = []
+    offset = 0
+    while offset < len(data):
+        length = data[offset]
+        records.append(bytes(data[offset + 1:offset + 1 + length]))
+        offset += 1 + length
+
+    return records
+
+
+class ErrorHarvester:
+    """
+    Copies new records from the MCU error memory into storage, one page per step
+
+    Every page is written into a new segment. Segments are reused in a ring of max_segments, so only the most recent
+    records are kept and a step never rewrites the older ones. The state file holds the index of the next record to
+    read, the next segment and the number of records of each error type, so records are only read and counted once,
+    even after a restart. If the error memory holds fewer records than the cursor, it was cleared and reading starts
+    over. Identical records are all counted, a fault that happens again is counted again.
+    """
+
+    state_file = 'mcu-errors-state'
+    segment_file = 'mcu-errors-{}'
+    max_segments = 16
+
+    def __init__(self, control: RevvyControl, storage: StorageInterface):
+        self._control = control
+        self._storage = storage
+
+        self._cursor = 0
+        self._next_segment = 0
+        self._total = 0
+        self._counts = [0] * len(ErrorType)
+        self._read_state()
+
+        self._segments = deque(self._read_segments(), maxlen=self.max_segments)
+
+    @property
+    def records(self):
+        """The most recent records, at most the ones in max_segments pages"""
+        return [parse_error_record(raw) for segment in self._segments for raw in segment]
+
+    @property
+    def record_count(self):
+        """Number of records harvested so far, including the ones that are no longer stored"""
+        return self._total
+
+    @property
+    def error_counts(self):
+        """Number of records harvested so far of each ErrorType"""
+        return tuple(self._counts)
+
+    def _read_state(self):
+        try:
+            state = json.loads(self._storage.read(self.state_file).decode())
+            counts = [int(count) for count in state['counts']]
+            if len(counts) == len(self._counts):
+                self._cursor = int(state['cursor'])
+                self._next_segment = int(state['next_segment'])
+                self._total = int(state['total'])
+                self._counts = counts
+        except (StorageError, UnicodeDecodeError, ValueError, KeyError, TypeError):
+            pass
+
+    def _write_state(self):
+        state = {
+            'cursor': self._cursor,
+            'next_segment': self._next_segment,
+            'total': self._total,
+            'counts': self._counts
+        }
+        self._storage.write(self.state_file, json.dumps(state).encode())
+
+    def _read_segments(self):
+        segments = []
+        for index in range(max(0, self._next_segment - self.max_segments), self._next_segment):
+            name = self.segment_file.format(index % self.max_segments)
+            try:
+                segments.append(_decode_records(self._storage.read(name)))
+            except (StorageError, JSONDecodeError):
+                pass
+
+        return segments
+
+    def step(self):
+        """Read a page of new records, return True if there are more to read"""
+        error_count = self._control.error_memory_read_count()
+        if error_count < self._cursor:
+            self._cursor = 0
+
+        if error_count == self._cursor:
+            return False
+
+        page = [bytes(record) for record in self._control.error_memory_read_errors(self._cursor)]
+        if not page:
+            return False
+
+        # the state is written after the segment, a page that is read again after a crash overwrites the same segment
+        self._storage.write(self.segment_file.format(self._next_segment % self.max_segments), _encode_records(page))
+        self._segments.append(page)
+
+        for record in page:
+            if record[0] < len(self._counts):
+                self._counts[record[0]] += 1
+        self._total += len(page)
+        self._cursor += len(page)
+        self._next_segment += 1
+        self._write_state()
+
+        return self._cursor < error_count
@@ -15,6 +15,8 @@ class BootloaderControl:
 
 class RevvyControl:
     def __init__(self, transport: RevvyTransport):
+        self._transport = transport
+
         self.ping = PingCommand(transport)
 
         self.set_master_status = SetMasterStatusCommand(transport)
@@ -55,3 +57,8 @@ class RevvyControl:
         self.error_memory_read_errors = ErrorMemory_ReadErrors(transport)
         self.error_memory_clear = ErrorMemory_Clear(transport)
         self.error_memory_test = ErrorMemory_TestError(transport)
+
+    @property
+    def is_busy(self):
+        """True if other commands are being sent or are waiting to be sent"""
+        return self._transport.pending_commands > 0
@@ -174,9 +174,25 @@ class RevvyTransport:
         self.timeout = 5  # [seconds] how long the slave is allowed to respond with "busy"
         self._transport = transport
         self._mutex = Lock()
+        self._pending_lock = Lock()
+        self._pending = 0
+
+    @property
+    def pending_commands(self):
+        """Number of commands that are being sent or are waiting for the transport"""
+        return self._pending
 
     def send_command(self, command, payload=bytes()) -> Response:
         """Send a command and get the result."""
+        with self._pending_lock:
+            self._pending += 1
+        try:
+            return self._send_command_locked(command, payload)
+        finally:
+            with self._pending_lock:
+                self._pending -= 1
+
+    def _send_command_locked(self, command, payload):
         with self._mutex:
             # once a command gets through and a valid response is read, this loop will exit
             while True:  # assume that integrity error is random and not caused by implementation differences
@@ -0,0 +1,144 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import struct
+import time
+from threading import Lock
+
+from revvy.mcu.rrrc_transport import Response, ResponseHeader
+from revvy.robot.remote_controller import RemoteControllerCommand
+
+log_magic = b'RCL1'
+
+# arrival time relative to the first message, button mask, number of analog channels
+record_header = struct.Struct('<dIB')
+
+
+class ControllerRecorder:
+    """
+    Write received controller messages with their arrival time into a binary log file
+
+    The file is flushed at most every flush_interval seconds, so a crash only loses the last few messages.
+    """
+
+    def __init__(self, file, flush_interval=1.0):
+        self._file = file
+        self._flush_interval = flush_interval
+        self._start = None
+        self._next_flush = 0
+        self._lock = Lock()
+
+        file.write(log_magic)
+
+    def record(self, message: RemoteControllerCommand):
+        now = time.perf_counter()
+        analog = bytes(message.analog)
+        with self._lock:
+            if self._file is None:
+                return
+
+            if self._start is None:
+                self._start = now
+            self._file.write(record_header.pack(now - self._start, message.buttons, len(analog)) + analog)
+
+            if now >= self._next_flush:
+                self._next_flush = now + self._flush_interval
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_controller_log(file):
+    """
+    Read a log written by ControllerRecorder
+
+    :return: list of (timestamp, RemoteControllerCommand) tuples
+    """
+    if file.read(len(log_magic)) != log_magic:
+        raise ValueError('Not a controller log')
+
+    records = []
+    while True:
+        header = file.read(record_header.size)
+        if not header:
+            return records
+
+        if len(header) != record_header.size:
+            raise ValueError('Truncated record header')
+
+        (timestamp, buttons, analog_count) = record_header.unpack(header)
+        analog = file.read(analog_count)
+        if len(analog) != analog_count:
+            raise ValueError('Truncated analog data')
+
+        records.append((timestamp, RemoteControllerCommand(analog=analog, buttons=buttons)))
+
+
+class SimulatedTransport:
+    """RevvyTransport replacement that accepts every command and records when it was sent"""
+
+    def __init__(self, response_time=0.0):
+        self._response_time = response_time
+        self._lock = Lock()
+        self.commands = []
+
+    def send_command(self, command, payload=bytes()) -> Response:
+        with self._lock:
+            self.commands.append((time.perf_counter(), command, bytes(payload)))
+            if self._response_time:
+                time.sleep(self._response_time)
+
+            return Response(ResponseHeader.Status_Ok, [])
+
+
+class ControllerReplay:
+    """Feed recorded controller messages to a message handler, keeping their original timing"""
+
+    def __init__(self, records, speed=1.0):
+        """
+        :param records: list of (timestamp, RemoteControllerCommand) tuples
+        :param speed: playback speed multiplier, None to send the messages without delay
+        """
+        self._records = records
+        self._speed = speed
+
+    def run(self, data_ready):
+        """Replay the messages, returns the time each one was passed to data_ready"""
+        arrivals = []
+        start = time.perf_counter()
+        for (timestamp, message) in self._records:
+            if self._speed:
+                delay = start + timestamp / self._speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            arrivals.append(time.perf_counter())
+            data_ready(message)
+
+        return arrivals
+
+
+def packet_latencies(arrivals, command_times):
+    """
+    Time from each packet arrival to the first command sent after it, None if no command was sent before the next packet
+
+    >>> packet_latencies([1.0, 2.0, 3.0], [1.5, 1.7, 3.25])
+    [0.5, None, 0.25]
+    """
+    latencies = []
+    command_idx = 0
+    for (idx, arrival) in enumerate(arrivals):
+        next_arrival = arrivals[idx + 1] if idx + 1 < len(arrivals) else None
+
+        while command_idx < len(command_times) and command_times[command_idx] < arrival:
+            command_idx += 1
+
+        if command_idx < len(command_times) and (next_arrival is None or command_times[command_idx] < next_arrival):
+            latencies.append(command_times[command_idx] - arrival)
+        else:
+            latencies.append(None)
+
+    return latencies
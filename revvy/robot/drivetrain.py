@@ -1,6 +1,7 @@
 # SPDX-License-Identifier: GPL-3.0-only
 
 from revvy.mcu.rrrc_control import RevvyControl
+from revvy.robot.heading import HeadingController
 
 
 class DifferentialDrivetrain:
@@ -12,22 +13,56 @@ class DifferentialDrivetrain:
     CONTROL_GO_SPD = 1
     CONTROL_STOP = 2
 
-    def __init__(self, interface: RevvyControl, motor_port_count):
+    def __init__(self, interface: RevvyControl, motor_port_count, imu=None):
         self._interface = interface
         self._motor_count = motor_port_count
         self._motors = []
         self._left_motors = []
         self._right_motors = []
+        self._imu = imu
 
-        self.set_speeds = interface.set_drivetrain_speed
-        self.turn = interface.drivetrain_turn
-        self.move = interface.set_drivetrain_position
+        self._heading = HeadingController(interface.set_drivetrain_speed)
+        if imu:
+            imu.on_yaw_changed(self._heading.update)
+
+    @property
+    def heading_controller(self):
+        return self._heading
+
+    def set_speeds(self, left, right, power_limit=0):
+        self._heading.release()
+        self._interface.set_drivetrain_speed(left, right, power_limit)
+
+    def hold_heading(self, left, right, power_limit=0):
+        """
+        Drive with the given speeds and correct the speeds to keep the current heading, needs the IMU
+
+        Returns an id for release_heading, or None if the heading is not held.
+        """
+        if not self._imu:
+            self.set_speeds(left, right, power_limit)
+            return None
+        else:
+            return self._heading.hold(self._imu.yaw_angle, left, right, power_limit)
+
+    def release_heading(self, hold_id=None):
+        """Stop correcting the speeds, without changing them. With hold_id, only that hold is released"""
+        self._heading.release(hold_id)
+
+    def turn(self, turn_angle, wheel_speed=0, power_limit=0):
+        self._heading.release()
+        self._interface.drivetrain_turn(turn_angle, wheel_speed, power_limit)
+
+    def move(self, left, right, left_speed=0, right_speed=0, power_limit=0):
+        self._heading.release()
+        self._interface.set_drivetrain_position(left, right, left_speed, right_speed, power_limit)
 
     @property
     def motors(self):
         return self._motors
 
     def reset(self):
+        self._heading.release()
         self._motors.clear()
         self._left_motors.clear()
         self._right_motors.clear()
@@ -56,3 +91,8 @@ class DifferentialDrivetrain:
     @property
     def is_moving(self):
         return any(motor.is_moving for motor in self._motors)
+
+    @property
+    def status_changed(self):
+        """Condition that is notified when the status of the drivetrain motors is updated, None without motors"""
+        return self._motors[0].status_changed if self._motors else None
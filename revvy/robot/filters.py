@@ -0,0 +1,112 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+from bisect import insort, bisect_left
+from collections import deque
+
+
+class MedianFilter:
+    """
+    Median of the last window_size samples, updated incrementally
+
+    >>> f = MedianFilter(3)
+    >>> [f.add(x) for x in [5, 100, 6, 7, 5]]
+    [5, 52.5, 6, 7, 6]
+    """
+
+    def __init__(self, window_size=5):
+        assert window_size > 0
+        self._window = deque(maxlen=window_size)
+        self._sorted = []
+
+    @property
+    def value(self):
+        count = len(self._sorted)
+        if count == 0:
+            return None
+
+        middle = count // 2
+        if count % 2:
+            return self._sorted[middle]
+        return (self._sorted[middle - 1] + self._sorted[middle]) / 2
+
+    def add(self, sample):
+        if len(self._window) == self._window.maxlen:
+            del self._sorted[bisect_left(self._sorted, self._window[0])]
+
+        self._window.append(sample)
+        insort(self._sorted, sample)
+
+        return self.value
+
+    def reset(self):
+        self._window.clear()
+        self._sorted.clear()
+
+
+class ExponentialFilter:
+    """
+    Exponential moving average, alpha is the weight of the newest sample
+
+    >>> f = ExponentialFilter(0.5)
+    >>> [f.add(x) for x in [4, 8, 8]]
+    [4, 6.0, 7.0]
+    """
+
+    def __init__(self, alpha=0.3):
+        assert 0 < alpha <= 1
+        self._alpha = alpha
+        self._value = None
+
+    @property
+    def value(self):
+        return self._value
+
+    def add(self, sample):
+        if self._value is None:
+            self._value = sample
+        else:
+            self._value += self._alpha * (sample - self._value)
+
+        return self._value
+
+    def reset(self):
+        self._value = None
+
+
+class ComplementaryFilter:
+    """
+    Fuses an angular rate (e.g. from a gyroscope) with a noisy absolute angle (e.g. from an accelerometer)
+
+    The rate is integrated for short term accuracy, while the measured angle slowly corrects the drift:
+    angle = alpha * (angle + rate * dt) + (1 - alpha) * measured
+
+    >>> f = ComplementaryFilter(0.5)
+    >>> f.add(10, 0, timestamp=0)
+    10
+    >>> f.add(10, 20, timestamp=1)
+    20.0
+    """
+
+    def __init__(self, alpha=0.98):
+        assert 0 <= alpha < 1
+        self._alpha = alpha
+        self._value = None
+        self._timestamp = None
+
+    @property
+    def value(self):
+        return self._value
+
+    def add(self, measured, rate, timestamp):
+        if self._value is None:
+            self._value = measured
+        else:
+            dt = timestamp - self._timestamp
+            self._value = self._alpha * (self._value + rate * dt) + (1 - self._alpha) * measured
+
+        self._timestamp = timestamp
+        return self._value
+
+    def reset(self):
+        self._value = None
+        self._timestamp = None
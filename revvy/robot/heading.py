@@ -0,0 +1,182 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import math
+from threading import Lock
+
+from revvy.functions import clip
+
+
+class PidController:
+    """
+    PID controller with limits on the integrated error and on the output
+
+    >>> pid = PidController(kp=2, ki=1, output_limit=10)
+    >>> pid.update(3, dt=0)
+    6.0
+    >>> pid.update(3, dt=1)
+    9.0
+    >>> pid.update(10, dt=1)
+    10
+    """
+
+    def __init__(self, kp, ki=0.0, kd=0.0, output_limit=None, integral_limit=None):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self._output_limit = output_limit
+        self._integral_limit = integral_limit
+        self._integral = 0.0
+        self._last_error = None
+
+    @staticmethod
+    def _limit(x, limit):
+        return x if limit is None else clip(x, -limit, limit)
+
+    def update(self, error, dt):
+        derivative = 0.0
+        if dt > 0:
+            self._integral = self._limit(self._integral + error * dt, self._integral_limit)
+            if self._last_error is not None:
+                derivative = (error - self._last_error) / dt
+        self._last_error = error
+
+        output = self.kp * error + self.ki * self._integral + self.kd * derivative
+        return self._limit(output, self._output_limit)
+
+    def reset(self):
+        self._integral = 0.0
+        self._last_error = None
+
+
+class HeadingController:
+    """
+    Keeps the robot on a pinned heading while the drivetrain is driving straight
+
+    hold() pins the target heading and sends the base speeds. After that, every update() with a new yaw angle adds the
+    correction of the PID controller to the right side and subtracts it from the left side, so a positive correction
+    turns the robot counter-clockwise, towards a larger yaw angle. Speeds are only resent when the correction changes
+    by at least min_change degrees/s.
+
+    hold() returns an id that can be passed to release() to release only that hold and not a later one.
+
+    >>> sent = []
+    >>> controller = HeadingController(lambda left, right, power_limit: sent.append((left, right)), PidController(10))
+    >>> hold_id = controller.hold(0, 500, 500)
+    >>> controller.update(-2, timestamp=0)
+    >>> controller.update(-2, timestamp=0.02)
+    >>> sent
+    [(500, 500), (480.0, 520.0)]
+    """
+
+    kp = 10
+    ki = 2
+    kd = 0
+    max_correction = 200
+    max_integral = 50
+
+    def __init__(self, set_speeds, pid=None, min_change=1):
+        if pid is None:
+            pid = PidController(self.kp, self.ki, self.kd, self.max_correction, self.max_integral)
+
+        self._set_speeds = set_speeds
+        self._pid = pid
+        self._min_change = min_change
+        self._lock = Lock()
+
+        self._active = False
+        self._hold_id = 0
+        self._target = 0
+        self._speeds = (0, 0)
+        self._power_limit = 0
+        self._correction = 0
+        self._timestamp = None
+
+    @property
+    def pid(self):
+        return self._pid
+
+    @property
+    def is_active(self):
+        return self._active
+
+    @property
+    def target(self):
+        return self._target
+
+    def hold(self, heading, left, right, power_limit=0):
+        with self._lock:
+            self._target = heading
+            self._speeds = (left, right)
+            self._power_limit = power_limit
+            self._correction = 0
+            self._timestamp = None
+            self._pid.reset()
+            self._active = True
+            self._hold_id += 1
+
+            self._set_speeds(left, right, power_limit)
+            return self._hold_id
+
+    def release(self, hold_id=None):
+        with self._lock:
+            if hold_id is None or hold_id == self._hold_id:
+                self._active = False
+
+    def update(self, heading, timestamp):
+        # the lock is held while sending so a correction can't overwrite the speeds set after release()
+        with self._lock:
+            if not self._active:
+                return
+
+            dt = 0 if self._timestamp is None else timestamp - self._timestamp
+            self._timestamp = timestamp
+
+            correction = self._pid.update(self._target - heading, dt)
+            if abs(correction - self._correction) < self._min_change:
+                return
+
+            self._correction = correction
+            (left, right) = self._speeds
+            self._set_speeds(left - correction, right + correction, self._power_limit)
+
+
+class DriveSimulator:
+    """
+    Kinematic model of a differential drive robot, to try the heading controller without hardware
+
+    The wheels follow the commanded speeds (degrees/s) with a first order lag, and the right side is slower by bias
+    (e.g. 0.05 means 5%), which makes the robot drift like a real one with mismatched motors. The yaw angle is reported
+    in whole degrees, like the MCU does.
+    """
+
+    def __init__(self, bias=0.05, wheel_radius=0.03, track_width=0.12, response_time=0.1):
+        self._bias = bias
+        self._wheel_radius = wheel_radius
+        self._track_width = track_width
+        self._response_time = response_time
+
+        self._commanded = (0, 0)
+        self._left = 0.0
+        self._right = 0.0
+        self.yaw = 0.0
+        self.x = 0.0
+        self.y = 0.0
+
+    @property
+    def measured_yaw(self):
+        return int(round(self.yaw))
+
+    def set_speeds(self, left, right, power_limit=0):
+        self._commanded = (left, right)
+
+    def step(self, dt):
+        response = min(1.0, dt / self._response_time) if self._response_time else 1.0
+        (left, right) = self._commanded
+        self._left += (left - self._left) * response
+        self._right += (right * (1 - self._bias) - self._right) * response
+
+        # wheel speeds in degrees/s to yaw rate in degrees/s and forward speed in m/s
+        self.yaw += (self._right - self._left) * self._wheel_radius / self._track_width * dt
+        speed = math.radians(self._left + self._right) / 2 * self._wheel_radius
+        self.x += speed * math.cos(math.radians(self.yaw)) * dt
+        self.y += speed * math.sin(math.radians(self.yaw)) * dt
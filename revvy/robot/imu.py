@@ -1,44 +1,116 @@
 # SPDX-License-Identifier: GPL-3.0-only
 
 import collections
-import struct
+import math
+import time
+
+from revvy.robot.filters import ComplementaryFilter
+from revvy.robot.sample_buffer import SampleBuffer
 
 Vector3D = collections.namedtuple('Vector3D', ['x', 'y', 'z'])
 
 
 class IMU:
+    """
+    Latest values and recent history of the accelerometer, gyroscope and yaw angle
+
+    The raw samples are kept in ring buffers, see acceleration_history, rotation_history and yaw_history. Values in the
+    buffers are raw, multiply them with axl_lsb_value and gyro_lsb_value to get mg and degrees per second.
+
+    pin_yaw() stores the current yaw angle as reference, relative_yaw_angle is measured from the pinned angle.
+    """
+
+    history_length = 256
+    axl_lsb_value = 0.061
+    gyro_lsb_value = 0.035
+    tilt_filter_alpha = 0.98
+
     def __init__(self):
-        self._acceleration = Vector3D(0, 0, 0)
-        self._rotation = Vector3D(0, 0, 0)
-        self._yaw_angle = 0
-        self._relative_yaw_angle = 0
+        self._axl = SampleBuffer('h', 3, self.history_length)
+        self._gyro = SampleBuffer('h', 3, self.history_length)
+        self._yaw = SampleBuffer('i', 2, self.history_length)
+        self._roll = ComplementaryFilter(self.tilt_filter_alpha)
+        self._pitch = ComplementaryFilter(self.tilt_filter_alpha)
+        self._pinned_yaw = None
+        self._yaw_changed_callback = None
+
+    def on_yaw_changed(self, callback):
+        """callback(yaw_angle, timestamp) is called with every new yaw angle"""
+        self._yaw_changed_callback = callback
 
     @property
     def yaw_angle(self):
-        return self._yaw_angle
+        return self._yaw.latest(0)
 
     @property
     def relative_yaw_angle(self):
-        return self._relative_yaw_angle  # TODO pinning is not yet implemented
+        if self._pinned_yaw is None:
+            return self._yaw.latest(1)
+        return self._yaw.latest(0) - self._pinned_yaw
+
+    def pin_yaw(self):
+        self._pinned_yaw = self._yaw.latest(0)
+
+    def unpin_yaw(self):
+        self._pinned_yaw = None
+
+    @staticmethod
+    def _latest_vector(buffer, lsb_value):
+        (x, y, z) = buffer.latest_sample()
+        return Vector3D(x * lsb_value, y * lsb_value, z * lsb_value)
 
     @property
     def acceleration(self):
-        return self._acceleration
+        return self._latest_vector(self._axl, self.axl_lsb_value)
 
     @property
     def rotation(self):
-        return self._rotation
+        return self._latest_vector(self._gyro, self.gyro_lsb_value)
 
-    @staticmethod
-    def _read_vector(data, lsb_value):
-        (x, y, z) = struct.unpack('<hhh', bytes(data))
-        return Vector3D(x * lsb_value, y * lsb_value, z * lsb_value)
+    @property
+    def roll(self):
+        """Rotation around the x axis in degrees, estimated from the gyroscope and the direction of gravity"""
+        return self._roll.value or 0
+
+    @property
+    def pitch(self):
+        """Rotation around the y axis in degrees, estimated from the gyroscope and the direction of gravity"""
+        return self._pitch.value or 0
+
+    @property
+    def acceleration_history(self):
+        return self._axl
+
+    @property
+    def rotation_history(self):
+        return self._gyro
+
+    @property
+    def yaw_history(self):
+        return self._yaw
 
     def update_yaw_angles(self, data):
-        (self._yaw_angle, self._relative_yaw_angle) = struct.unpack('<ll', bytes(data))
+        timestamp = time.monotonic()
+        self._yaw.append_raw(data, timestamp)
+
+        if self._yaw_changed_callback:
+            self._yaw_changed_callback(self._yaw.latest(0), timestamp)
 
     def update_axl_data(self, data):
-        self._acceleration = self._read_vector(data, 0.061)
+        self._axl.append_raw(data, time.monotonic())
 
     def update_gyro_data(self, data):
-        self._rotation = self._read_vector(data, 0.035)
+        timestamp = time.monotonic()
+        self._gyro.append_raw(data, timestamp)
+        self._update_tilt(timestamp)
+
+    def _update_tilt(self, timestamp):
+        if len(self._axl) == 0:
+            return
+
+        (ax, ay, az) = (self._axl.latest(0), self._axl.latest(1), self._axl.latest(2))
+        roll = math.degrees(math.atan2(ay, az))
+        pitch = math.degrees(math.atan2(-ax, math.sqrt(ay * ay + az * az)))
+
+        self._roll.add(roll, self._gyro.latest(0) * self.gyro_lsb_value, timestamp)
+        self._pitch.add(pitch, self._gyro.latest(1) * self.gyro_lsb_value, timestamp)
@@ -1,5 +1,8 @@
 # SPDX-License-Identifier: GPL-3.0-only
 
+from inspect import getattr_static
+from threading import Condition
+
 from revvy.mcu.rrrc_control import RevvyControl
 
 
@@ -28,6 +31,7 @@ class PortHandler:
         self._configurations = configs
         self._types = supported
         self._port_count = amount
+        self._status_changed = Condition()
         self._ports = {i: PortInstance(i, interface, self) for i in range(1, self.port_count + 1)}
 
     def __getitem__(self, port_idx):
@@ -45,6 +49,15 @@ class PortHandler:
     def port_count(self):
         return self._port_count
 
+    @property
+    def status_changed(self):
+        """Condition that is notified when the status of any port is updated"""
+        return self._status_changed
+
+    def notify_status_changed(self):
+        with self._status_changed:
+            self._status_changed.notify_all()
+
     def reset(self):
         for port in self:
             port.uninitialize()
@@ -60,14 +73,35 @@ class PortHandler:
 
 
 class PortInstance:
+    """
+    A port of the brain that exposes the interface of the driver it is configured with
+
+    When a driver is installed, the class of the port is switched to a subclass that exposes the public methods and
+    properties of the driver class (see delegating_port_class). The bound methods of the driver are looked up once,
+    when the driver is installed, so port.set_speed() or port.value reach the driver without a __getattr__ fallback.
+    """
+
+    __slots__ = ('_port_idx', '_owner', '_interface', '_driver', '_driver_methods', '_config_changed_callback',
+                 '_configuration')
+
+    # names of the driver attributes in _driver_methods, set by the subclasses
+    _driver_method_names = ()
+
     def __init__(self, port_idx, interface: RevvyControl, owner: PortHandler):
         self._port_idx = port_idx
         self._owner = owner
         self._interface = interface
-        self._driver = owner._drivers["NotConfigured"](self, None)
+        self._set_driver(owner._drivers["NotConfigured"](self, None))
         self._config_changed_callback = lambda port, cfg_name: None
         self._configuration = "NotConfigured"
 
+    def _set_driver(self, driver):
+        port_class = delegating_port_class(type(driver))
+
+        self._driver = driver
+        self._driver_methods = tuple(getattr(driver, name) for name in port_class._driver_method_names)
+        self.__class__ = port_class
+
     def on_config_changed(self, callback):
         self._config_changed_callback = callback
 
@@ -78,7 +112,7 @@ class PortInstance:
         if not (self._configuration == "NotConfigured" and config_name == "NotConfigured"):
             self._configuration = config_name
             self._notify_config_changed("NotConfigured")  # temporarily disable reading port
-            self._driver = self._owner.configure_port(self, config_name)
+            self._set_driver(self._owner.configure_port(self, config_name))
             self._notify_config_changed(config_name)
 
         return self._driver
@@ -94,5 +128,58 @@ class PortInstance:
     def id(self):
         return self._port_idx
 
-    def __getattr__(self, name):
-        return self._driver.__getattribute__(name)
+    @property
+    def status_changed(self):
+        return self._owner.status_changed
+
+    def notify_status_changed(self):
+        self._owner.notify_status_changed()
+
+
+class _DriverMethod:
+    """Returns the bound method of the driver that was looked up when the driver was installed"""
+
+    __slots__ = ('_index',)
+
+    def __init__(self, index):
+        self._index = index
+
+    def __get__(self, port, owner=None):
+        if port is None:
+            return self
+        return port._driver_methods[self._index]
+
+
+def _forward_property(member):
+    getter = member.fget
+    return property(lambda port: getter(port._driver), doc=member.__doc__)
+
+
+_delegating_port_classes = {}
+
+
+def delegating_port_class(driver_class):
+    """PortInstance subclass that exposes the public attributes of driver_class, cached per class"""
+    try:
+        return _delegating_port_classes[driver_class]
+    except KeyError:
+        members = {'__slots__': ()}
+        method_names = []
+        for name in dir(driver_class):
+            # attributes of the port itself are not overridden
+            if name.startswith('_') or hasattr(PortInstance, name):
+                continue
+
+            member = getattr_static(driver_class, name)
+            if isinstance(member, property):
+                # properties are evaluated on every access
+                members[name] = _forward_property(member)
+            else:
+                members[name] = _DriverMethod(len(method_names))
+                method_names.append(name)
+
+        members['_driver_method_names'] = tuple(method_names)
+
+        port_class = type('{}Port'.format(driver_class.__name__), (PortInstance,), members)
+        _delegating_port_classes[driver_class] = port_class
+        return port_class
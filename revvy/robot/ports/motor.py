@@ -9,6 +9,7 @@ from revvy.robot.ports.common import PortHandler, PortInstance
 import struct
 
 
+# snapshot of the motor status, the driver replaces it as a whole so readers never see a partial update
 DcMotorStatus = namedtuple("DcMotorStatus", ['position', 'speed', 'power'])
 
 
@@ -27,8 +28,10 @@ def create_motor_port_handler(interface: RevvyControl, configs: dict):
 
 
 class NullMotor:
+    __slots__ = ('_status',)
+
     def __init__(self, port: PortInstance, port_config):
-        pass
+        self._status = DcMotorStatus(position=0, speed=0, power=0)
 
     def on_status_changed(self, cb):
         pass
@@ -62,11 +65,14 @@ class NullMotor:
         pass
 
     def get_status(self):
-        return DcMotorStatus(position=0, speed=0, power=0)
+        return self._status
 
 
 class DcMotorController:
     """Generic driver for dc motors"""
+
+    __slots__ = ('_name', '_port', '_configure', '_read', '_status', '_pos_reached', '_status_changed_callback')
+
     def __init__(self, port: PortInstance, port_config):
         self._name = 'Motor {}'.format(port.id)
         self._port = port
@@ -74,9 +80,7 @@ class DcMotorController:
         self._configure = lambda cfg: port.interface.set_motor_port_config(port.id, cfg)
         self._read = lambda: port.interface.get_motor_position(port.id)
 
-        self._pos = 0
-        self._speed = 0
-        self._power = 0
+        self._status = DcMotorStatus(position=0, speed=0, power=0)
         self._pos_reached = None
 
         (posMin, posMax) = port_config['position_limits']
@@ -112,19 +116,20 @@ class DcMotorController:
 
     @property
     def speed(self):
-        return self._speed
+        return self._status.speed
 
     @property
     def position(self):
-        return self._pos
+        return self._status.position
 
     @property
     def power(self):
-        return self._power
+        return self._status.power
 
     @property
     def is_moving(self):
-        stopped = math.fabs(round(self._speed, 2)) == 0 and math.fabs(self._power) < 80
+        status = self._status
+        stopped = math.fabs(round(status.speed, 2)) == 0 and math.fabs(status.power) < 80
         if self._pos_reached is None:
             return not stopped
         else:
@@ -166,15 +171,14 @@ class DcMotorController:
             print('{}: Received {} bytes of data instead of 9 or 10'.format(self._name, len(data)))
             return
 
-        self._pos = pos
-        self._speed = speed
-        self._power = power
+        self._status = DcMotorStatus(pos, speed, power)
         self._pos_reached = pos_reached
 
         self._raise_status_changed_callback()
+        self._port.notify_status_changed()
 
     def get_status(self):
         data = self._read()
 
         self.update_status(data)
-        return DcMotorStatus(position=self._pos, speed=self._speed, power=self._power)
+        return self._status
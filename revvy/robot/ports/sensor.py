@@ -1,14 +1,55 @@
 # SPDX-License-Identifier: GPL-3.0-only
 
-from collections import namedtuple
+import struct
+from collections import namedtuple, deque
 
 from revvy.mcu.rrrc_control import RevvyControl
+from revvy.robot.filters import MedianFilter, ExponentialFilter
 from revvy.robot.ports.common import PortHandler, PortInstance
 
 
+# snapshot of the last read, the driver replaces it as a whole so readers never see a partial update
 SensorValue = namedtuple('SensorValue', ['raw', 'converted'])
 
 
+class SensorDecoder:
+    """
+    Converts raw sensor data using a precompiled struct format
+
+    convert receives the unpacked fields and returns the converted value, or None if the data is not valid. Data of
+    the wrong length is not valid, reporting it is left to the caller.
+
+    >>> decoder = SensorDecoder('<BH', lambda a, b: a + b)
+    >>> decoder(bytes([1, 2, 0]))
+    3
+    >>> decoder(bytes([1, 2])) is None
+    True
+    """
+
+    def __init__(self, fmt, convert=lambda value: value):
+        self._struct = struct.Struct(fmt)
+        self._convert = convert
+
+    @property
+    def size(self):
+        return self._struct.size
+
+    def has_valid_length(self, raw):
+        return len(raw) == self._struct.size
+
+    def __call__(self, raw):
+        if not self.has_valid_length(raw):
+            return None
+
+        return self._convert(*self._struct.unpack(bytes(raw)))
+
+
+sensor_decoders = {
+    'BumperSwitch': SensorDecoder('<BB', lambda pressed, _: pressed == 1),
+    'HC_SR04': SensorDecoder('<L', lambda distance: distance if distance != 0 else None)
+}
+
+
 def create_sensor_port_handler(interface: RevvyControl, configs: dict):
     port_amount = interface.get_sensor_port_amount()
     port_types = interface.get_sensor_port_types()
@@ -25,8 +66,10 @@ def create_sensor_port_handler(interface: RevvyControl, configs: dict):
 
 
 class NullSensor:
+    __slots__ = ('_reading',)
+
     def __init__(self, port: PortInstance, port_config):
-        pass
+        self._reading = SensorValue(raw=0, converted=0)
 
     def on_value_changed(self, cb):
         pass
@@ -35,7 +78,14 @@ class NullSensor:
         pass
 
     def read(self):
-        return SensorValue(raw=0, converted=0)
+        return self._reading
+
+    def filtered_value(self, method='median'):
+        return 0
+
+    @property
+    def history(self):
+        return []
 
     @property
     def value(self):
@@ -47,12 +97,34 @@ class NullSensor:
 
 
 class BaseSensorPortDriver:
-    def __init__(self, port: PortInstance):
+    """
+    Common sensor driver logic
+
+    Every valid sample is recorded in a ring buffer and fed to a median and an exponential moving average filter.
+    The sizes can be set in the port config using the history_length, median_window and ema_alpha keys.
+    """
+
+    __slots__ = ('_port', '_interface', '_decoder', '_value', '_raw_value', '_sample', '_reading',
+                 '_value_changed_callback', '_history', '_filters', '_length_error_reported')
+
+    def __init__(self, port: PortInstance, decoder: SensorDecoder = None, config=None):
+        config = config or {}
+
         self._port = port
         self._interface = port.interface
+        self._decoder = decoder
         self._value = None
         self._raw_value = None
+        self._sample = None
+        self._reading = SensorValue(raw=None, converted=None)
         self._value_changed_callback = lambda p: None
+        self._length_error_reported = False
+
+        self._history = deque(maxlen=config.get('history_length', 32))
+        self._filters = {
+            'median': MedianFilter(config.get('median_window', 5)),
+            'ema': ExponentialFilter(config.get('ema_alpha', 0.3))
+        }
 
     @property
     def has_data(self):
@@ -61,23 +133,36 @@ class BaseSensorPortDriver:
     def update_status(self, data):
         if len(data) == 0:
             self._value = None
+            self._reading = SensorValue(raw=self._raw_value, converted=None)
             return
 
-        old_raw = self._raw_value
-        if old_raw != data:
-            converted = self.convert_sensor_value(data)
-
+        if self._raw_value != data:
             self._raw_value = data
-            if converted is not None:
-                self._value = converted
+            self._sample = self.convert_sensor_value(data)
+
+            if self._sample is not None:
+                self._value = self._sample
+            self._reading = SensorValue(raw=data, converted=self._value)
+
+            self._add_sample()
 
             self._raise_value_changed_callback()
+            self._port.notify_status_changed()
+        else:
+            # an unchanged reading is still a sample
+            self._add_sample()
+
+    def _add_sample(self):
+        if self._sample is not None:
+            self._history.append(self._sample)
+            for sample_filter in self._filters.values():
+                sample_filter.add(self._sample)
 
     def read(self):
         data = self._interface.get_sensor_port_value(self._port.id)
         self.update_status(data)
 
-        return SensorValue(raw=self._raw_value, converted=self._value)
+        return self._reading
 
     @property
     def value(self):
@@ -87,6 +172,15 @@ class BaseSensorPortDriver:
     def raw_value(self):
         return self._raw_value
 
+    def filtered_value(self, method='median'):
+        """The filtered value, method is either 'median' or 'ema' (exponential moving average)"""
+        return self._filters[method].value
+
+    @property
+    def history(self):
+        """The last valid samples, oldest first"""
+        return list(self._history)
+
     def on_value_changed(self, cb):
         if not callable(cb):
 
@@ -100,31 +194,24 @@ class BaseSensorPortDriver:
     def _raise_value_changed_callback(self):
         self._value_changed_callback(self._port)
 
-    def convert_sensor_value(self, raw): raise NotImplementedError
+    def convert_sensor_value(self, raw):
+        if self._decoder is None:
+            raise NotImplementedError
 
+        if not self._decoder.has_valid_length(raw):
+            # reported once, this runs for every status update
+            if not self._length_error_reported:
+                self._length_error_reported = True
+                print('Sensor {}: received {} bytes instead of {}, further errors are not reported'.format(
+                    self._port.id, len(raw), self._decoder.size))
+            return None
 
-# noinspection PyUnusedLocal
-def bumper_switch(port: PortInstance, cfg):
-    sensor = BaseSensorPortDriver(port)
+        return self._decoder(raw)
 
-    def process_bumper(raw):
-        assert len(raw) == 2
-        return raw[0] == 1
 
-    sensor.convert_sensor_value = process_bumper
-    return sensor
+def bumper_switch(port: PortInstance, cfg):
+    return BaseSensorPortDriver(port, sensor_decoders['BumperSwitch'], cfg)
 
 
-# noinspection PyUnusedLocal
 def hcsr04(port: PortInstance, cfg):
-    sensor = BaseSensorPortDriver(port)
-
-    def process_ultrasonic(raw):
-        assert len(raw) == 4
-        dst = int.from_bytes(raw, byteorder='little')
-        if dst == 0:
-            return None
-        return dst
-
-    sensor.convert_sensor_value = process_ultrasonic
-    return sensor
+    return BaseSensorPortDriver(port, sensor_decoders['HC_SR04'], cfg)
@@ -4,71 +4,79 @@ import time
 from collections import namedtuple
 from threading import Lock, Event
 
-from revvy.activation import EdgeTrigger
 from revvy.thread_wrapper import ThreadWrapper, ThreadContext
 
 
+# analog: bytes, one byte per channel, buttons: int, bit n is the state of button n
 RemoteControllerCommand = namedtuple('RemoteControllerCommand', ['analog', 'buttons'])
 
+button_count = 32
+all_buttons = (1 << button_count) - 1
+
+
+def _set_bits(mask):
+    """
+    Indexes of the bits that are set in mask, lowest first
+
+    >>> list(_set_bits(0b10010))
+    [1, 4]
+    """
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
 
 class RemoteController:
     def __init__(self):
-        self._button_mutex = Lock()
+        self._mutex = Lock()
 
         self._analogActions = []
-        self._analogStates = []
-        self._previousAnalogStates = []
-        self._buttonHandlers = [EdgeTrigger() for _ in range(32)]
-        self._buttonActions = [lambda: None] * 32
-        self._buttonStates = [False] * 32
+        self._analogStates = b''
+        self._buttonActions = [None] * button_count
+        self._buttonStates = 0
+
+        # buttons need to be released first, so the previous state starts as all pressed
+        self._previousButtons = all_buttons
 
         self._controller_detected = lambda: None
         self._controller_disappeared = lambda: None
 
-        for i in range(len(self._buttonHandlers)):
-            handler = self._buttonHandlers[i]
-            handler.handle(1)
-            handler.on_rising_edge(lambda btn=i: self._handle_button_pressed(btn))
-            handler.on_falling_edge(lambda btn=i: self._handle_button_released(btn))
-
     def is_button_pressed(self, button_idx):
-        with self._button_mutex:
-            return self._buttonStates[button_idx]
+        with self._mutex:
+            return (self._buttonStates >> button_idx) & 1 == 1
 
     def analog_value(self, analog_idx):
         try:
-            with self._button_mutex:
+            with self._mutex:
                 return self._analogStates[analog_idx]
         except IndexError:
             return 0
 
     def reset(self):
         print('RemoteController: reset')
-        with self._button_mutex:
+        with self._mutex:
             self._analogActions.clear()
-            self._analogStates.clear()
-            self._previousAnalogStates.clear()
+            self._analogStates = b''
 
-            self._buttonActions = [lambda: None] * 32
+            self._buttonActions = [None] * button_count
+            self._buttonStates = 0
+            self._previousButtons = all_buttons
 
-            for i in range(len(self._buttonHandlers)):
-                handler = self._buttonHandlers[i]
-                # make sure we don't trigger anything
-                handler.on_rising_edge(lambda: None)
-                handler.on_falling_edge(lambda: None)
-
-                handler.handle(1)
+    def tick(self, message: RemoteControllerCommand):
+        buttons = message.buttons
 
-                handler.on_rising_edge(lambda btn=i: self._handle_button_pressed(btn))
-                handler.on_falling_edge(lambda btn=i: self._handle_button_released(btn))
+        with self._mutex:
+            previous_analog = self._analogStates
+            self._analogStates = message.analog
 
-            self._buttonStates = [False] * 32
+            # only buttons that changed since the last message generate events
+            changed = buttons ^ self._previousButtons
+            pressed = changed & buttons
+            self._previousButtons = buttons
+            self._buttonStates = (self._buttonStates | pressed) & ~(changed & ~buttons)
 
-    def tick(self, message: RemoteControllerCommand):
-        # copy states
-        with self._button_mutex:
-            self._previousAnalogStates = self._analogStates
-            self._analogStates = message.analog
+            actions = [self._buttonActions[idx] for idx in _set_bits(pressed)]
 
         # handle analog channels
         for handler in self._analogActions:
@@ -76,7 +84,7 @@ class RemoteController:
             try:
                 current = [message.analog[x] for x in handler['channels']]
                 try:
-                    previous = [self._previousAnalogStates[x] for x in handler['channels']]
+                    previous = [previous_analog[x] for x in handler['channels']]
                 except IndexError:
                     previous = []
                 if current != [127] * len(current) or current != previous:
@@ -85,23 +93,16 @@ class RemoteController:
                 print('Skip analog handler for channels {}'.format(", ".join(map(str, handler['channels']))))
 
         # handle button presses
-        for idx in range(len(self._buttonHandlers)):
-            with self._button_mutex:
-                self._buttonHandlers[idx].handle(message.buttons[idx])
+        for action in actions:
+            if action:
+                action()
 
     def on_button_pressed(self, button, action):
-        self._buttonHandlers[button].on_rising_edge(action)
+        self._buttonActions[button] = action
 
     def on_analog_values(self, channels, action):
         self._analogActions.append({'channels': channels, 'action': action})
 
-    def _handle_button_pressed(self, btn):
-        self._buttonStates[btn] = True
-        self._buttonActions[btn]()
-
-    def _handle_button_released(self, btn):
-        self._buttonStates[btn] = False
-
 
 class RemoteControllerScheduler:
     def __init__(self, rc: RemoteController):
@@ -111,12 +112,22 @@ class RemoteControllerScheduler:
         self._controller_lost_callback = lambda: None
         self._data_mutex = Lock()
         self._message = None
+        self._message_received_callback = lambda message: None
 
     def data_ready(self, message: RemoteControllerCommand):
+        self._message_received_callback(message)
         with self._data_mutex:
             self._message = message
         self._data_ready_event.set()
 
+    def on_message_received(self, callback):
+        """Register a callback that is called with every received message, e.g. to record them"""
+        if not callable(callback):
+            def callback(message):
+                pass
+
+        self._message_received_callback = callback
+
     def handle_controller(self, ctx: ThreadContext):
         print('RemoteControllerScheduler: Waiting for controller')
 
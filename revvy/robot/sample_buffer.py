@@ -0,0 +1,100 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+from array import array
+
+
+class SampleBuffer:
+    """
+    Fixed size ring buffer of timestamped samples, each consisting of a number of channels
+
+    Samples are copied into preallocated arrays, so storing a sample does not create Python objects. Every sample is
+    written twice, to index i and i + capacity, so the last n samples are always contiguous and can be returned as
+    memoryviews without copying. Views point into the buffer, they are only valid until the buffer wraps around.
+
+    Raw samples are expected in the native byte order (little endian, as sent by the MCU, on the robot).
+
+    >>> buffer = SampleBuffer('h', 2, capacity=3)
+    >>> for i in range(4):
+    ...     buffer.append_raw(bytes([i, 0, 10 + i, 0]), timestamp=i)
+    >>> timestamps, values = buffer.window(2)
+    >>> timestamps.tolist(), values.tolist()
+    ([2.0, 3.0], [2, 12, 3, 13])
+    >>> buffer.channel(1).tolist()
+    [11, 12, 13]
+    >>> buffer.latest(0)
+    3
+    >>> buffer.latest_sample()
+    [3, 13]
+    """
+
+    def __init__(self, typecode, channels, capacity):
+        assert capacity > 0
+        self._channels = channels
+        self._capacity = capacity
+        self._values = array(typecode, bytes(array(typecode).itemsize * channels * capacity * 2))
+        self._timestamps = array('d', bytes(8 * capacity * 2))
+        self._value_view = memoryview(self._values)
+        self._timestamp_view = memoryview(self._timestamps)
+        self._raw = self._value_view.cast('B')
+        self._sample_size = self._values.itemsize * channels
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def sample_size(self):
+        """Size of a raw sample in bytes"""
+        return self._sample_size
+
+    def append_raw(self, data, timestamp):
+        if len(data) != self._sample_size:
+            raise ValueError('Sample size must be {} bytes, got {}'.format(self._sample_size, len(data)))
+
+        idx = self._next
+        start = idx * self._sample_size
+        mirror = (idx + self._capacity) * self._sample_size
+        self._raw[start:start + self._sample_size] = data
+        self._raw[mirror:mirror + self._sample_size] = data
+        self._timestamps[idx] = timestamp
+        self._timestamps[idx + self._capacity] = timestamp
+
+        self._next = (idx + 1) % self._capacity
+        if self._count < self._capacity:
+            self._count += 1
+
+    def latest(self, channel):
+        """The given channel of the newest sample"""
+        if self._count == 0:
+            return 0
+        return self._values[(self._next - 1) % self._capacity * self._channels + channel]
+
+    def latest_sample(self):
+        """Every channel of the newest sample, as a list"""
+        if self._count == 0:
+            return [0] * self._channels
+        start = (self._next - 1) % self._capacity * self._channels
+        return self._values[start:start + self._channels].tolist()
+
+    @property
+    def latest_timestamp(self):
+        if self._count == 0:
+            return None
+        return self._timestamps[(self._next - 1) % self._capacity]
+
+    def window(self, n=None):
+        """Views of the timestamps and the interleaved values of the last n samples, oldest first"""
+        n = self._count if n is None else min(n, self._count)
+        end = self._next + self._capacity
+
+        return self._timestamp_view[end - n:end], self._value_view[(end - n) * self._channels:end * self._channels]
+
+    def channel(self, channel, n=None):
+        """View of one channel of the last n samples, oldest first"""
+        _, values = self.window(n)
+        return values[channel::self._channels]
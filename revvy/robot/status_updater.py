@@ -53,7 +53,7 @@ class McuStatusUpdater:
                 self._disable_slot(slot)
 
     def read(self):
-        data = self._robot.status_updater_read()
+        data = bytes(self._robot.status_updater_read())
 
         idx = 0
         while idx < len(data):
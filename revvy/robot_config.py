@@ -37,6 +37,11 @@ class PortConfig:
     def names(self):
         return self._port_names
 
+    @property
+    def port_ids(self):
+        """Ids of the ports that have an explicit configuration"""
+        return self._ports.keys()
+
     def __getitem__(self, item):
         return self._ports.get(item, "NotConfigured")
 
@@ -151,4 +156,35 @@ class RobotConfig:
         self.background_scripts = []
 
 
+class RobotConfigDiff:
+    """Lists the parts of a robot configuration that differ between two configurations"""
+
+    def __init__(self, old: RobotConfig, new: RobotConfig):
+        def changed_ports(old_ports: PortConfig, new_ports: PortConfig):
+            ports = set(old_ports.port_ids) | set(new_ports.port_ids)
+            return sorted(port for port in ports if old_ports[port] != new_ports[port])
+
+        def script_changed(name):
+            return name not in old.scripts or old.scripts[name] != new.scripts[name]
+
+        self.motors = changed_ports(old.motors, new.motors)
+        self.sensors = changed_ports(old.sensors, new.sensors)
+        self.drivetrain = old.drivetrain != new.drivetrain
+
+        # scripts hold the port aliases so they need to be recreated when the names change
+        self.port_names = old.motors.names != new.motors.names or old.sensors.names != new.sensors.names
+
+        self.removed_scripts = [name for name in old.scripts if name not in new.scripts]
+        self.scripts = [name for name in new.scripts if self.port_names or script_changed(name)]
+
+        self.controller = old.controller.analog != new.controller.analog \
+            or old.controller.buttons != new.controller.buttons \
+            or old.background_scripts != new.background_scripts
+
+    @property
+    def is_empty(self):
+        return not (self.motors or self.sensors or self.drivetrain or self.removed_scripts or self.scripts
+                    or self.controller)
+
+
 empty_robot_config = RobotConfig()
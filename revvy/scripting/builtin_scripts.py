@@ -1,45 +1,52 @@
 # SPDX-License-Identifier: GPL-3.0-only
 
-from revvy.functions import clip, map_values
-from revvy.scripting.controllers import stick_controller, joystick
+from revvy.scripting.controllers import stick_controller_curve, joystick_curve
 
+# time in seconds a streaming script waits for new input before exiting
+streaming_idle_timeout = 1
 
-def normalize_analog(b):
+
+def streaming(script):
     """
-    >>> normalize_analog(0)
-    -1.0
-    >>> normalize_analog(255)
-    1.0
-    >>> normalize_analog(127)
-    0.0
+    Create a script that runs script for every new value of its input channel
+
+    The script keeps running while input arrives and exits after streaming_idle_timeout seconds without input.
     """
-    return clip((b - 127) / 127.0, -1.0, 1.0)
+    def _run(args):
+        channel = args['input_channel']
+        ctx = args['ctx']
 
+        values = channel.take(ctx.wait_for, streaming_idle_timeout)
+        while values is not None:
+            args['input'] = values
+            script(args)
+            values = channel.take(ctx.wait_for, streaming_idle_timeout)
 
-def drive(args, controller):
-    robot = args['robot']
-    channels = args['input']
+    _run.streaming = True
+    return _run
 
-    x = normalize_analog(channels[0])
-    y = normalize_analog(channels[1])
 
-    (sl, sr) = controller(x, y)
+def drive(args, controller_curve):
+    robot = args['robot']
+    channels = args['input']
 
-    sl = map_values(sl, 0, 1, 0, 900)
-    sr = map_values(sr, 0, 1, 0, 900)
+    (sl, sr) = controller_curve(channels[0], channels[1])
 
     robot.drivetrain.set_speeds(sl, sr)
 
 
 def drive_joystick(args):
-    drive(args, joystick)
+    drive(args, joystick_curve)
 
 
 def drive_2sticks(args):
-    drive(args, stick_controller)
+    drive(args, stick_controller_curve)
+
 
+# lookup tables used by the builtin scripts, see ControllerCurve.prepare()
+builtin_controller_curves = (stick_controller_curve, joystick_curve)
 
 builtin_scripts = {
-    'drive_2sticks': drive_2sticks,
-    'drive_joystick': drive_joystick
+    'drive_2sticks': streaming(drive_2sticks),
+    'drive_joystick': streaming(drive_joystick)
 }
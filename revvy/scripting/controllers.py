@@ -1,6 +1,22 @@
 # SPDX-License-Identifier: GPL-3.0-only
 
 import math
+from array import array
+from threading import Lock, Thread
+
+from revvy.functions import clip, map_values
+
+
+def normalize_analog(b):
+    """
+    >>> normalize_analog(0)
+    -1.0
+    >>> normalize_analog(255)
+    1.0
+    >>> normalize_analog(127)
+    0.0
+    """
+    return clip((b - 127) / 127.0, -1.0, 1.0)
 
 
 def stick_controller(x, y):
@@ -71,3 +87,68 @@ def expo_joystick(x, y):
     """
 
     return generic_joystick(x, y, 0.5)
+
+
+class ControllerCurve:
+    """
+    Precomputed output of a controller function for every pair of raw analog values
+
+    Analog channels are bytes, so every possible input is evaluated once and stored in two 256x256 tables, one for
+    each side. The outputs are scaled to [-max_speed, max_speed]. The tables are built by prepare() in a background
+thread, or on first use if that has not finished yet.
+
+    >>> curve = ControllerCurve(joystick)
+    >>> curve(127, 255)
+    (900.0, 900.0)
+    >>> curve.batch([(127, 127), (0, 127)])
+    [(0.0, 0.0), (-900.0, 900.0)]
+    """
+
+    def __init__(self, controller, max_speed=900):
+        self._controller = controller
+        self._max_speed = max_speed
+        self._lock = Lock()
+        self._left = None
+        self._right = None
+
+    @property
+    def is_ready(self):
+        return self._left is not None
+
+    def prepare(self):
+        """Start building the tables in the background, so the first controller message doesn't have to wait"""
+        if self._left is None:
+            Thread(target=self._build, name='ControllerCurve', daemon=True).start()
+
+    def _build(self):
+        with self._lock:
+            if self._left is None:
+                left = array('d', [0.0]) * 65536
+                right = array('d', [0.0]) * 65536
+                inputs = [normalize_analog(b) for b in range(256)]
+                for x_raw, x in enumerate(inputs):
+                    for y_raw, y in enumerate(inputs):
+                        (sl, sr) = self._controller(x, y)
+                        left[(x_raw << 8) | y_raw] = map_values(sl, 0, 1, 0, self._max_speed)
+                        right[(x_raw << 8) | y_raw] = map_values(sr, 0, 1, 0, self._max_speed)
+
+                self._right = right
+                self._left = left
+
+        return self._left, self._right
+
+    def __call__(self, x, y):
+        left, right = (self._left, self._right) if self._left is not None else self._build()
+        idx = (x << 8) | y
+        return left[idx], right[idx]
+
+    def batch(self, samples):
+        """Convert a sequence of (x, y) raw analog pairs, e.g. a recorded controller trace"""
+        left, right = (self._left, self._right) if self._left is not None else self._build()
+        indexes = [(x << 8) | y for (x, y) in samples]
+        return [(left[idx], right[idx]) for idx in indexes]
+
+
+joystick_curve = ControllerCurve(joystick)
+expo_joystick_curve = ControllerCurve(expo_joystick)
+stick_controller_curve = ControllerCurve(stick_controller)
@@ -1,14 +1,76 @@
 # SPDX-License-Identifier: GPL-3.0-only
 
-from threading import Lock
+import time
+from collections import deque
+from threading import Lock, Condition
+
+
+class ResourceMetrics:
+    """Usage counters of a resource. Counters updated on the lock-free path are approximate"""
+
+    def __init__(self):
+        self.requests = 0
+        self.fast_path = 0
+        self.contended = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.preemptions = 0
+        self.denied = 0
+        self.queued = 0
+        self.queue_wait_time = 0.0
+        self.timeouts = 0
+
+    def record_wait(self, wait_time):
+        self.contended += 1
+        self.wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'fast_path': self.fast_path,
+            'contended': self.contended,
+            'wait_time': self.wait_time,
+            'max_wait_time': self.max_wait_time,
+            'preemptions': self.preemptions,
+            'denied': self.denied,
+            'queued': self.queued,
+            'queue_wait_time': self.queue_wait_time,
+            'timeouts': self.timeouts
+        }
+
+
+class _Waiter:
+    def __init__(self, priority, sequence, on_taken_away):
+        self.priority = priority
+        self.sequence = sequence
+        self.on_taken_away = on_taken_away
+        self.handle = None
+        self.cancelled = False
+
+    @property
+    def key(self):
+        return self.priority, self.sequence
+
+
+def _wait_for(condition, predicate, timeout):
+    with condition:
+        return condition.wait_for(predicate, timeout)
 
 
 class ResourceHandle:
-    def __init__(self, resource, callback=lambda: None):
+    __slots__ = ('_resource', '_generation', '_callback', '_is_interrupted')
+
+    def __init__(self, resource, generation, callback=lambda: None):
         self._resource = resource
+        self._generation = generation
         self._callback = callback
         self._is_interrupted = False
 
+    @property
+    def generation(self):
+        return self._generation
+
     def release(self):
         self._resource.release(self)
 
@@ -17,9 +79,12 @@ class ResourceHandle:
         self._callback()
 
     def run_uninterruptable(self, callback):
-        with self._resource._lock:
+        """Run callback unless the resource was taken away, returns the result of callback or None"""
+        # the lock makes sure a higher priority request waits for the running command before taking over
+        with self._resource.lock():
             if not self._is_interrupted:
-                callback()
+                return callback()
+            return None
 
     @property
     def is_interrupted(self):
@@ -27,34 +92,171 @@ class ResourceHandle:
 
 
 class Resource:
+    """
+    Arbitrates access to a robot resource between scripts of different priorities
+
+    The current owner is stored as a (priority, handle) tuple that is only replaced as a whole, so the owner can be
+    returned without locking when the same priority requests the resource again. Every new owner gets a new
+    generation number.
+
+    Requests with a timeout wait in a bounded queue if the resource is held by a higher priority owner. Waiters are
+    ordered by priority, then by arrival, and the resource is handed over to the first one when it is released.
+    """
+
+    _no_owner = (-1, None)
+
+    max_waiters = 8
+    trace_length = 64
+
     def __init__(self):
         self._lock = Lock()
-        self._current_priority = -1
-        self._active_handle = None
+        self._handed_over = Condition(self._lock)
+        self._owner = self._no_owner
+        self._generation = 0
+        self._waiters = []
+        self._waiter_sequence = 0
+        self._metrics = ResourceMetrics()
+        self._trace = deque(maxlen=self.trace_length)
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @property
+    def generation(self):
+        return self._generation
+
+    @property
+    def trace(self):
+        """Recent ownership changes as (timestamp, event, priority, generation) tuples, oldest first"""
+        return list(self._trace)
+
+    def _record(self, event, priority, generation):
+        self._trace.append((time.time(), event, priority, generation))
+
+    def lock(self):
+        """Acquire the lock, recording the time spent waiting if it was held by someone else"""
+        if not self._lock.acquire(blocking=False):
+            start = time.perf_counter()
+            self._lock.acquire()
+            self._metrics.record_wait(time.perf_counter() - start)
+
+        return _LockGuard(self._lock)
 
     def reset(self):
-        with self._lock:
-            self._current_priority = -1
-            self._active_handle = None
-
-    def request(self, with_priority=0, on_taken_away=lambda: None):
-        with self._lock:
-            if self._active_handle is None:
-                self._current_priority = with_priority
-                self._active_handle = ResourceHandle(self, on_taken_away)
-                return self._active_handle
-            elif self._current_priority == with_priority:
-                return self._active_handle
-            elif self._current_priority > with_priority:
-                self._active_handle.interrupt()
-                self._current_priority = with_priority
-                self._active_handle = ResourceHandle(self, on_taken_away)
-                return self._active_handle
-            else:
+        with self.lock():
+            handle = self._owner[1]
+            if handle is not None:
+                handle.interrupt()
+
+            self._owner = self._no_owner
+            for waiter in self._waiters:
+                waiter.cancelled = True
+            self._waiters.clear()
+            self._handed_over.notify_all()
+            self._record('reset', -1, self._generation)
+
+    def request(self, with_priority=0, on_taken_away=lambda: None, timeout=0, wait_for=None):
+        """
+        Take the resource if it is free or held by a lower priority owner
+
+        If the resource is held by a higher priority owner, None is returned immediately when timeout is 0. Otherwise
+        the request waits in the queue for at most timeout seconds (forever if None). wait_for can be used to make the
+        wait interruptible, it is called as wait_for(condition, predicate, timeout) like ThreadContext.wait_for.
+        """
+        self._metrics.requests += 1
+
+        # fast path: the current owner requests again
+        priority, handle = self._owner
+        if handle is not None and priority == with_priority and not handle.is_interrupted:
+            self._metrics.fast_path += 1
+            return handle
+
+        with self.lock():
+            priority, handle = self._owner
+            if handle is None:
+                return self._take(with_priority, on_taken_away)
+            elif priority == with_priority:
+                return handle
+            elif priority > with_priority:
+                self._metrics.preemptions += 1
+                handle.interrupt()
+                self._record('preempt', priority, handle.generation)
+                return self._take(with_priority, on_taken_away)
+            elif timeout == 0 or len(self._waiters) >= self.max_waiters:
+                self._metrics.denied += 1
+                self._record('deny', with_priority, handle.generation)
                 return None
 
+            waiter = self._enqueue(with_priority, on_taken_away)
+
+        return self._wait(waiter, timeout, wait_for)
+
+    def _enqueue(self, priority, on_taken_away):
+        self._waiter_sequence += 1
+        waiter = _Waiter(priority, self._waiter_sequence, on_taken_away)
+        self._waiters.append(waiter)
+        self._waiters.sort(key=lambda w: w.key)
+
+        self._metrics.queued += 1
+        self._record('wait', priority, self._generation)
+        return waiter
+
+    def _wait(self, waiter, timeout, wait_for):
+        if wait_for is None:
+            wait_for = _wait_for
+
+        start = time.perf_counter()
+        interrupted = True
+        try:
+            wait_for(self._handed_over, lambda: waiter.handle is not None or waiter.cancelled, timeout)
+            interrupted = False
+        finally:
+            # leaving the queue and giving back a handed over resource is decided under one lock, otherwise release()
+            # could hand the resource to this waiter after it has already given up
+            with self._lock:
+                self._metrics.queue_wait_time += time.perf_counter() - start
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    self._metrics.timeouts += 1
+                    self._record('timeout', waiter.priority, self._generation)
+                elif interrupted and waiter.handle is not None:
+                    self._release(waiter.handle)
+
+        return waiter.handle
+
+    def _take(self, priority, on_taken_away):
+        self._generation += 1
+        handle = ResourceHandle(self, self._generation, on_taken_away)
+        self._owner = (priority, handle)
+        self._record('take', priority, self._generation)
+        return handle
+
     def release(self, resource_handle):
-        with self._lock:
-            if self._active_handle == resource_handle:
-                self._active_handle = None
-                self._current_priority = -1
+        with self.lock():
+            self._release(resource_handle)
+
+    def _release(self, resource_handle):
+        """Must be called with the lock held"""
+        if self._owner[1] == resource_handle:
+            self._record('release', self._owner[0], resource_handle.generation)
+            self._owner = self._no_owner
+
+            if self._waiters:
+                # hand the resource over directly so that a new request can't take it before the waiter wakes up
+                waiter = self._waiters.pop(0)
+                waiter.handle = self._take(waiter.priority, waiter.on_taken_away)
+                self._handed_over.notify_all()
+
+
+class _LockGuard:
+    """Releases an already acquired lock at the end of a with block"""
+
+    def __init__(self, lock):
+        self._lock = lock
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._lock.release()
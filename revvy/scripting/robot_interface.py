@@ -1,6 +1,9 @@
 # SPDX-License-Identifier: GPL-3.0-only
 
 import time
+import traceback
+from collections import deque
+from threading import Condition, Event, Thread
 
 from revvy.functions import hex2rgb
 from revvy.hardware_dependent.sound import set_volume
@@ -12,26 +15,72 @@ class ResourceWrapper:
         self._resource = resource
         self._priority = priority
 
-    def request(self):
-        return self._resource.request(self._priority)
+    def request(self, timeout=0, wait_for=None, on_taken_away=lambda: None):
+        return self._resource.request(self._priority, on_taken_away, timeout=timeout, wait_for=wait_for)
 
 
 class Wrapper:
+    # time to wait for motors to report movement after a command
+    movement_start_timeout = 0.2
+
+    # status updates wake up waiting scripts, the timeout is only a fallback for ports that are not updated
+    movement_check_interval = 0.2
+
     def __init__(self, script, resource: ResourceWrapper):
         self._resource = resource
         self._script = script
+        self._resource_timeout = 0
+        self._used = False
+
+    def set_resource_timeout(self, timeout):
+        """
+        Set how long commands wait for the resource if a higher priority script is using it
+
+        0 means commands are skipped if the resource is not available, None means waiting until it is released.
+        """
+        self._resource_timeout = timeout
 
     @property
     def is_stop_requested(self):
         return self._script.is_stop_requested
 
-    def try_take_resource(self):
+    def try_take_resource(self, on_taken_away=lambda: None):
         self.check_terminated()
-        return self._resource.request()
+        resource = self._resource.request(self._resource_timeout, self._script.wait_for, on_taken_away)
+        if resource:
+            self._used = True
+        return resource
+
+    def stop_if_used(self):
+        """Stop the actuator if the script has used it, e.g. after the script was removed"""
+        if self._used:
+            self._used = False
+            resource = self._resource.request()
+            if resource:
+                try:
+                    resource.run_uninterruptable(self._stop_actuator)
+                finally:
+                    resource.release()
+
+    def _stop_actuator(self):
+        pass
 
     def sleep(self, s):
         self._script.sleep(s)
 
+    def wait_for(self, condition, predicate, timeout=None):
+        return self._script.wait_for(condition, predicate, timeout)
+
+    def wait_for_movement(self, resource, condition, is_moving):
+        """Wait until the started movement finishes or the resource is taken away"""
+        if condition is None:
+            return
+
+        self.wait_for(condition, lambda: resource.is_interrupted or is_moving(), self.movement_start_timeout)
+        while not self.wait_for(condition, lambda: resource.is_interrupted or not is_moving(),
+                                self.movement_check_interval):
+            pass
+
     def check_terminated(self):
         if self.is_stop_requested:
             raise InterruptedError
@@ -58,17 +107,27 @@ class SensorPortWrapper(Wrapper):
     def configure(self, config_name):
         self.using_resource(lambda: self._sensor.configure(config_name))
 
+    def _wait_for_data(self):
+        self.check_terminated()
+        if not self.wait_for(self._sensor.status_changed, lambda: self._sensor.has_data, 2):
+            raise TimeoutError
+
+        self.check_terminated()
+
     def read(self):
         """Return the last converted value"""
-        start = time.time()
-        while not self._sensor.has_data:
-            self.check_terminated()
-            self.sleep(0.1)
-            if time.time() - start > 2:
-                raise TimeoutError
+        self._wait_for_data()
+        return self._sensor.value
+
+    def read_filtered(self, method='median'):
+        """Return the last value smoothed by a median ('median') or exponential moving average ('ema') filter"""
+        self._wait_for_data()
+        return self._sensor.filtered_value(method)
 
+    def history(self):
+        """Return the last valid values, oldest first"""
         self.check_terminated()
-        return self._sensor.value
+        return self._sensor.history
 
 
 class RingLedWrapper(Wrapper):
@@ -131,6 +190,45 @@ def rpm2dps(rpm):
 class MotorPortWrapper(Wrapper):
     """Wrapper class to expose motor ports to user scripts"""
     max_rpm = 150
+    max_dps = rpm2dps(max_rpm)
+
+    _direction_signs = {
+        MotorConstants.DIRECTION_FWD: 1,
+        MotorConstants.DIRECTION_BACK: -1,
+    }
+
+    # (unit of amount, unit of limit) -> fn(motor, sign, amount, limit)
+    _move_fns = {
+        (MotorConstants.UNIT_DEG, MotorConstants.UNIT_SPEED_RPM):
+            lambda motor, sign, amount, limit: motor.set_position(sign * amount, speed_limit=rpm2dps(limit),
+                                                                  pos_type='relative'),
+        (MotorConstants.UNIT_DEG, MotorConstants.UNIT_SPEED_PWR):
+            lambda motor, sign, amount, limit: motor.set_position(sign * amount, power_limit=limit,
+                                                                  pos_type='relative'),
+        (MotorConstants.UNIT_ROT, MotorConstants.UNIT_SPEED_RPM):
+            lambda motor, sign, amount, limit: motor.set_position(sign * 360 * amount, speed_limit=rpm2dps(limit),
+                                                                  pos_type='relative'),
+        (MotorConstants.UNIT_ROT, MotorConstants.UNIT_SPEED_PWR):
+            lambda motor, sign, amount, limit: motor.set_position(sign * 360 * amount, power_limit=limit,
+                                                                  pos_type='relative'),
+        (MotorConstants.UNIT_SEC, MotorConstants.UNIT_SPEED_RPM):
+            lambda motor, sign, amount, limit: motor.set_speed(rpm2dps(sign * limit)),
+        (MotorConstants.UNIT_SEC, MotorConstants.UNIT_SPEED_PWR):
+            lambda motor, sign, amount, limit: motor.set_speed(sign * MotorPortWrapper.max_dps, power_limit=limit),
+    }
+
+    # unit of rotation -> fn(motor, sign, rotation)
+    _spin_fns = {
+        MotorConstants.UNIT_SPEED_RPM:
+            lambda motor, sign, rotation: motor.set_speed(rpm2dps(sign * rotation)),
+        MotorConstants.UNIT_SPEED_PWR:
+            lambda motor, sign, rotation: motor.set_speed(sign * MotorPortWrapper.max_dps, power_limit=rotation),
+    }
+
+    _stop_fns = {
+        MotorConstants.ACTION_STOP_AND_HOLD: lambda motor: motor.set_speed(0),
+        MotorConstants.ACTION_RELEASE: lambda motor: motor.set_power(0),
+    }
 
     def __init__(self, script, motor: PortInstance, resource):
         super().__init__(script, resource)
@@ -140,211 +238,156 @@ class MotorPortWrapper(Wrapper):
         self._motor.configure(config_name)
 
     def move(self, direction, amount, unit_amount, limit, unit_limit):
-        set_fns = {
-            MotorConstants.UNIT_DEG: {
-                MotorConstants.UNIT_SPEED_RPM: {
-                    MotorConstants.DIRECTION_FWD: lambda: self._motor.set_position(amount,
-                                                                                   speed_limit=rpm2dps(limit),
-                                                                                   pos_type='relative'),
-                    MotorConstants.DIRECTION_BACK: lambda: self._motor.set_position(-amount,
-                                                                                    speed_limit=rpm2dps(limit),
-                                                                                    pos_type='relative'),
-                },
-                MotorConstants.UNIT_SPEED_PWR: {
-                    MotorConstants.DIRECTION_FWD: lambda: self._motor.set_position(amount, power_limit=limit,
-                                                                                   pos_type='relative'),
-                    MotorConstants.DIRECTION_BACK: lambda: self._motor.set_position(-amount, power_limit=limit,
-                                                                                    pos_type='relative')
-                }
-            },
-
-            MotorConstants.UNIT_ROT: {
-                MotorConstants.UNIT_SPEED_RPM: {
-                    MotorConstants.DIRECTION_FWD: lambda: self._motor.set_position(360 * amount,
-                                                                                   speed_limit=rpm2dps(limit),
-                                                                                   pos_type='relative'),
-                    MotorConstants.DIRECTION_BACK: lambda: self._motor.set_position(-360 * amount,
-                                                                                    speed_limit=rpm2dps(limit),
-                                                                                    pos_type='relative'),
-                },
-                MotorConstants.UNIT_SPEED_PWR: {
-                    MotorConstants.DIRECTION_FWD: lambda: self._motor.set_position(360 * amount,
-                                                                                   power_limit=limit,
-                                                                                   pos_type='relative'),
-                    MotorConstants.DIRECTION_BACK: lambda: self._motor.set_position(-360 * amount,
-                                                                                    power_limit=limit,
-                                                                                    pos_type='relative')
-                }
-            },
-
-            MotorConstants.UNIT_SEC: {
-                MotorConstants.UNIT_SPEED_RPM: {
-                    MotorConstants.DIRECTION_FWD: lambda: self._motor.set_speed(rpm2dps(limit)),
-                    MotorConstants.DIRECTION_BACK: lambda: self._motor.set_speed(rpm2dps(-limit)),
-                },
-                MotorConstants.UNIT_SPEED_PWR: {
-                    MotorConstants.DIRECTION_FWD: lambda: self._motor.set_speed(rpm2dps(self.max_rpm),
-                                                                                power_limit=limit),
-                    MotorConstants.DIRECTION_BACK: lambda: self._motor.set_speed(rpm2dps(-self.max_rpm),
-                                                                                 power_limit=limit),
-                }
-            }
-        }
+        set_fn = self._move_fns[(unit_amount, unit_limit)]
+        sign = self._direction_signs[direction]
+        motor = self._motor
 
         resource = self.try_take_resource()
         if resource:
             try:
-                resource.run_uninterruptable(set_fns[unit_amount][unit_limit][direction])
+                resource.run_uninterruptable(lambda: set_fn(motor, sign, amount, limit))
 
                 if unit_amount in [MotorConstants.UNIT_ROT, MotorConstants.UNIT_DEG]:
-                    # wait for movement to finish
-                    self.sleep(0.2)
-                    while not resource.is_interrupted and self._motor.is_moving:
-                        self.sleep(0.2)
+                    self.wait_for_movement(resource, motor.status_changed, lambda: motor.is_moving)
 
                 elif unit_amount == MotorConstants.UNIT_SEC:
                     self.sleep(amount)
-                    resource.run_uninterruptable(lambda: self._motor.set_speed(0))
+                    resource.run_uninterruptable(lambda: motor.set_speed(0))
 
             finally:
                 resource.release()
 
     def spin(self, direction, rotation, unit_rotation):
-        # start moving depending on limits
-        set_speed_fns = {
-            MotorConstants.UNIT_SPEED_RPM: {
-                MotorConstants.DIRECTION_FWD: lambda: self._motor.set_speed(rpm2dps(rotation)),
-                MotorConstants.DIRECTION_BACK: lambda: self._motor.set_speed(rpm2dps(-rotation))
-            },
-            MotorConstants.UNIT_SPEED_PWR: {
-                MotorConstants.DIRECTION_FWD: lambda: self._motor.set_speed(rpm2dps(self.max_rpm),
-                                                                            power_limit=rotation),
-                MotorConstants.DIRECTION_BACK: lambda: self._motor.set_speed(rpm2dps(-self.max_rpm),
-                                                                             power_limit=rotation)
-            }
-        }
-
-        self.using_resource(set_speed_fns[unit_rotation][direction])
+        set_fn = self._spin_fns[unit_rotation]
+        sign = self._direction_signs[direction]
+
+        self.using_resource(lambda: set_fn(self._motor, sign, rotation))
 
     def stop(self, action):
-        stop_fn = {
-            MotorConstants.ACTION_STOP_AND_HOLD: lambda: self._motor.set_speed(0),
-            MotorConstants.ACTION_RELEASE: lambda: self._motor.set_power(0),
-        }
-        self.using_resource(stop_fn[action])
+        stop_fn = self._stop_fns[action]
+        self.using_resource(lambda: stop_fn(self._motor))
+
+    def _stop_actuator(self):
+        self._motor.set_power(0)
 
 
 class DriveTrainWrapper(Wrapper):
     max_rpm = 150
+    max_dps = rpm2dps(max_rpm)
+
+    _direction_signs = {
+        MotorConstants.DIRECTION_FWD: 1,
+        MotorConstants.DIRECTION_BACK: -1,
+    }
+
+    # (unit of rotation, unit of speed) -> fn(drivetrain, sign, rotation, speed)
+    # timed drives keep the heading using the IMU, movements with a distance are controlled by the MCU
+    _drive_fns = {
+        (MotorConstants.UNIT_ROT, MotorConstants.UNIT_SPEED_RPM):
+            lambda drivetrain, sign, rotation, speed: drivetrain.move(
+                360 * rotation * sign,
+                360 * rotation * sign,
+                left_speed=rpm2dps(speed),
+                right_speed=rpm2dps(speed)),
+        (MotorConstants.UNIT_ROT, MotorConstants.UNIT_SPEED_PWR):
+            lambda drivetrain, sign, rotation, speed: drivetrain.move(
+                360 * rotation * sign,
+                360 * rotation * sign,
+                power_limit=speed),
+        (MotorConstants.UNIT_SEC, MotorConstants.UNIT_SPEED_RPM):
+            lambda drivetrain, sign, rotation, speed: drivetrain.hold_heading(
+                rpm2dps(speed) * sign,
+                rpm2dps(speed) * sign),
+        (MotorConstants.UNIT_SEC, MotorConstants.UNIT_SPEED_PWR):
+            lambda drivetrain, sign, rotation, speed: drivetrain.hold_heading(
+                DriveTrainWrapper.max_dps * sign,
+                DriveTrainWrapper.max_dps * sign,
+                power_limit=speed),
+    }
+
+    # direction -> (left side sign, right side sign, turn sign), +ve turn angle means CCW turn
+    _turn_signs = {
+        MotorConstants.DIRECTION_LEFT: (-1, 1, 1),
+        MotorConstants.DIRECTION_RIGHT: (1, -1, -1),
+    }
+
+    # (unit of rotation, unit of speed) -> fn(drivetrain, signs, rotation, speed)
+    _turn_fns = {
+        (MotorConstants.UNIT_SEC, MotorConstants.UNIT_SPEED_RPM):
+            lambda drivetrain, signs, rotation, speed: drivetrain.set_speeds(
+                rpm2dps(speed) * signs[0],
+                rpm2dps(speed) * signs[1]),
+        (MotorConstants.UNIT_SEC, MotorConstants.UNIT_SPEED_PWR):
+            lambda drivetrain, signs, rotation, speed: drivetrain.set_speeds(
+                DriveTrainWrapper.max_dps * signs[0],
+                DriveTrainWrapper.max_dps * signs[1],
+                power_limit=speed),
+        (MotorConstants.UNIT_TURN_ANGLE, MotorConstants.UNIT_SPEED_RPM):
+            lambda drivetrain, signs, rotation, speed: drivetrain.turn(
+                rotation * signs[2],
+                rpm2dps(speed)),
+        (MotorConstants.UNIT_TURN_ANGLE, MotorConstants.UNIT_SPEED_PWR):
+            lambda drivetrain, signs, rotation, speed: drivetrain.turn(
+                rotation * signs[2],
+                DriveTrainWrapper.max_dps,
+                power_limit=speed),
+    }
 
     def __init__(self, script, drivetrain, resource):
         super().__init__(script, resource)
         self._drivetrain = drivetrain
 
-    def drive(self, direction, rotation, unit_rotation, speed, unit_speed):
-        multipliers = {
-            MotorConstants.DIRECTION_FWD:   1,
-            MotorConstants.DIRECTION_BACK: -1,
-        }
-
-        set_fns = {
-            MotorConstants.UNIT_ROT: {
-                MotorConstants.UNIT_SPEED_RPM: lambda: self._drivetrain.move(
-                    360 * rotation * multipliers[direction],
-                    360 * rotation * multipliers[direction],
-                    left_speed=rpm2dps(speed),
-                    right_speed=rpm2dps(speed)),
-
-                MotorConstants.UNIT_SPEED_PWR: lambda: self._drivetrain.move(
-                    360 * rotation * multipliers[direction],
-                    360 * rotation * multipliers[direction],
-                    power_limit=speed)
-            },
-            MotorConstants.UNIT_SEC: {
-                MotorConstants.UNIT_SPEED_RPM: lambda: self._drivetrain.set_speeds(
-                    rpm2dps(speed) * multipliers[direction],
-                    rpm2dps(speed) * multipliers[direction]),
-
-                MotorConstants.UNIT_SPEED_PWR: lambda: self._drivetrain.set_speeds(
-                    rpm2dps(self.max_rpm) * multipliers[direction],
-                    rpm2dps(self.max_rpm) * multipliers[direction],
-                    power_limit=speed)
-            }
-        }
-
-        resource = self.try_take_resource()
-        if resource:
-            try:
-                resource.run_uninterruptable(set_fns[unit_rotation][unit_speed])
+    @classmethod
+    def drive_command(cls, drivetrain, direction, rotation, unit_rotation, speed, unit_speed):
+        """Function that starts the drive movement and whether the movement is positional"""
+        set_fn = cls._drive_fns[(unit_rotation, unit_speed)]
+        sign = cls._direction_signs[direction]
 
-                if unit_rotation == MotorConstants.UNIT_ROT:
-                    # wait for movement to finish
-                    self.sleep(0.2)
-                    while not resource.is_interrupted and self._drivetrain.is_moving:
-                        self.sleep(0.2)
+        return lambda: set_fn(drivetrain, sign, rotation, speed), unit_rotation == MotorConstants.UNIT_ROT
 
-                elif unit_rotation == MotorConstants.UNIT_SEC:
-                    self.sleep(rotation)
+    @classmethod
+    def turn_command(cls, drivetrain, direction, rotation, unit_rotation, speed, unit_speed):
+        """Function that starts the turn movement and whether the movement is positional"""
+        set_fn = cls._turn_fns[(unit_rotation, unit_speed)]
+        signs = cls._turn_signs[direction]
 
-                    resource.run_uninterruptable(lambda: self._drivetrain.set_speeds(0, 0))
+        return lambda: set_fn(drivetrain, signs, rotation, speed), unit_rotation == MotorConstants.UNIT_TURN_ANGLE
 
-            finally:
-                resource.release()
+    def drive(self, direction, rotation, unit_rotation, speed, unit_speed):
+        command, is_positional = self.drive_command(self._drivetrain, direction, rotation, unit_rotation, speed,
+                                                    unit_speed)
+        self._run_movement(command, rotation, is_positional)
 
     def turn(self, direction, rotation, unit_rotation, speed, unit_speed):
-        left_multipliers = {
-            MotorConstants.DIRECTION_LEFT: -1,
-            MotorConstants.DIRECTION_RIGHT: 1,
-        }
-        right_multipliers = {
-            MotorConstants.DIRECTION_LEFT:  1,
-            MotorConstants.DIRECTION_RIGHT: -1,
-        }
-        turn_multipliers = {
-            MotorConstants.DIRECTION_LEFT:  1,  # +ve number -> CCW turn
-            MotorConstants.DIRECTION_RIGHT: -1,  # -ve number -> CW turn
-        }
-
-        set_fns = {
-            MotorConstants.UNIT_SEC: {
-                MotorConstants.UNIT_SPEED_RPM: lambda: self._drivetrain.set_speeds(
-                    rpm2dps(speed) * left_multipliers[direction],
-                    rpm2dps(speed) * right_multipliers[direction]),
-
-                MotorConstants.UNIT_SPEED_PWR: lambda: self._drivetrain.set_speeds(
-                    rpm2dps(self.max_rpm) * left_multipliers[direction],
-                    rpm2dps(self.max_rpm) * right_multipliers[direction],
-                    power_limit=speed)
-            },
-            MotorConstants.UNIT_TURN_ANGLE: {
-                MotorConstants.UNIT_SPEED_RPM: lambda: self._drivetrain.turn(
-                    rotation * turn_multipliers[direction],
-                    rpm2dps(speed)),
-
-                MotorConstants.UNIT_SPEED_PWR: lambda: self._drivetrain.turn(
-                    rotation * turn_multipliers[direction],
-                    rpm2dps(self.max_rpm),
-                    power_limit=speed)
-            }
-        }
+        command, is_positional = self.turn_command(self._drivetrain, direction, rotation, unit_rotation, speed,
+                                                   unit_speed)
+        self._run_movement(command, rotation, is_positional)
 
-        resource = self.try_take_resource()
+    def _run_movement(self, set_fn, rotation, is_positional):
+        """Start a movement and wait for it to finish, timed movements are stopped after rotation seconds"""
+        drivetrain = self._drivetrain
+        heading_hold = None
+
+        def _release_heading():
+            # the hold keeps sending speeds, it must not outlive the movement even if the stop command is skipped
+            if heading_hold is not None:
+                drivetrain.release_heading(heading_hold)
+
+        resource = self.try_take_resource(_release_heading)
         if resource:
             try:
-                resource.run_uninterruptable(set_fns[unit_rotation][unit_speed])
+                heading_hold = resource.run_uninterruptable(set_fn)
 
-                if unit_rotation == MotorConstants.UNIT_TURN_ANGLE:
-                    # wait for movement to finish
-                    self.sleep(0.2)
-                    while not resource.is_interrupted and self._drivetrain.is_moving:
-                        self.sleep(0.2)
+                if is_positional:
+                    self.wait_for_movement(resource, drivetrain.status_changed, lambda: drivetrain.is_moving)
 
-                elif unit_rotation == MotorConstants.UNIT_SEC:
+                else:
                     self.sleep(rotation)
 
-                    resource.run_uninterruptable(lambda: self._drivetrain.set_speeds(0, 0))
+                    resource.run_uninterruptable(lambda: drivetrain.set_speeds(0, 0))
 
             finally:
+                _release_heading()
                 resource.release()
 
     def set_speeds(self, sl, sr):
@@ -356,6 +399,223 @@ class DriveTrainWrapper(Wrapper):
                 if sl == sr == 0:
                     resource.release()
 
+    def _stop_actuator(self):
+        self._drivetrain.set_speeds(0, 0)
+
+
+class MotionHandle:
+    """Result of a queued movement that can be waited for"""
+
+    def __init__(self, queue):
+        self._queue = queue
+        self._done = False
+        self._cancelled = False
+
+    @property
+    def done(self):
+        return self._done
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def wait(self, timeout=None):
+        """Wait until the movement finishes or is cancelled, returns False on timeout"""
+        return self._queue.wait_for(lambda: self._done, timeout)
+
+    def finish(self, cancelled=False):
+        self._cancelled = cancelled
+        self._done = True
+
+
+class MotionQueue:
+    """
+    Drivetrain movements that are sent to the MCU back-to-back by a background executor
+
+    drive and turn accept the same arguments as DriveTrainWrapper but return a MotionHandle immediately. The drivetrain
+    resource is held while there are movements in the queue. Movements are cancelled when the resource is taken away
+    or the script is stopped.
+    """
+
+    def __init__(self, script, drivetrain, resource: ResourceWrapper):
+        self._script = script
+        self._drivetrain = drivetrain
+        self._resource = resource
+        self._changed = Condition()
+        self._cancel_event = Event()
+        self._steps = deque()
+        self._executor = None
+        self._heading_hold = None
+
+        # the stop request of a run is cleared when the run ends, movements queued by it are cancelled explicitly
+        script.on_stop_requested(self.cancel)
+
+    @property
+    def is_idle(self):
+        """True if no movement is running or waiting in the queue"""
+        return self._executor is None
+
+    def drive(self, direction, rotation, unit_rotation, speed, unit_speed):
+        command, is_positional = DriveTrainWrapper.drive_command(self._drivetrain, direction, rotation, unit_rotation,
+                                                                 speed, unit_speed)
+        return self._enqueue(command, rotation, is_positional)
+
+    def turn(self, direction, rotation, unit_rotation, speed, unit_speed):
+        command, is_positional = DriveTrainWrapper.turn_command(self._drivetrain, direction, rotation, unit_rotation,
+                                                                speed, unit_speed)
+        return self._enqueue(command, rotation, is_positional)
+
+    def set_speeds(self, sl, sr, duration):
+        """Drive with the given wheel speeds (in dps) for duration seconds"""
+        return self._enqueue(lambda: self._drivetrain.set_speeds(sl, sr), duration, False)
+
+    def wait(self, timeout=None):
+        """Wait until every queued movement finishes, returns False on timeout"""
+        return self.wait_for(lambda: self._executor is None, timeout)
+
+    def wait_for(self, predicate, timeout=None):
+        return self._script.wait_for(self._changed, predicate, timeout)
+
+    def cancel(self):
+        """Cancel the queued movements and stop the current one"""
+        with self._changed:
+            if self._executor is None:
+                return
+
+            self._cancel_pending()
+            self._cancel_event.set()
+
+        condition = self._drivetrain.status_changed
+        if condition is not None:
+            with condition:
+                condition.notify_all()
+
+    def _enqueue(self, command, duration, is_positional):
+        if self._script.is_stop_requested:
+            raise InterruptedError
+
+        handle = MotionHandle(self)
+        with self._changed:
+            self._steps.append((command, duration, is_positional, handle))
+            if self._executor is None:
+                self._executor = Thread(target=self._execute, name='MotionQueue', daemon=True)
+                self._executor.start()
+
+        return handle
+
+    def _cancel_pending(self):
+        while self._steps:
+            self._steps.popleft()[3].finish(cancelled=True)
+        self._changed.notify_all()
+
+    def _is_aborted(self, resource):
+        return resource is None or resource.is_interrupted or self._script.is_stop_requested
+
+    def _is_cancelled(self, resource):
+        return self._cancel_event.is_set() or self._is_aborted(resource)
+
+    def _wait_for_movement(self, resource):
+        condition = self._drivetrain.status_changed
+        if condition is not None:
+            with condition:
+                condition.wait_for(lambda: self._is_cancelled(resource) or self._drivetrain.is_moving,
+                                   Wrapper.movement_start_timeout)
+                while not condition.wait_for(lambda: self._is_cancelled(resource) or not self._drivetrain.is_moving,
+                                             Wrapper.movement_check_interval):
+                    pass
+
+        return not self._is_cancelled(resource)
+
+    def _wait_for_duration(self, resource, duration):
+        end = time.time() + duration
+        while not self._is_cancelled(resource):
+            remaining = end - time.time()
+            if remaining <= 0:
+                return True
+            self._cancel_event.wait(min(remaining, Wrapper.movement_check_interval))
+
+        return False
+
+    def _take_step(self, resource):
+        """The next queued movement, None if the queue is empty or the movements are aborted"""
+        with self._changed:
+            if self._is_aborted(resource):
+                self._cancel_pending()
+
+            if not self._steps:
+                return None
+
+            self._cancel_event.clear()
+            return self._steps.popleft()
+
+    def _run_step(self, resource, command, duration, is_positional, handle):
+        """Run a movement, returns whether the drivetrain needs to be stopped if no other movement follows"""
+        completed = False
+        try:
+            self._heading_hold = resource.run_uninterruptable(command)
+            if is_positional:
+                completed = self._wait_for_movement(resource)
+            else:
+                completed = self._wait_for_duration(resource, duration)
+        finally:
+            self._release_heading()
+            with self._changed:
+                handle.finish(cancelled=not completed)
+                self._changed.notify_all()
+
+        # timed movements are followed directly by the next one, the drivetrain is stopped at the end
+        return not (is_positional and completed)
+
+    def _release_heading(self):
+        # timed drives hold the heading, the hold must not outlive the movement
+        heading_hold = self._heading_hold
+        if heading_hold is not None:
+            self._heading_hold = None
+            self._drivetrain.release_heading(heading_hold)
+
+    def _execute(self):
+        resource = self._resource.request(on_taken_away=self._release_heading)
+        stop_drivetrain = False
+        try:
+            while True:
+                step = self._take_step(resource)
+                if step is not None:
+                    stop_drivetrain = self._run_step(resource, *step)
+                    continue
+
+                # the stop command is sent without holding the lock, movements queued in the meantime are run next
+                if stop_drivetrain:
+                    stop_drivetrain = False
+                    resource.run_uninterruptable(lambda: self._drivetrain.set_speeds(0, 0))
+
+                if self._finish_execution(resource):
+                    return
+        except Exception:
+            print(traceback.format_exc())
+            with self._changed:
+                self._cancel_pending()
+            try:
+                if resource is not None:
+                    resource.run_uninterruptable(lambda: self._drivetrain.set_speeds(0, 0))
+            finally:
+                self._finish_execution(resource, force=True)
+
+    def _finish_execution(self, resource, force=False):
+        """Release the resource if the queue is empty or aborted, returns False if there are movements to run"""
+        with self._changed:
+            if self._steps and not (force or self._is_aborted(resource)):
+                return False
+
+            self._cancel_pending()
+            try:
+                if resource is not None:
+                    resource.release()
+            finally:
+                self._executor = None
+                self._changed.notify_all()
+
+            return True
+
 
 class SoundWrapper(Wrapper):
     def __init__(self, script, sound, resource):
@@ -390,6 +650,7 @@ class RobotInterface:
         self._sound = SoundWrapper(script, robot.sound, resources['sound'])
         self._ring_led = RingLedWrapper(script, robot.led_ring, resources['led_ring'])
         self._drivetrain = DriveTrainWrapper(script, robot.drivetrain, resources['drivetrain'])
+        self._motion = MotionQueue(script, robot.drivetrain, resources['drivetrain'])
 
         self._script = script
 
@@ -401,6 +662,13 @@ class RobotInterface:
 
         self.imu = robot.imu
 
+    def stop_actuators(self):
+        """Stop the motors and the drivetrain that the script has used, queued movements are cancelled"""
+        self._motion.cancel()
+        for motor in self._motors:
+            motor.stop_if_used()
+        self._drivetrain.stop_if_used()
+
     def stop_all_motors(self, action):
         for motor in self._motors:
             motor.stop(action)
@@ -421,6 +689,10 @@ class RobotInterface:
     def drivetrain(self):
         return self._drivetrain
 
+    @property
+    def motion(self):
+        return self._motion
+
     def play_note(self): pass  # TODO
 
     def time(self):
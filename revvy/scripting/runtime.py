@@ -1,6 +1,7 @@
 # SPDX-License-Identifier: GPL-3.0-only
 
 from revvy.scripting.robot_interface import RobotInterface
+from revvy.scripting.script_cache import ScriptCache
 from revvy.thread_wrapper import *
 import time
 
@@ -11,23 +12,80 @@ class TimeWrapper:
         self.sleep = ctx.sleep
 
 
+class InputChannel:
+    """
+    Holds the latest input value of a streaming script, values that were not taken in time are overwritten
+
+    The channel has a reader between open() and close(), or until a take() times out. push() returns whether there is
+    a reader, if not, the value is kept for the next run of the script.
+    """
+
+    def __init__(self):
+        self._condition = Condition()
+        self._value = None
+        self._has_value = False
+        self._has_reader = False
+
+    def push(self, value):
+        with self._condition:
+            self._value = value
+            self._has_value = True
+            self._condition.notify_all()
+            return self._has_reader
+
+    def take(self, wait_for, timeout=None):
+        """Wait for a new value using wait_for(condition, predicate, timeout), returns None on timeout"""
+        wait_for(self._condition, lambda: self._has_value, timeout)
+
+        # checked under the same lock as push() so a value that arrives while timing out is not lost
+        with self._condition:
+            if not self._has_value:
+                self._has_reader = False
+                return None
+
+            self._has_value = False
+            return self._value
+
+    def open(self):
+        with self._condition:
+            self._has_reader = True
+
+    def close(self):
+        """Mark the reader as gone, returns True if a value is waiting to be taken"""
+        with self._condition:
+            self._has_reader = False
+            return self._has_value
+
+
 class ScriptHandle:
-    def __init__(self, owner, script, name, global_variables: dict):
+    def __init__(self, owner, script, name, global_variables: dict, pool: WorkerPool, priority=0):
         self._owner = owner
         self._globals = dict(global_variables)
-        self._thread = ThreadWrapper(self._run, 'ScriptThread: {}'.format(name))
         self._inputs = {}
+        self._stop_requested_callbacks = []
 
-        self.stop = self._thread.stop
-        self.cleanup = self._thread.exit
-        self.on_stopped = self._thread.on_stopped
         self.sleep = lambda s: None
+        self.wait_for = self._wait_for
 
         if callable(script):
             self._runnable = script
         else:
             self._runnable = lambda x: exec(script, x)
 
+        # streaming scripts keep running and consume new inputs from a channel instead of being restarted
+        self._channel = InputChannel() if getattr(script, 'streaming', False) else None
+        self._is_background = False
+
+        # scripts that keep running are not counted towards the pool's limit, they would block the other scripts
+        self._thread = PooledThreadWrapper(pool, self._run, 'ScriptThread: {}'.format(name), priority,
+                                           limited=not self.is_streaming)
+        self.on_stopped = self._thread.on_stopped
+
+    @staticmethod
+    def _wait_for(condition, predicate, timeout=None):
+        with condition:
+            return condition.wait_for(predicate, timeout)
+
     @property
     def is_stop_requested(self):
         return self._thread.stopping
@@ -36,11 +94,52 @@ class ScriptHandle:
     def is_running(self):
         return self._thread.is_running
 
+    @property
+    def is_streaming(self):
+        return self._channel is not None
+
+    @property
+    def is_background(self):
+        """Background scripts usually run until they are stopped, so they are not limited by the pool"""
+        return self._is_background
+
+    @is_background.setter
+    def is_background(self, value):
+        self._is_background = value
+        self._thread.limited = not (value or self.is_streaming)
+
+    def on_stop_requested(self, callback):
+        """callback is called every time the script is stopped, whether or not it is running"""
+        self._stop_requested_callbacks.append(callback)
+
+    def stop(self):
+        evt = self._thread.stop()
+        for callback in self._stop_requested_callbacks:
+            callback()
+
+        return evt
+
+    def cleanup(self, timeout=None):
+        self.stop()
+        return self._thread.exit(timeout)
+
     def assign(self, name, value):
         self._globals[name] = value
 
+    def push_input(self, values):
+        """Pass new input values to the script, starting it if needed"""
+        if self._channel is None:
+            self.start({'input': values})
+        else:
+            # starting a running script runs it again when the current run ends
+            if not self._channel.push(values) or self._thread.stopping:
+                self._thread.start()
+
     def _run(self, ctx):
         try:
+            if self._channel is not None:
+                self._channel.open()
+
             # script control interface
             def _terminate():
                 self.stop()
@@ -50,9 +149,11 @@ class ScriptHandle:
             ctx.terminate_all = self._owner.stop_all_scripts
 
             self.sleep = ctx.sleep
+            self.wait_for = ctx.wait_for
             self._runnable({
                 **self._globals,
                 **self._inputs,
+                'input_channel': self._channel,
                 'Control': ctx,
                 'ctx': ctx,
                 'time': TimeWrapper(ctx)
@@ -60,6 +161,11 @@ class ScriptHandle:
         finally:
             self._thread_ctx = None
             self.sleep = lambda s: None
+            self.wait_for = self._wait_for
+
+            # a value pushed while the script was finishing is handled by the next run
+            if self._channel is not None and self._channel.close() and not ctx.stop_requested:
+                self._thread.start()
 
     def start(self, variables=None):
         if variables is not None:
@@ -70,19 +176,29 @@ class ScriptHandle:
 
 
 class ScriptManager:
-    def __init__(self, robot):
+    # maximum number of scripts with the same priority that run at the same time, background and streaming scripts
+    # are not counted
+    max_running_per_priority = 8
+
+    # time in seconds to wait for stopping scripts before reporting the ones still running
+    stop_timeout = 5
+
+    def __init__(self, robot, script_cache: ScriptCache = None):
         self._robot = robot
         self._globals = {}
         self._scripts = {}
+        self._interfaces = {}
+        self._pool = WorkerPool(self.max_running_per_priority, name='ScriptWorker')
+        self._script_cache = script_cache if script_cache is not None else ScriptCache()
 
     def reset(self):
         print('ScriptManager: stopping scripts')
-        for script in self._scripts:
-            self._scripts[script].cleanup()
+        self._shut_down(list(self._scripts))
 
         print('ScriptManager: resetting state')
         self._globals.clear()
         self._scripts.clear()
+        self._interfaces.clear()
 
     def assign(self, name, value):
         self._globals[name] = value
@@ -90,20 +206,68 @@ class ScriptManager:
             self._scripts[script].assign(name, value)
 
     def add_script(self, name, script, priority=0):
+        if not callable(script):
+            # compile before creating the handle so syntax errors surface when the script is added
+            script = self._script_cache.get(script)
+
         if name in self._scripts:
             print('ScriptManager: Stopping {} before overriding'.format(name))
-            self._scripts[name].cleanup()
+            self._scripts[name].cleanup(timeout=self.stop_timeout)
 
         print('ScriptManager: New script: {}'.format(name))
-        script = ScriptHandle(self, script, name, self._globals)
+        script = ScriptHandle(self, script, name, self._globals, self._pool, priority)
         try:
             robot = self._robot
-            script.assign('robot', RobotInterface(script, robot.robot, robot.config, robot.resources, priority))
+            interface = RobotInterface(script, robot.robot, robot.config, robot.resources, priority)
+            script.assign('robot', interface)
             self._scripts[name] = script
+            self._interfaces[name] = interface
         except Exception:
             script.cleanup()
             raise
 
+    def remove_script(self, name):
+        self.remove_scripts([name])
+
+    def remove_scripts(self, names):
+        """Stop and remove the given scripts, the motors and drivetrain they have used are stopped"""
+        names = [name for name in names if name in self._scripts]
+        for name in names:
+            print('ScriptManager: Removing {}'.format(name))
+
+        self._shut_down(names)
+        for name in names:
+            del self._scripts[name]
+            self._interfaces.pop(name).stop_actuators()
+
+    def _shut_down(self, names):
+        """
+        Stop the given scripts together and release their threads
+
+        Stop is requested from every script first, then all of them are waited for with a common deadline so the
+        shutdown takes as long as the slowest script instead of the sum of all of them. Scripts that don't stop by the
+        deadline are reported and released without waiting for them.
+        """
+        stopped = {name: self._scripts[name].stop() for name in names}
+
+        deadline = time.time() + self.stop_timeout
+        stragglers = [name for name, evt in stopped.items() if not evt.wait(max(0.0, deadline - time.time()))]
+        if stragglers:
+            print('ScriptManager: scripts did not stop in {}s: {}'.format(self.stop_timeout, ', '.join(stragglers)))
+
+        # the stragglers are left to finish on their own, waiting for them could block forever
+        for name in names:
+            self._scripts[name].cleanup(timeout=0 if name in stragglers else None)
+
+        return stragglers
+
+    @property
+    def names(self):
+        return list(self._scripts.keys())
+
+    def __contains__(self, name):
+        return name in self._scripts
+
     def __getitem__(self, name):
         return self._scripts[name]
 
@@ -0,0 +1,87 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import marshal
+from collections import OrderedDict
+from importlib.util import MAGIC_NUMBER
+from threading import Lock
+
+from revvy.file_storage import StorageInterface, StorageError
+from revvy.functions import bytestr_hash
+
+
+class ScriptCache:
+    """
+    Compiles script sources once, keyed by the hash of their content
+
+    At most max_entries compiled scripts are kept, the least recently used ones are dropped first. When a storage is
+    given, the compiled code of the active configuration's scripts can be persisted so they
+    don't need to be compiled again after a restart.
+    """
+
+    def __init__(self, storage: StorageInterface = None, name='script-cache', max_entries=64):
+        self._storage = storage
+        self._name = name
+        self._max_entries = max_entries
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self._persisted_keys = set()
+
+        self._load()
+
+    @staticmethod
+    def _key(source):
+        return bytestr_hash(source.encode('utf-8'))
+
+    def _load(self):
+        if self._storage is None:
+            return
+
+        try:
+            if self._storage.read_metadata(self._name).get('magic') != MAGIC_NUMBER.hex():
+                print('ScriptCache: stored cache was created by a different Python version')
+                return
+
+            entries = marshal.loads(self._storage.read(self._name))
+            self._entries.update(entries)
+            self._persisted_keys = set(entries.keys())
+            print('ScriptCache: loaded {} compiled scripts'.format(len(entries)))
+        except (StorageError, EOFError, ValueError, TypeError):
+            print('ScriptCache: no usable stored cache')
+
+    def get(self, source):
+        """Return the compiled code of the source. Raises SyntaxError if the source can't be compiled."""
+        key = self._key(source)
+        with self._lock:
+            code = self._entries.get(key)
+            if code is not None:
+                self._entries.move_to_end(key)
+
+        if code is None:
+            code = compile(source, '<user script>', 'exec')
+            with self._lock:
+                self._entries[key] = code
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+
+        return code
+
+    def persist(self, sources):
+        """Store the compiled code of the given sources, replacing the previously persisted set"""
+        if self._storage is None:
+            return
+
+        keys = {self._key(source) for source in sources}
+        if keys == self._persisted_keys:
+            return
+
+        with self._lock:
+            entries = {key: self._entries[key] for key in keys if key in self._entries}
+
+        try:
+            self._storage.write(self._name, marshal.dumps(entries), metadata={'magic': MAGIC_NUMBER.hex()})
+            self._persisted_keys = set(entries.keys())
+        except IOError:
+            print('ScriptCache: failed to store compiled scripts')
+
+    def __len__(self):
+        return len(self._entries)
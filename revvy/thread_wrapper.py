@@ -2,7 +2,7 @@
 
 import time
 import traceback
-from threading import Event, Thread, Lock
+from threading import Event, Thread, Lock, Condition
 
 
 def _call_callbacks(cb_list):
@@ -127,18 +127,314 @@ class ThreadWrapper:
             callback()
 
 
+class WorkerPool:
+    """
+    Shared worker threads for PooledThreadWrapper tasks
+
+    Worker threads are created when a task is ready to run and no worker is idle. Finished workers stay around to
+    pick up later tasks, up to max_idle_workers, the rest exit. The number of tasks of a given priority that can run
+    at the same time is limited by max_per_priority, further tasks wait in the queue until a slot frees up. Tasks that
+    were stopped before they could start are not limited so that stopping them never has to wait for another task.
+    Tasks that are not expected to finish on their own (e.g. endless loops) should be created with limited=False,
+    they neither take a slot nor wait for one.
+    """
+
+    def __init__(self, max_per_priority=8, max_idle_workers=4, name="WorkerPool"):
+        self._name = name
+        self._max_per_priority = max_per_priority
+        self._max_idle_workers = max_idle_workers
+        self._lock = Lock()
+        self._work_available = Condition(self._lock)
+        self._queue = []
+        self._active = {}
+        self._worker_count = 0
+        self._idle_count = 0
+        self._worker_id = 0
+
+    @property
+    def worker_count(self):
+        return self._worker_count
+
+    def _runnable_tasks(self):
+        """Tasks in the queue that can be started without exceeding the concurrency limit"""
+        active = dict(self._active)
+        runnable = []
+        for task in self._queue:
+            if not task.limited or task.stop_pending or self._max_per_priority is None:
+                runnable.append(task)
+                continue
+
+            count = active.get(task.priority, 0)
+            if count < self._max_per_priority:
+                active[task.priority] = count + 1
+                runnable.append(task)
+        return runnable
+
+    def _dispatch(self):
+        """Wake idle workers or start new ones for the runnable tasks. Must be called with the lock held"""
+        runnable = len(self._runnable_tasks())
+
+        wake = min(runnable, self._idle_count)
+        if wake:
+            # idle count is decremented here so that concurrent dispatches don't count the same workers
+            self._idle_count -= wake
+            self._work_available.notify(wake)
+
+        for _ in range(runnable - wake):
+            self._worker_count += 1
+            self._worker_id += 1
+            Thread(target=self._worker, name='{} {}'.format(self._name, self._worker_id), daemon=True).start()
+
+    def _take_task(self):
+        runnable = self._runnable_tasks()
+        if not runnable:
+            return None
+
+        task = runnable[0]
+        self._queue.remove(task)
+        if task.limited:
+            self._active[task.priority] = self._active.get(task.priority, 0) + 1
+        return task
+
+    def _worker(self):
+        with self._lock:
+            while True:
+                task = self._take_task()
+                if task is None:
+                    if self._idle_count >= self._max_idle_workers:
+                        self._worker_count -= 1
+                        return
+                    self._idle_count += 1
+                    self._work_available.wait()
+                    continue
+
+                # the flag may change while the task runs, the slot that was taken is given back
+                limited = task.limited
+                self._lock.release()
+                try:
+                    task.run()
+                finally:
+                    self._lock.acquire()
+                    if limited:
+                        self._active[task.priority] -= 1
+                    self._dispatch()
+
+    def submit(self, task):
+        with self._lock:
+            self._queue.append(task)
+            self._dispatch()
+
+            if task not in self._runnable_tasks():
+                print('{}: {} waits, {} tasks of priority {} are running'.format(
+                    self._name, task.name, self._active.get(task.priority, 0), task.priority))
+
+    def update(self):
+        """Re-evaluate the queue, e.g. after a queued task was stopped"""
+        with self._lock:
+            self._dispatch()
+
+
+class PooledThreadWrapper:
+    """
+    ThreadWrapper-compatible task that runs on a WorkerPool instead of a dedicated thread
+
+    Each start request runs the function once on a pooled worker. Starting a running task runs it again after the
+    current run finishes. Stopping a task that is waiting in the queue lets it run with the stop already requested.
+    """
+
+    def __init__(self, pool: WorkerPool, func, name="PooledTask", priority=0, limited=True):
+        self._pool = pool
+        self._func = func
+        self._name = name
+        self._priority = priority
+        self._limited = limited
+        self._lock = Lock()
+        self._exiting = False
+        self._stopped_callbacks = []
+        self._stop_requested_callbacks = []
+        self._ctx = None
+        self._pending_ctx = None  # context of the requested next run
+        self._was_started = False
+        self._thread_running_event = Event()
+        self._idle_event = Event()  # set when the task is neither queued nor running
+        self._idle_event.set()
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def priority(self):
+        return self._priority
+
+    @property
+    def limited(self):
+        """True if the task counts towards the concurrency limit of its priority in the pool"""
+        return self._limited
+
+    @limited.setter
+    def limited(self, value):
+        self._limited = value
+        self._pool.update()
+
+    @property
+    def stop_pending(self):
+        """True if the requested next run was stopped before it could start"""
+        ctx = self._pending_ctx
+        return ctx is not None and ctx.stop_requested
+
+    def run(self):
+        """Execute one run, called by the pool"""
+        with self._lock:
+            self._ctx = self._pending_ctx
+            self._pending_ctx = None
+            self._was_started = True
+            self._thread_running_event.set()
+            ctx = self._ctx
+
+        # noinspection PyBroadException
+        try:
+            self._func(ctx)
+        except InterruptedError:
+            print('{}: interrupted'.format(self._name))
+        except Exception:
+            print(traceback.format_exc())
+        finally:
+            with self._lock:
+                print('{}: stopped'.format(self._name))
+                self._thread_running_event.clear()
+                _call_callbacks(self._stopped_callbacks)
+                self._ctx = None
+
+                if self._pending_ctx is not None and not self._exiting:
+                    self._pool.submit(self)
+                else:
+                    self._pending_ctx = None
+                    self._idle_event.set()
+
+    @property
+    def stopping(self):
+        ctx = self._ctx
+        if ctx is None:
+            return False
+        return ctx.stop_requested
+
+    @property
+    def is_running(self):
+        return self._thread_running_event.is_set()
+
+    def start(self):
+        assert not self._exiting
+
+        print("{}: starting".format(self._name))
+        with self._lock:
+            if self._pending_ctx is None:
+                self._pending_ctx = ThreadContext(self)
+                self._idle_event.clear()
+                if self._ctx is None:
+                    self._pool.submit(self)
+
+        return self._thread_running_event
+
+    def stop(self):
+        print("{}: stopping".format(self._name))
+        evt = Event()
+        update_pool = False
+
+        with self._lock:
+            if self._ctx is not None:
+                # register callback that sets event when the run ends
+                self._stopped_callbacks.append(evt.set)
+
+                # request thread to stop
+                self._ctx.stop()
+
+                _call_callbacks(self._stop_requested_callbacks)
+            elif self._pending_ctx is not None:
+                # the run starts with the stop already requested
+                self._stopped_callbacks.append(evt.set)
+                self._pending_ctx.stop()
+                update_pool = True
+            else:
+                evt.set()
+
+        if update_pool:
+            self._pool.update()
+
+        return evt
+
+    def exit(self, timeout=None):
+        """Stop the task and wait for the current run to end, returns False if it did not end in timeout seconds"""
+        print("{}: exiting".format(self._name))
+
+        # stop current run
+        self.stop()
+
+        with self._lock:
+            self._exiting = True
+        if not self._idle_event.wait(timeout):
+            print("{}: did not exit in time".format(self._name))
+            return False
+
+        print("{}: exited".format(self._name))
+        return True
+
+    def on_stopped(self, callback):
+        with self._lock:
+            call = self._was_started and not self._ctx
+            if not call:
+                self._stopped_callbacks.append(callback)
+
+        if call:
+            callback()
+
+    def on_stop_requested(self, callback):
+        with self._lock:
+            call = self._ctx and self._ctx.stop_requested
+            if not call:
+                self._stop_requested_callbacks.append(callback)
+        if call:
+            callback()
+
+
 class ThreadContext:
     def __init__(self, thread: ThreadWrapper):
         self._thread = thread
         self._stop_event = Event()
+        self._waiting_on = None
 
     def stop(self):
         self._stop_event.set()
 
+        # wake up the thread if it waits for a condition
+        condition = self._waiting_on
+        if condition is not None:
+            with condition:
+                condition.notify_all()
+
     def sleep(self, s):
         if self._stop_event.wait(s):
             raise InterruptedError
 
+    def wait_for(self, condition: Condition, predicate, timeout=None):
+        """
+        Wait until predicate returns True, re-evaluating it every time condition is notified
+
+        :return: the last value of predicate, i.e. False if timed out
+        :raises InterruptedError: if the thread is stopped while waiting
+        """
+        with condition:
+            self._waiting_on = condition
+            try:
+                result = condition.wait_for(lambda: self._stop_event.is_set() or predicate(), timeout)
+            finally:
+                self._waiting_on = None
+
+        if self._stop_event.is_set():
+            raise InterruptedError
+
+        return result
+
     @property
     def stop_requested(self):
         return self._stop_event.is_set()
@@ -6,9 +6,13 @@ import signal
 import traceback
 from collections import namedtuple
 
+from revvy.bluetooth.telemetry import TelemetryPublisher, TelemetryFrame, encode_motor_telemetry, \
+    encode_sensor_telemetry, encode_imu_telemetry
 from revvy.file_storage import StorageInterface, StorageError
 from revvy.hardware_dependent.sound import setup_sound_v1, play_sound_v1, setup_sound_v2, play_sound_v2, reset_volume
+from revvy.mcu.error_memory import ErrorHarvester, encode_error_summary
 from revvy.mcu.rrrc_control import RevvyControl, BatteryStatus, Version
+from revvy.robot.controller_log import ControllerRecorder
 from revvy.robot.drivetrain import DifferentialDrivetrain
 from revvy.robot.imu import IMU
 from revvy.robot.remote_controller import RemoteController, RemoteControllerScheduler, create_remote_controller_thread
@@ -19,11 +23,13 @@ from revvy.robot.ports.sensor import create_sensor_port_handler
 from revvy.robot.sound import Sound
 from revvy.robot.status import RobotStatus, RemoteControllerStatus, RobotStatusIndicator
 from revvy.robot.status_updater import McuStatusUpdater, mcu_updater_slots
-from revvy.robot_config import RobotConfig
+from revvy.robot_config import RobotConfig, RobotConfigDiff
+from revvy.scripting.builtin_scripts import builtin_controller_curves
 from revvy.scripting.resource import Resource
 from revvy.scripting.robot_interface import MotorConstants
 from revvy.scripting.runtime import ScriptManager
-from revvy.thread_wrapper import periodic
+from revvy.scripting.script_cache import ScriptCache
+from revvy.thread_wrapper import periodic, ThreadWrapper, ThreadContext
 
 from revvy.mcu.rrrc_transport import *
 
@@ -148,7 +154,7 @@ class Robot:
         for port in self._sensor_ports:
             port.on_config_changed(_sensor_config_changed)
 
-        self._drivetrain = DifferentialDrivetrain(interface, self._motor_ports.port_count)
+        self._drivetrain = DifferentialDrivetrain(interface, self._motor_ports.port_count, self._imu)
 
     @property
     def start_time(self):
@@ -204,6 +210,7 @@ class Robot:
             # motor_status = data[2]
             motor_percentage = data[3]
 
+            # replaced as a whole so readers always see the values of the same update
             self._battery = BatteryStatus(chargerStatus=main_status, main=main_percentage, motor=motor_percentage)
 
         self._status_updater.set_slot(mcu_updater_slots["battery"], _process_battery_slot)
@@ -227,9 +234,15 @@ class RevvyStatusCode(enum.IntEnum):
 
 
 class RobotManager:
+    motor_telemetry_interval = 0.1
+    motor_telemetry_deadband = (0, 1, 1)  # power, speed [rpm], position [degrees]
+    sensor_telemetry_interval = 0.1
+    telemetry_frame_interval = 0.02
+    error_harvest_interval = 1.0
 
     # FIXME: revvy intentionally doesn't have a type hint at this moment because it breaks tests right now
-    def __init__(self, interface: RevvyControl, revvy, sound_paths, sw_version, default_config=None):
+    def __init__(self, interface: RevvyControl, revvy, sound_paths, sw_version, default_config=None,
+                 script_cache: ScriptCache = None, error_storage: StorageInterface = None):
         print("RobotManager: __init__()")
         self.needs_interrupting = True
 
@@ -251,6 +264,7 @@ class RobotManager:
         self._remote_controller = rc
         self._remote_controller_scheduler = rcs
         self._remote_controller_thread = create_remote_controller_thread(rcs)
+        self._controller_recorder = None
 
         self._resources = {
             'led_ring':   Resource(),
@@ -261,11 +275,43 @@ class RobotManager:
             **{'sensor_{}'.format(port.id): Resource() for port in self._robot.sensors}
         }
 
-        revvy['live_message_service'].register_message_handler(self._remote_controller_scheduler.data_ready)
+        live_service = revvy['live_message_service']
+        live_service.register_message_handler(self._remote_controller_scheduler.data_ready)
+        live_service.on_subscribed(self._on_telemetry_subscribed)
+
+        self._telemetry = TelemetryPublisher()
+        for port in self._robot.motors:
+            self._telemetry.add_channel('motor_{}'.format(port.id),
+                                        lambda value, motor=port.id: live_service.update_motor(motor, *value),
+                                        self.motor_telemetry_interval, self.motor_telemetry_deadband)
+        for port in self._robot.sensors:
+            self._telemetry.add_channel('sensor_{}'.format(port.id),
+                                        lambda value, sensor=port.id: live_service.update_sensor(sensor, list(value)),
+                                        self.sensor_telemetry_interval)
+
+        # fields of the aggregated frame: motors (bits 0-5), sensors (bits 6-9), battery, IMU
+        frame = TelemetryFrame(live_service.update_telemetry, self.telemetry_frame_interval)
+        for port in self._robot.motors:
+            frame.add_field('motor_{}'.format(port.id), encode_motor_telemetry, self.motor_telemetry_deadband)
+        for port in self._robot.sensors:
+            frame.add_field('sensor_{}'.format(port.id), encode_sensor_telemetry)
+        frame.add_field('battery', bytes)
+        frame.add_field('imu', encode_imu_telemetry)
+        self._telemetry.add_frame(frame)
+
         revvy.on_connection_changed(self._on_connection_changed)
 
-        self._scripts = ScriptManager(self)
+        self._script_cache = script_cache if script_cache is not None else ScriptCache()
+        self._scripts = ScriptManager(self, self._script_cache)
         self._config = self._default_configuration
+        self._applied_config = None  # uploaded configuration that is currently active
+
+        if error_storage is not None:
+            self._error_harvester = ErrorHarvester(interface, error_storage)
+            self._error_harvest_thread = ThreadWrapper(self._harvest_errors, "ErrorHarvesterThread")
+        else:
+            self._error_harvester = None
+            self._error_harvest_thread = None
 
         self._status_code = RevvyStatusCode.OK
         self.exited = False
@@ -275,6 +321,9 @@ class RobotManager:
         try:
             self._robot.update_status()
 
+            self._telemetry.publish('battery', (self._robot.battery.main, self._robot.battery.motor))
+            self._telemetry.publish('imu', (self._robot.imu.yaw_angle, self._robot.imu.relative_yaw_angle))
+
             self._ble['battery_service'].characteristic('main_battery').update_value(self._robot.battery.main)
             self._ble['battery_service'].characteristic('motor_battery').update_value(self._robot.battery.motor)
 
@@ -290,10 +339,47 @@ class RobotManager:
         except Exception:
             print(traceback.format_exc())
 
+    def _harvest_errors(self, ctx: ThreadContext):
+        """Copy new MCU errors into storage, one page at a time, while the MCU is not needed for anything else"""
+        while not ctx.stop_requested:
+            ctx.sleep(self.error_harvest_interval)
+
+            # noinspection PyBroadException
+            try:
+                has_more = True
+                while has_more and not self._is_mcu_needed():
+                    error_count = self._error_harvester.record_count
+                    has_more = self._error_harvester.step()
+                    if self._error_harvester.record_count != error_count:
+                        self._update_error_summary()
+            except TransportException:
+                # the status thread handles the broken connection
+                return
+            except Exception:
+                print('Failed to read MCU error memory, stopped collecting errors')
+                print(traceback.format_exc())
+                return
+
+    def _is_mcu_needed(self):
+        """Error harvesting yields to remote control and to every other command"""
+        return self._robot.status.controller_status == RemoteControllerStatus.Controlled or self._interface.is_busy
+
+    def _update_error_summary(self):
+        summary = encode_error_summary(self._error_harvester.record_count, self._error_harvester.error_counts)
+        self._ble['device_information_service'].characteristic('mcu_errors').update(summary)
+
     @property
     def resources(self):
         return self._resources
 
+    @property
+    def resource_metrics(self):
+        return {name: self._resources[name].metrics.as_dict() for name in self._resources}
+
+    @property
+    def resource_traces(self):
+        return {name: self._resources[name].trace for name in self._resources}
+
     @property
     def config(self):
         return self._config
@@ -331,6 +417,9 @@ class RobotManager:
     def start(self):
         print("RobotManager: start()")
         if self._robot.status.robot_status == RobotStatus.StartingUp:
+            for curve in builtin_controller_curves:
+                curve.prepare()
+
             print("Waiting for MCU")
             # TODO if we are getting stuck here (> ~3s), firmware is probably not valid
             self._ping_robot()
@@ -338,9 +427,14 @@ class RobotManager:
             self._ble['device_information_service'].characteristic('hw_version').update(str(self._robot.version.hw))
             self._ble['device_information_service'].characteristic('fw_version').update(str(self._robot.version.fw))
             self._ble['device_information_service'].characteristic('sw_version').update(self._robot.version.sw)
+            if self._error_harvester is not None:
+                self._update_error_summary()
 
             # start reader thread
             self._status_update_thread.start()
+            if self._error_harvest_thread is not None:
+                self._error_harvest_thread.start()
+            self._telemetry.start()
 
             self._ble.start()
             self._robot.status.robot_status = RobotStatus.NotConfigured
@@ -361,6 +455,10 @@ class RobotManager:
             self._robot.status.controller_status = RemoteControllerStatus.ConnectedNoControl
             self._robot.sound.play_tune('bell')
 
+    def _on_telemetry_subscribed(self):
+        # values that were published before the subscription never reached the phone
+        self._telemetry.reset()
+
     def _on_controller_detected(self):
         self._robot.status.controller_status = RemoteControllerStatus.Controlled
 
@@ -395,17 +493,16 @@ class RobotManager:
 
         self._robot.reset()
 
-    def _apply_new_configuration(self, config):
-        # apply new configuration
-        print("Applying new configuration")
-
-        live_service = self._ble['live_message_service']
+    def _configure_motor(self, motor, config):
+        motor.configure(config.motors[motor.id])
+        motor.on_status_changed(
+            lambda p: self._telemetry.publish('motor_{}'.format(p.id), (p.power, p.speed, p.position)))
 
-        # set up motors
-        for motor in self._robot.motors:
-            motor.configure(config.motors[motor.id])
-            motor.on_status_changed(lambda p: live_service.update_motor(p.id, p.power, p.speed, p.position))
+    def _configure_sensor(self, sensor, config):
+        sensor.configure(config.sensors[sensor.id])
+        sensor.on_value_changed(lambda p: self._telemetry.publish('sensor_{}'.format(p.id), p.raw_value))
 
+    def _configure_drivetrain(self, config):
         for motor_id in config.drivetrain['left']:
             self._robot.drivetrain.add_left_motor(self._robot.motors[motor_id])
 
@@ -414,37 +511,124 @@ class RobotManager:
 
         self._robot.drivetrain.configure()
 
-        # set up sensors
-        for sensor in self._robot.sensors:
-            sensor.configure(config.sensors[sensor.id])
-            sensor.on_value_changed(lambda p: live_service.update_sensor(p.id, p.raw_value))
-
-        # set up scripts
-        for name in config.scripts:
+    def _add_script(self, name, config):
+        try:
             self._scripts.add_script(name, config.scripts[name]['script'], config.scripts[name]['priority'])
+        except SyntaxError:
+            # the script is left out, bindings that refer to it are skipped
+            print('Script {} can not be compiled'.format(name))
+            print(traceback.format_exc())
 
-        # set up remote controller
+    def _bind_controller(self, config):
         for analog in config.controller.analog:
-            self._remote_controller.on_analog_values(
-                analog['channels'],
-                lambda in_data, scr=analog['script']: self._scripts[scr].start({'input': in_data})
-            )
+            if analog['script'] in self._scripts:
+                self._remote_controller.on_analog_values(
+                    analog['channels'],
+                    lambda in_data, scr=analog['script']: self._scripts[scr].push_input(in_data)
+                )
 
         for button in range(len(config.controller.buttons)):
             script = config.controller.buttons[button]
-            if script:
+            if script in self._scripts:
                 self._remote_controller.on_button_pressed(button, self._scripts[script].start)
 
-        # start background scripts
+    def _start_background_scripts(self, config, running=()):
+        """Start the background scripts, the ones in running are only started again if they have finished"""
         for script in config.background_scripts:
-            self._scripts[script].start()
+            if script in self._scripts and (script not in running or not self._scripts[script].is_running):
+                self._scripts[script].is_background = True
+                self._scripts[script].start()
+
+    def _persist_compiled_scripts(self, config):
+        sources = [script['script'] for script in config.scripts.values() if not callable(script['script'])]
+        if sources:
+            self._script_cache.persist(sources)
+
+    def _apply_new_configuration(self, config):
+        # apply new configuration
+        print("Applying new configuration")
+
+        # set up motors
+        for motor in self._robot.motors:
+            self._configure_motor(motor, config)
+
+        self._configure_drivetrain(config)
+
+        # set up sensors
+        for sensor in self._robot.sensors:
+            self._configure_sensor(sensor, config)
+
+        # set up scripts
+        for name in config.scripts:
+            self._add_script(name, config)
+
+        # set up remote controller
+        self._bind_controller(config)
+
+        # start background scripts
+        self._start_background_scripts(config)
+
+    def _apply_configuration_changes(self, old_config, config):
+        """Only reconfigure the ports, drivetrain and scripts that are different in the new configuration"""
+        diff = RobotConfigDiff(old_config, config)
+        print("Applying configuration changes")
+
+        reset_volume()
+
+        # bindings refer to script handles that may be replaced
+        self._remote_controller_thread.stop().wait()
+        self._remote_controller.reset()
+
+        # stop changed scripts first so they don't use the ports being reconfigured
+        changed_scripts = set(diff.scripts) | set(diff.removed_scripts)
+        kept_scripts = [name for name in config.scripts if name not in changed_scripts]
+        self._scripts.remove_scripts([name for name in self._scripts.names if name not in kept_scripts])
+
+        # the drivetrain has to be set up again if any of its motors are reconfigured
+        drivetrain_motors = set(old_config.drivetrain['left'] + old_config.drivetrain['right'])
+        drivetrain_changed = diff.drivetrain or not drivetrain_motors.isdisjoint(diff.motors)
+
+        if drivetrain_changed:
+            self._resources['drivetrain'].reset()
+            self._robot.drivetrain.set_speeds(0, 0)
+            self._robot.drivetrain.reset()
+
+        for motor_id in diff.motors:
+            self._resources['motor_{}'.format(motor_id)].reset()
+            self._configure_motor(self._robot.motors[motor_id], config)
+
+        if drivetrain_changed:
+            self._configure_drivetrain(config)
+
+        for sensor_id in diff.sensors:
+            self._resources['sensor_{}'.format(sensor_id)].reset()
+            self._configure_sensor(self._robot.sensors[sensor_id], config)
+
+        for name in diff.scripts:
+            self._add_script(name, config)
+
+        self._bind_controller(config)
+
+        self._start_background_scripts(config, running=kept_scripts)
 
     def _configure(self, config):
         is_default_config = config is None
 
         if not config and self._robot.status.robot_status != RobotStatus.Stopped:
             config = self._default_configuration
+
+        # a new configuration is applied incrementally on top of the active one, but a full reset is used when
+        # falling back to the default configuration to make sure nothing keeps running
+        old_config = self._applied_config
         self._config = config
+        self._applied_config = None if is_default_config else config
+
+        if old_config is not None and config is not None and not is_default_config:
+            self._apply_configuration_changes(old_config, config)
+            self._persist_compiled_scripts(config)
+            self._robot.status.robot_status = RobotStatus.Configured
+            self._configuring = False
+            return
 
         self._scripts.stop_all_scripts()
         self._reset_configuration()
@@ -455,21 +639,35 @@ class RobotManager:
                 print('Default configuration applied')
                 self._robot.status.robot_status = RobotStatus.NotConfigured
             else:
+                self._persist_compiled_scripts(config)
                 self._robot.status.robot_status = RobotStatus.Configured
         else:
             self._robot.status.robot_status = RobotStatus.NotConfigured
 
         self._configuring = False
 
+    def record_controller_input(self, file):
+        """Write every received controller message into file, None stops recording and closes the previous file"""
+        recorder = ControllerRecorder(file) if file is not None else None
+        self._remote_controller_scheduler.on_message_received(recorder.record if recorder else None)
+
+        if self._controller_recorder is not None:
+            self._controller_recorder.close()
+        self._controller_recorder = recorder
+
     def start_remote_controller(self):
         self._remote_controller_thread.start()
 
     def stop(self):
         self._robot.status.robot_status = RobotStatus.Stopped
         self._remote_controller_thread.exit()
+        self.record_controller_input(None)
         self._ble.stop()
         self._scripts.reset()
         self._status_update_thread.exit()
+        if self._error_harvest_thread is not None:
+            self._error_harvest_thread.exit()
+        self._telemetry.stop()
 
     def _ping_robot(self):
         retry_ping = True
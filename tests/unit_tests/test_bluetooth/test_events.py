@@ -0,0 +1,99 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import unittest
+from threading import Event, Thread
+
+from mock import Mock
+
+from revvy.bluetooth.events import EventQueue, EventDispatcher
+
+
+class TestEventQueue(unittest.TestCase):
+    def test_events_are_handled_in_order_by_worker(self):
+        done = Event()
+        handled = []
+
+        queue = EventQueue('test', 4, EventQueue.block)
+        try:
+            queue.start().wait()
+            queue.put(lambda: handled.append(1))
+            queue.put(lambda: handled.append(2))
+            queue.put(done.set)
+
+            self.assertTrue(done.wait(1))
+            self.assertEqual([1, 2], handled)
+            self.assertEqual(3, queue.metrics.handled)
+        finally:
+            queue.stop()
+
+    def test_drop_oldest_discards_old_events_when_full(self):
+        queue = EventQueue('test', 2, EventQueue.drop_oldest)
+        try:
+            first = Mock()
+            self.assertTrue(queue.put(first))
+            self.assertTrue(queue.put(Mock()))
+            self.assertTrue(queue.put(Mock()))
+
+            self.assertEqual(2, queue.depth)
+            self.assertEqual(1, queue.metrics.dropped)
+            self.assertEqual(2, queue.metrics.max_depth)
+
+            done = Event()
+            queue.put(done.set)
+            queue.start().wait()
+            self.assertTrue(done.wait(1))
+            self.assertEqual(0, first.call_count)
+        finally:
+            queue.stop()
+
+    def test_block_waits_for_space_in_queue(self):
+        queue = EventQueue('test', 1, EventQueue.block)
+        try:
+            queue.put(Mock())
+
+            put_done = Event()
+            last = Mock()
+            thread = Thread(target=lambda: (queue.put(last), put_done.set()))
+            thread.start()
+
+            self.assertFalse(put_done.wait(0.1))
+
+            queue.start()
+            self.assertTrue(put_done.wait(1))
+            thread.join()
+            self.assertGreater(queue.metrics.blocked_time, 0)
+        finally:
+            queue.stop()
+
+    def test_stopped_queue_rejects_events(self):
+        queue = EventQueue('test', 1, EventQueue.block)
+        queue.stop()
+
+        self.assertFalse(queue.put(Mock()))
+        self.assertEqual(1, queue.metrics.rejected)
+
+    def test_failing_event_does_not_stop_the_queue(self):
+        done = Event()
+
+        queue = EventQueue('test', 2, EventQueue.block)
+        try:
+            queue.start().wait()
+            queue.put(Mock(side_effect=IOError))
+            queue.put(done.set)
+
+            self.assertTrue(done.wait(1))
+        finally:
+            queue.stop()
+
+
+class TestEventDispatcher(unittest.TestCase):
+    def test_metrics_include_queue_depth(self):
+        dispatcher = EventDispatcher({'control': EventQueue('test', 2, EventQueue.drop_oldest)})
+        try:
+            dispatcher['control'].put(Mock())
+
+            metrics = dispatcher.metrics
+            self.assertEqual(1, metrics['control']['depth'])
+            self.assertEqual(1, metrics['control']['enqueued'])
+        finally:
+            dispatcher.stop()
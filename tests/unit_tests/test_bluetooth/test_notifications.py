@@ -0,0 +1,102 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import time
+import unittest
+from threading import Event
+
+from mock import Mock
+
+from revvy.bluetooth.notifications import NotificationScheduler
+
+
+class TestNotificationScheduler(unittest.TestCase):
+    def test_values_are_not_sent_without_subscriber(self):
+        scheduler = NotificationScheduler()
+        slot = scheduler.create_slot()
+        try:
+            scheduler.start().wait()
+            slot.update([1])
+            time.sleep(0.05)
+
+            callback = Mock()
+            slot.subscribe(20, callback)
+            time.sleep(0.05)
+            self.assertEqual(0, callback.call_count)
+        finally:
+            scheduler.stop()
+
+    def test_unchanged_values_are_skipped(self):
+        scheduler = NotificationScheduler()
+        slot = scheduler.create_slot()
+        callback = Mock()
+        slot.subscribe(20, callback)
+        try:
+            scheduler.start().wait()
+            for value in ([1], [1], [2], [2], [1]):
+                slot.update(value)
+                time.sleep(0.03)
+
+            self.assertEqual([[1], [2], [1]], [c[0][0] for c in callback.call_args_list])
+        finally:
+            scheduler.stop()
+
+    def test_min_interval_sends_latest_value_only(self):
+        scheduler = NotificationScheduler()
+        slot = scheduler.create_slot(min_interval=0.2)
+        callback = Mock()
+        slot.subscribe(20, callback)
+        try:
+            scheduler.start().wait()
+            slot.update([1])
+            time.sleep(0.05)
+            slot.update([2])
+            slot.update([3])
+            time.sleep(0.3)
+
+            self.assertEqual([[1], [3]], [c[0][0] for c in callback.call_args_list])
+        finally:
+            scheduler.stop()
+
+    def test_queued_values_are_kept_and_truncated_to_max_value_size(self):
+        done = Event()
+        sent = []
+
+        def callback(value):
+            sent.append(value)
+            if len(sent) == 3:
+                done.set()
+
+        scheduler = NotificationScheduler()
+        slot = scheduler.create_slot(queue_length=4)
+        slot.subscribe(2, callback)
+        slot.update([1, 2, 3])
+        slot.update([4])
+        slot.update([5, 6])
+        try:
+            scheduler.start().wait()
+            self.assertTrue(done.wait(1))
+            self.assertEqual([[1, 2], [4], [5, 6]], sent)
+        finally:
+            scheduler.stop()
+
+    def test_next_notification_waits_for_the_previous_one_to_be_sent(self):
+        scheduler = NotificationScheduler(max_outstanding=1, send_timeout=10)
+        first = scheduler.create_slot()
+        second = scheduler.create_slot()
+        first_callback = Mock()
+        second_callback = Mock()
+        first.subscribe(20, first_callback)
+        second.subscribe(20, second_callback)
+        try:
+            scheduler.start().wait()
+            first.update([1])
+            second.update([2])
+            time.sleep(0.05)
+            self.assertEqual(1, first_callback.call_count + second_callback.call_count)
+
+            scheduler.notification_sent()
+            time.sleep(0.05)
+            self.assertEqual(1, first_callback.call_count)
+            self.assertEqual(1, second_callback.call_count)
+        finally:
+            scheduler.stop()
@@ -0,0 +1,190 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import time
+import unittest
+from threading import Event
+
+from mock import Mock
+
+from revvy.bluetooth.telemetry import TelemetryPublisher, TelemetryFrame, encode_telemetry_frames, encode_imu_telemetry
+
+
+class TestTelemetryPublisher(unittest.TestCase):
+    def test_values_are_sent_from_background_thread(self):
+        sent = Event()
+        send = Mock(side_effect=lambda value: sent.set())
+
+        publisher = TelemetryPublisher()
+        publisher.add_channel('motor_1', send)
+        try:
+            publisher.start().wait()
+            publisher.publish('motor_1', [1, 2, 3])
+
+            self.assertTrue(sent.wait(1))
+            send.assert_called_once_with((1, 2, 3))
+        finally:
+            publisher.stop()
+
+    def test_only_latest_value_is_sent_within_min_interval(self):
+        send = Mock()
+
+        publisher = TelemetryPublisher()
+        publisher.add_channel('sensor_1', send, min_interval=0.2)
+        try:
+            publisher.start().wait()
+            publisher.publish('sensor_1', [1])
+            time.sleep(0.05)
+            publisher.publish('sensor_1', [2])
+            publisher.publish('sensor_1', [3])
+            time.sleep(0.3)
+
+            self.assertEqual([((1,),), ((3,),)], [c[0] for c in send.call_args_list])
+        finally:
+            publisher.stop()
+
+    def test_changes_within_deadband_are_not_sent(self):
+        send = Mock()
+
+        publisher = TelemetryPublisher()
+        publisher.add_channel('motor_1', send, min_interval=0, deadband=(0, 2))
+        try:
+            publisher.start().wait()
+            publisher.publish('motor_1', [0, 100])
+            time.sleep(0.05)
+            publisher.publish('motor_1', [0, 101])
+            time.sleep(0.05)
+            publisher.publish('motor_1', [0, 103])
+            time.sleep(0.05)
+            publisher.publish('motor_1', [1, 103])
+            time.sleep(0.05)
+
+            self.assertEqual([((0, 100),), ((0, 103),), ((1, 103),)], [c[0] for c in send.call_args_list])
+        finally:
+            publisher.stop()
+
+    def test_reset_sends_unchanged_value_again(self):
+        send = Mock()
+
+        publisher = TelemetryPublisher()
+        publisher.add_channel('sensor_1', send, min_interval=0)
+        try:
+            publisher.start().wait()
+            publisher.publish('sensor_1', [1])
+            time.sleep(0.05)
+            publisher.publish('sensor_1', [1])
+            time.sleep(0.05)
+            self.assertEqual(1, send.call_count)
+
+            publisher.reset()
+            publisher.publish('sensor_1', [1])
+            time.sleep(0.05)
+            self.assertEqual(2, send.call_count)
+        finally:
+            publisher.stop()
+
+    def test_reset_resends_last_values_without_new_publish(self):
+        sent = Event()
+        send = Mock(side_effect=lambda value: sent.set())
+
+        frame = TelemetryFrame(send, min_interval=0)
+        frame.add_field('battery', bytes)
+
+        publisher = TelemetryPublisher()
+        publisher.add_channel('motor_1', send, min_interval=0)
+        publisher.add_frame(frame)
+        try:
+            publisher.start().wait()
+            publisher.publish('motor_1', [1, 2])
+            publisher.publish('battery', [90, 80])
+            time.sleep(0.05)
+            self.assertEqual(2, send.call_count)
+
+            publisher.reset()
+            time.sleep(0.05)
+
+            self.assertEqual([(1, 2), {0: b'\x5a\x50'}] * 2, [c[0][0] for c in send.call_args_list])
+        finally:
+            publisher.stop()
+
+    def test_failing_send_does_not_stop_publisher(self):
+        sent = Event()
+        failing = Mock(side_effect=IOError)
+        working = Mock(side_effect=lambda value: sent.set())
+
+        publisher = TelemetryPublisher()
+        publisher.add_channel('motor_1', failing)
+        publisher.add_channel('motor_2', working)
+        try:
+            publisher.start().wait()
+            publisher.publish('motor_1', [1])
+            publisher.publish('motor_2', [2])
+
+            self.assertTrue(sent.wait(1))
+            self.assertEqual(1, failing.call_count)
+        finally:
+            publisher.stop()
+
+
+class TestTelemetryFrame(unittest.TestCase):
+    def test_frame_contains_changed_fields_only(self):
+        sent = Event()
+        send = Mock(side_effect=lambda value: sent.set())
+
+        frame = TelemetryFrame(send, min_interval=0.2)
+        frame.add_field('battery', bytes)
+        frame.add_field('sensor_1', bytes)
+        frame.add_field('sensor_2', bytes)
+
+        publisher = TelemetryPublisher()
+        publisher.add_frame(frame)
+        try:
+            publisher.start().wait()
+            publisher.publish('battery', [90, 80])
+            publisher.publish('sensor_2', [5])
+            self.assertTrue(sent.wait(1))
+
+            sent.clear()
+            publisher.publish('battery', [90, 80])
+            publisher.publish('sensor_1', [1])
+            publisher.publish('sensor_2', [6])
+            self.assertTrue(sent.wait(1))
+
+            self.assertEqual([({0: b'\x5a\x50', 2: b'\x05'},), ({1: b'\x01', 2: b'\x06'},)],
+                             [c[0] for c in send.call_args_list])
+        finally:
+            publisher.stop()
+
+    def test_field_that_can_not_be_encoded_does_not_stop_publisher(self):
+        sent = Event()
+        send = Mock(side_effect=lambda value: sent.set())
+
+        frame = TelemetryFrame(send)
+        frame.add_field('imu', encode_imu_telemetry)
+        frame.add_field('sensor_1', bytes)
+
+        publisher = TelemetryPublisher()
+        publisher.add_frame(frame)
+        try:
+            publisher.start().wait()
+            publisher.publish('imu', [2 ** 40, 0])
+            publisher.publish('sensor_1', [1])
+            self.assertTrue(sent.wait(1))
+
+            sent.clear()
+            publisher.publish('imu', [10, 0])
+            self.assertTrue(sent.wait(1))
+
+            self.assertEqual([({1: b'\x01'},), ({0: encode_imu_telemetry((10, 0))},)],
+                             [c[0] for c in send.call_args_list])
+        finally:
+            publisher.stop()
+
+    def test_fields_are_split_into_frames_that_fit_max_size(self):
+        fields = {index: bytes([index] * 9) for index in range(6)}
+
+        frames = encode_telemetry_frames(fields, max_size=21)
+
+        self.assertEqual(3, len(frames))
+        self.assertTrue(all(len(frame) <= 21 for frame in frames))
+        self.assertEqual([0b11, 0b1100, 0b110000], [int.from_bytes(frame[1:3], 'little') for frame in frames])
+        self.assertEqual(b''.join(fields.values()), b''.join(frame[3:] for frame in frames))
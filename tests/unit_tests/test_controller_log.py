@@ -0,0 +1,83 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import io
+import unittest
+from mock import Mock
+
+from revvy.mcu.rrrc_control import RevvyControl
+from revvy.robot.controller_log import ControllerRecorder, read_controller_log, ControllerReplay, \
+    SimulatedTransport
+from revvy.robot.remote_controller import RemoteControllerCommand, RemoteControllerScheduler, RemoteController
+
+
+class TestControllerLog(unittest.TestCase):
+    def test_recorded_messages_can_be_read_back(self):
+        messages = [
+            RemoteControllerCommand(analog=bytes([127, 127]), buttons=0),
+            RemoteControllerCommand(analog=bytes([0, 255, 3]), buttons=0x80000001),
+            RemoteControllerCommand(analog=b'', buttons=5)
+        ]
+
+        log = io.BytesIO()
+        recorder = ControllerRecorder(log)
+        for message in messages:
+            recorder.record(message)
+
+        log.seek(0)
+        records = read_controller_log(log)
+
+        self.assertEqual(messages, [message for (_, message) in records])
+        self.assertEqual(0, records[0][0])
+        self.assertEqual(sorted(t for (t, _) in records), [t for (t, _) in records])
+
+    def test_reading_invalid_log_raises_error(self):
+        self.assertRaises(ValueError, lambda: read_controller_log(io.BytesIO(b'invalid')))
+
+        log = io.BytesIO()
+        ControllerRecorder(log).record(RemoteControllerCommand(analog=bytes([1, 2, 3]), buttons=0))
+
+        self.assertRaises(ValueError, lambda: read_controller_log(io.BytesIO(log.getvalue()[:-1])))
+
+    def test_log_is_flushed_periodically_and_closed(self):
+        log = Mock()
+        recorder = ControllerRecorder(log, flush_interval=60)
+
+        recorder.record(RemoteControllerCommand(analog=bytes([1, 2]), buttons=0))
+        recorder.record(RemoteControllerCommand(analog=bytes([1, 2]), buttons=0))
+        self.assertEqual(1, log.flush.call_count)
+
+        recorder.close()
+        recorder.record(RemoteControllerCommand(analog=bytes([1, 2]), buttons=0))
+        self.assertEqual(1, log.close.call_count)
+        self.assertEqual(3, log.write.call_count)  # magic and two records
+
+    def test_scheduler_passes_received_messages_to_recorder(self):
+        log = io.BytesIO()
+        recorder = ControllerRecorder(log)
+
+        rcs = RemoteControllerScheduler(RemoteController())
+        rcs.on_message_received(recorder.record)
+
+        message = RemoteControllerCommand(analog=bytes([1, 2]), buttons=3)
+        rcs.data_ready(message)
+
+        log.seek(0)
+        self.assertEqual([message], [m for (_, m) in read_controller_log(log)])
+
+    def test_replay_sends_messages_in_order(self):
+        records = [(0.0, 'a'), (0.01, 'b'), (0.02, 'c')]
+        mock = Mock()
+
+        arrivals = ControllerReplay(records, None).run(mock)
+
+        self.assertEqual(['a', 'b', 'c'], [call[0][0] for call in mock.call_args_list])
+        self.assertEqual(3, len(arrivals))
+
+    def test_simulated_transport_records_commands(self):
+        transport = SimulatedTransport()
+        interface = RevvyControl(transport)
+
+        interface.set_drivetrain_speed(10, 20)
+
+        self.assertEqual(1, len(transport.commands))
+        self.assertEqual(0x1B, transport.commands[0][1])
@@ -0,0 +1,224 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import binascii
+import json
+import os
+import tempfile
+import unittest
+from mock import Mock
+
+from revvy.file_storage import MemoryStorage, FileStorage
+from revvy.firmware_updater import McuUpdater, McuUpdateManager, op_mode_application, op_mode_bootloader, \
+    create_firmware_patch
+from revvy.functions import bytestr_hash
+from revvy.mcu.commands import CommandStatusError
+from revvy.version import Version
+
+
+def create_updater(send_firmware):
+    robot = Mock()
+    robot.read_operation_mode = Mock(side_effect=[op_mode_application, op_mode_bootloader, op_mode_application])
+    robot.get_firmware_version = Mock(return_value=Version('0.1.0'))
+
+    bootloader = Mock()
+    bootloader.send_firmware = Mock(side_effect=send_firmware)
+
+    return McuUpdater(robot, bootloader), bootloader
+
+
+class TestMcuUpdater(unittest.TestCase):
+    def test_image_is_sent_in_max_sized_chunks(self):
+        received = []
+        updater, bootloader = create_updater(lambda chunk: received.append(bytes(chunk)))
+
+        data = bytes(range(256)) * 3
+        updater.update_firmware(Version('0.1.1'), data)
+
+        self.assertEqual(1, bootloader.send_init_update.call_count)
+        self.assertEqual([255, 255, 255, 3], [len(chunk) for chunk in received])
+        self.assertEqual(data, b''.join(received))
+        self.assertEqual(1, bootloader.finalize_update.call_count)
+
+    def test_no_update_when_version_matches(self):
+        updater, bootloader = create_updater(lambda chunk: None)
+
+        updater.update_firmware(Version('0.1.0'), b'data')
+
+        self.assertEqual(0, bootloader.send_init_update.call_count)
+        self.assertEqual(0, bootloader.send_firmware.call_count)
+
+    def test_rejected_chunk_is_resent_from_last_acknowledged_offset_with_smaller_chunk(self):
+        received = []
+        calls = [0]
+
+        def send(chunk):
+            calls[0] += 1
+            if calls[0] == 2:
+                raise CommandStatusError('Command status: Payload integrity error')
+            received.append(bytes(chunk))
+
+        updater, bootloader = create_updater(send)
+
+        data = bytes(range(256)) * 3
+        updater.update_firmware(Version('0.1.1'), data)
+
+        self.assertEqual(data, b''.join(received))
+        self.assertEqual(255, len(received[0]))
+        self.assertEqual(127, len(received[1]))
+        self.assertEqual(1, bootloader.send_init_update.call_count)
+
+    def test_other_value_errors_are_not_treated_as_rejected_chunks(self):
+        received = []
+        calls = [0]
+
+        def send(chunk):
+            calls[0] += 1
+            if calls[0] == 2:
+                raise ValueError('Read payload: Unexpected header received')
+            received.append(bytes(chunk))
+
+        updater, bootloader = create_updater(send)
+
+        self.assertRaises(ValueError, lambda: updater.update_firmware(Version('0.1.1'), bytes(range(256)) * 3))
+        self.assertEqual(2, bootloader.send_firmware.call_count)
+        self.assertEqual([255], [len(chunk) for chunk in received])
+
+    def test_transfer_is_restarted_after_transport_error(self):
+        received = []
+        calls = [0]
+
+        def send(chunk):
+            calls[0] += 1
+            if calls[0] == 2:
+                raise BrokenPipeError('Read response header: Retry limit reached')
+            received.append(bytes(chunk))
+
+        updater, bootloader = create_updater(send)
+
+        data = bytes(range(256)) * 2
+        updater.update_firmware(Version('0.1.1'), data)
+
+        self.assertEqual(2, bootloader.send_init_update.call_count)
+        # first chunk of the failed attempt, then the full image
+        self.assertEqual(data, b''.join(received[1:]))
+
+    def test_progress_is_reported_after_each_chunk(self):
+        updater, bootloader = create_updater(lambda chunk: None)
+        progress = Mock()
+        updater.on_progress(progress)
+
+        updater.update_firmware(Version('0.1.1'), bytes(300))
+
+        self.assertEqual([(0, 300), (255, 300), (300, 300)], [c[0] for c in progress.call_args_list])
+
+
+class TestMcuUpdateManager(unittest.TestCase):
+    base_image = bytes(range(256)) * 8
+    new_image = bytes(range(256)) * 4 + b'\x55' * 256 + bytes(range(256)) * 4
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.fw_dir = self._dir.name
+
+        with open(os.path.join(self.fw_dir, 'fw.bin'), 'wb') as f:
+            f.write(self.new_image)
+
+        patch = create_firmware_patch(self.base_image, self.new_image)
+        with open(os.path.join(self.fw_dir, 'fw.patch'), 'wb') as f:
+            f.write(patch)
+
+        self.catalog = {
+            '1.0.0': {
+                'version': '0.1.2',
+                'filename': 'fw.bin',
+                'length': len(self.new_image),
+                'md5': bytestr_hash(self.new_image),
+                'patches': [{
+                    'base_version': '0.1.1',
+                    'base_crc': binascii.crc32(self.base_image),
+                    'filename': 'fw.patch',
+                    'length': len(patch),
+                    'md5': bytestr_hash(patch)
+                }]
+            }
+        }
+        self.write_catalog()
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def write_catalog(self):
+        with open(os.path.join(self.fw_dir, 'catalog.json'), 'w') as f:
+            json.dump(self.catalog, f)
+
+    @staticmethod
+    def create_updater(current_version):
+        updater = Mock()
+        updater.read_hardware_version = Mock(return_value=Version('1.0.0'))
+        updater.read_firmware_version = Mock(return_value=Version(current_version))
+        return updater
+
+    def test_patch_is_applied_to_stored_image(self):
+        storage = MemoryStorage()
+        storage.write('mcu-firmware', self.base_image, metadata={'version': '0.1.1'})
+
+        # replace the full image so that only the patched image can match
+        with open(os.path.join(self.fw_dir, 'fw.bin'), 'wb') as f:
+            f.write(b'')
+
+        updater = self.create_updater('0.1.1')
+        McuUpdateManager(self.fw_dir, updater, storage).update_if_necessary()
+
+        self.assertEqual(1, updater.update_firmware.call_count)
+        self.assertEqual(Version('0.1.2'), updater.update_firmware.call_args[0][0])
+        self.assertEqual(self.new_image, updater.update_firmware.call_args[0][1])
+        self.assertEqual(self.new_image, storage.read('mcu-firmware'))
+        self.assertEqual('0.1.2', storage.read_metadata('mcu-firmware')['version'])
+
+    def test_full_image_is_used_when_base_version_does_not_match(self):
+        storage = MemoryStorage()
+        storage.write('mcu-firmware', self.base_image, metadata={'version': '0.1.0'})
+
+        updater = self.create_updater('0.1.0')
+        McuUpdateManager(self.fw_dir, updater, storage).update_if_necessary()
+
+        self.assertEqual(self.new_image, updater.update_firmware.call_args[0][1])
+
+    def test_full_image_is_used_when_stored_image_does_not_match_base_checksum(self):
+        storage = MemoryStorage()
+        storage.write('mcu-firmware', self.base_image[1:], metadata={'version': '0.1.1'})
+
+        updater = self.create_updater('0.1.1')
+        McuUpdateManager(self.fw_dir, updater, storage).update_if_necessary()
+
+        self.assertEqual(self.new_image, updater.update_firmware.call_args[0][1])
+
+    def test_running_image_is_stored_when_storage_is_empty(self):
+        storage = MemoryStorage()
+
+        updater = self.create_updater('0.1.2')
+        McuUpdateManager(self.fw_dir, updater, storage).update_if_necessary()
+
+        self.assertEqual(self.new_image, storage.read('mcu-firmware'))
+
+    def test_invalid_patch_entries_are_ignored(self):
+        self.catalog['1.0.0']['patches'] = [{'base_version': '0.1.1'}]
+        self.write_catalog()
+
+        updater = self.create_updater('0.1.1')
+        McuUpdateManager(self.fw_dir, updater).update_if_necessary()
+
+        self.assertEqual(self.new_image, updater.update_firmware.call_args[0][1])
+
+    def test_corrupt_stored_metadata_is_treated_as_missing_image(self):
+        with tempfile.TemporaryDirectory() as storage_dir:
+            storage = FileStorage(storage_dir)
+            storage.write('mcu-firmware', self.base_image, metadata={'version': '0.1.1'})
+            with open(os.path.join(storage_dir, 'mcu-firmware.meta'), 'w') as f:
+                f.write('{"version": ')
+
+            updater = self.create_updater('0.1.1')
+            McuUpdateManager(self.fw_dir, updater, storage).update_if_necessary()
+
+            self.assertEqual(self.new_image, updater.update_firmware.call_args[0][1])
+            self.assertEqual(self.new_image, storage.read('mcu-firmware'))
@@ -0,0 +1,194 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from mock import Mock
+
+from revvy.file_storage import MemoryStorage
+from revvy.mcu.error_memory import ErrorLog, ErrorType, read_error_records, parse_error_record, error_address, \
+    ErrorHarvester
+
+
+def hard_fault(pc, fw=10):
+    return bytes([ErrorType.HardFault]) + struct.pack('<LLL', 2, fw, pc) + bytes(50)
+
+
+def assert_failure(line, fw=10):
+    return bytes([ErrorType.AssertFailure]) + struct.pack('<LLL', 2, fw, line) + b'file.c' + bytes(44)
+
+
+class TestReadErrorRecords(unittest.TestCase):
+    def test_all_pages_are_read_from_start_index(self):
+        control = Mock()
+        control.error_memory_read_count = Mock(return_value=5)
+        control.error_memory_read_errors = Mock(side_effect=lambda i: [[i], [i + 1]][:5 - i])
+
+        records = list(read_error_records(control, start=1))
+
+        self.assertEqual([(1, b'\x01'), (2, b'\x02'), (3, b'\x03'), (4, b'\x04')], records)
+        self.assertEqual([1, 3], [c[0][0] for c in control.error_memory_read_errors.call_args_list])
+
+    def test_reading_stops_when_no_records_are_returned(self):
+        control = Mock()
+        control.error_memory_read_count = Mock(return_value=5)
+        control.error_memory_read_errors = Mock(return_value=[])
+
+        self.assertEqual([], list(read_error_records(control)))
+
+    def test_hard_fault_address_is_the_program_counter(self):
+        self.assertEqual(0x1234, error_address(parse_error_record(hard_fault(0x1234))))
+        self.assertIsNone(error_address(parse_error_record(assert_failure(0x1234))))
+
+
+class TestErrorLog(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'errors.log')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_duplicate_records_are_stored_once(self):
+        log = ErrorLog(self._path)
+
+        self.assertEqual(2, log.append('robot1', [hard_fault(0x100), assert_failure(5), hard_fault(0x100)]))
+        self.assertEqual(0, log.append('robot1', [assert_failure(5)]))
+        self.assertEqual(1, log.append('robot2', [assert_failure(5)]))
+        self.assertEqual(3, len(log))
+
+    def test_entries_are_loaded_when_log_is_reopened(self):
+        ErrorLog(self._path).append('robot1', [hard_fault(0x100), assert_failure(5)])
+
+        log = ErrorLog(self._path)
+
+        self.assertEqual(2, len(log))
+        self.assertEqual(0, log.append('robot1', [hard_fault(0x100)]))
+
+    def test_incomplete_entry_is_dropped(self):
+        ErrorLog(self._path).append('robot1', [hard_fault(0x100), assert_failure(5)])
+        size = os.path.getsize(self._path)
+        os.truncate(self._path, size - 10)
+
+        log = ErrorLog(self._path)
+        self.assertEqual(1, len(log))
+
+        self.assertEqual(1, log.append('robot1', [assert_failure(5)]))
+        self.assertEqual(size, os.path.getsize(self._path))
+        self.assertEqual(2, len(ErrorLog(self._path)))
+
+    def test_file_with_wrong_magic_is_rejected(self):
+        with open(self._path, 'wb') as f:
+            f.write(b'something else')
+
+        self.assertRaises(ValueError, lambda: ErrorLog(self._path))
+
+    def test_query_returns_entries_matching_every_filter(self):
+        log = ErrorLog(self._path)
+        log.append('robot1', [hard_fault(0x100), hard_fault(0x200), assert_failure(5)])
+        log.append('robot2', [hard_fault(0x100, fw=11)])
+
+        self.assertEqual(4, len(log.query()))
+        self.assertEqual(3, len(log.query(error_type=ErrorType.HardFault)))
+        self.assertEqual(2, len(log.query(address=0x100)))
+        self.assertEqual(['robot1'], [source for source, _ in log.query(address=0x100, fw_version='0.2.10')])
+        self.assertEqual([], log.query(error_type=ErrorType.AssertFailure, source='robot2'))
+
+
+class TestErrorHarvester(unittest.TestCase):
+    def _create_control(self, errors):
+        control = Mock()
+        control.error_memory_read_count = Mock(side_effect=lambda: len(errors))
+        control.error_memory_read_errors = Mock(side_effect=lambda i: errors[i:i + 2])
+        return control
+
+    def test_one_page_is_read_per_step(self):
+        errors = [hard_fault(0x100), hard_fault(0x200), assert_failure(5)]
+        control = self._create_control(errors)
+        harvester = ErrorHarvester(control, MemoryStorage())
+
+        self.assertTrue(harvester.step())
+        self.assertEqual(2, len(harvester.records))
+
+        self.assertFalse(harvester.step())
+        self.assertEqual(3, len(harvester.records))
+
+        self.assertFalse(harvester.step())
+        self.assertEqual(3, control.error_memory_read_count.call_count)
+        self.assertEqual(2, control.error_memory_read_errors.call_count)
+
+    def test_cursor_and_records_are_persisted(self):
+        errors = [hard_fault(0x100), hard_fault(0x200), assert_failure(5)]
+        storage = MemoryStorage()
+        ErrorHarvester(self._create_control(errors), storage).step()
+
+        errors.append(assert_failure(6))
+        control = self._create_control(errors)
+        harvester = ErrorHarvester(control, storage)
+        self.assertEqual(2, len(harvester.records))
+
+        harvester.step()
+        control.error_memory_read_errors.assert_called_once_with(2)
+        self.assertEqual(4, len(harvester.records))
+
+    def test_cleared_error_memory_is_read_from_start(self):
+        errors = [hard_fault(0x100), hard_fault(0x200), assert_failure(5)]
+        control = self._create_control(errors)
+        harvester = ErrorHarvester(control, MemoryStorage())
+        while harvester.step():
+            pass
+
+        errors[:] = [hard_fault(0x100), assert_failure(7)]
+        harvester.step()
+
+        self.assertEqual(5, harvester.record_count)
+        self.assertEqual(0, control.error_memory_read_errors.call_args[0][0])
+
+    def test_repeated_identical_errors_are_all_kept(self):
+        errors = [hard_fault(0x100), hard_fault(0x100), hard_fault(0x100)]
+        storage = MemoryStorage()
+        harvester = ErrorHarvester(self._create_control(errors), storage)
+        while harvester.step():
+            pass
+
+        self.assertEqual(3, harvester.record_count)
+        self.assertEqual(3, ErrorHarvester(self._create_control(errors), storage).record_count)
+
+    def test_only_recent_records_are_kept_but_all_are_counted(self):
+        errors = [hard_fault(0x100 + i) for i in range(10)] + [assert_failure(5)]
+        storage = Mock(wraps=MemoryStorage())
+
+        class SmallHarvester(ErrorHarvester):
+            max_segments = 2
+
+        harvester = SmallHarvester(self._create_control(errors), storage)
+        while harvester.step():
+            pass
+
+        self.assertEqual(11, harvester.record_count)
+        self.assertEqual(10, harvester.error_counts[ErrorType.HardFault])
+        self.assertEqual(1, harvester.error_counts[ErrorType.AssertFailure])
+        self.assertEqual([parse_error_record(raw) for raw in errors[8:]], harvester.records)
+        self.assertEqual(harvester.records, SmallHarvester(self._create_control(errors), storage).records)
+
+        # each step only writes the new page and the small state file
+        segment_writes = [c[0][1] for c in storage.write.call_args_list if c[0][0] != ErrorHarvester.state_file]
+        self.assertEqual(6, len(segment_writes))
+        self.assertTrue(all(len(data) <= 2 * (1 + len(hard_fault(0))) for data in segment_writes))
+
+    def test_counts_and_recent_records_are_restored(self):
+        errors = [hard_fault(0x100), assert_failure(5), assert_failure(6)]
+        storage = MemoryStorage()
+        harvester = ErrorHarvester(self._create_control(errors), storage)
+        while harvester.step():
+            pass
+
+        restored = ErrorHarvester(self._create_control(errors), storage)
+
+        self.assertEqual(3, restored.record_count)
+        self.assertEqual(harvester.error_counts, restored.error_counts)
+        self.assertEqual(harvester.records, restored.records)
+        self.assertFalse(restored.step())
@@ -88,6 +88,19 @@ class TestRevvyTransport(unittest.TestCase):
         self.assertEqual(ResponseHeader.Status_Ok, response.status)
         self.assertEqual(0, len(response.payload))
 
+    def test_pending_commands_are_counted_while_sending(self):
+        mock_interface = MockInterface([
+            [ResponseHeader.Status_Ok, 0, 0xFF, 0xFF, 117]
+        ])
+        rt = RevvyTransport(mock_interface)
+        pending = []
+        mock_interface.write = lambda data: pending.append(rt.pending_commands)
+
+        self.assertEqual(0, rt.pending_commands)
+        rt.send_command(10)
+        self.assertEqual([1], pending)
+        self.assertEqual(0, rt.pending_commands)
+
     def test_retry_reading_after_busy_response(self):
         mock_interface = MockInterface([
             [ResponseHeader.Status_Busy, 0, 0xFF, 0xFF, 118],
@@ -16,16 +16,14 @@ class TestRemoteController(unittest.TestCase):
             mocks.append(mock)
 
         for i in range(32):
-            buttons = [False] * 32
-
-            rc.tick(RemoteControllerCommand(buttons=buttons, analog=[0] * 10))
+            rc.tick(RemoteControllerCommand(buttons=0, analog=bytes(10)))
 
             # ith button is pressed
-            buttons[i] = True
-            rc.tick(RemoteControllerCommand(buttons=buttons, analog=[0] * 10))
+            buttons = 1 << i
+            rc.tick(RemoteControllerCommand(buttons=buttons, analog=bytes(10)))
 
             # button is kept pressed
-            rc.tick(RemoteControllerCommand(buttons=buttons, analog=[0] * 10))
+            rc.tick(RemoteControllerCommand(buttons=buttons, analog=bytes(10)))
 
             for j in range(32):
                 self.assertEqual(mocks[j].call_count, 1 if i == j else 0)
@@ -33,17 +31,14 @@ class TestRemoteController(unittest.TestCase):
 
     def test_last_button_pressed_state_can_be_read(self):
         rc = RemoteController()
-        rc.tick(RemoteControllerCommand(buttons=[False] * 32, analog=[0] * 10))
+        rc.tick(RemoteControllerCommand(buttons=0, analog=bytes(10)))
 
         for i in range(32):
-            buttons = [False] * 32
             # ith button is pressed
-            buttons[i] = True
-
-            rc.tick(RemoteControllerCommand(buttons=buttons, analog=[0] * 10))
+            rc.tick(RemoteControllerCommand(buttons=1 << i, analog=bytes(10)))
 
             for j in range(32):
-                self.assertEqual(buttons[i], rc.is_button_pressed(i))
+                self.assertEqual(i == j, rc.is_button_pressed(j))
 
     def test_last_analog_channel_state_can_be_read(self):
         rc = RemoteController()
@@ -53,7 +48,7 @@ class TestRemoteController(unittest.TestCase):
             # ith button is pressed
             analog[i] = 255
 
-            rc.tick(RemoteControllerCommand(buttons=[False]*32, analog=analog))
+            rc.tick(RemoteControllerCommand(buttons=0, analog=bytes(analog)))
 
             for j in range(10):
                 self.assertEqual(analog[i], rc.analog_value(i))
@@ -68,7 +63,7 @@ class TestRemoteController(unittest.TestCase):
         rc.on_analog_values([3], mock3)
         rc.on_analog_values([3, 11], mock_invalid)
 
-        rc.tick(RemoteControllerCommand(buttons=[False] * 32, analog=[255, 254, 253, 123, 43, 65, 45, 42]))
+        rc.tick(RemoteControllerCommand(buttons=0, analog=bytes([255, 254, 253, 123, 43, 65, 45, 42])))
 
         self.assertEqual(mock24.call_count, 1)
         self.assertEqual(mock3.call_count, 1)
@@ -86,14 +81,14 @@ class TestRemoteController(unittest.TestCase):
     def test_reset_removed_button_and_analog_handlers_and_clears_stored_data(self):
         mock = Mock()
         rc = RemoteController()
-        rc.tick(RemoteControllerCommand(buttons=[False] * 32, analog=[]))
+        rc.tick(RemoteControllerCommand(buttons=0, analog=b''))
 
         rc.on_analog_values([2, 4], mock)
         rc.on_analog_values([3], mock)
 
         rc.on_button_pressed(5, mock)
 
-        rc.tick(RemoteControllerCommand(buttons=[True] * 32, analog=[255, 254, 253, 123, 43, 65, 45, 42]))
+        rc.tick(RemoteControllerCommand(buttons=0xFFFFFFFF, analog=bytes([255, 254, 253, 123, 43, 65, 45, 42])))
 
         self.assertEqual(3, mock.call_count)
         self.assertEqual(254, rc.analog_value(1))
@@ -106,7 +101,7 @@ class TestRemoteController(unittest.TestCase):
         self.assertEqual(0, rc.analog_value(1))
         self.assertFalse(rc.is_button_pressed(1))
 
-        rc.tick(RemoteControllerCommand(buttons=[True] * 32, analog=[255, 254, 253, 123, 43, 65, 45, 42]))
+        rc.tick(RemoteControllerCommand(buttons=0xFFFFFFFF, analog=bytes([255, 254, 253, 123, 43, 65, 45, 42])))
 
         self.assertEqual(0, mock.call_count)
 
@@ -116,23 +111,38 @@ class TestRemoteController(unittest.TestCase):
 
         rc.on_button_pressed(5, mock)
 
-        rc.tick(RemoteControllerCommand(buttons=[True] * 32, analog=[]))
+        rc.tick(RemoteControllerCommand(buttons=0xFFFFFFFF, analog=b''))
 
         self.assertEqual(0, mock.call_count)
         self.assertFalse(rc.is_button_pressed(1))
 
-        rc.tick(RemoteControllerCommand(buttons=[False] * 32, analog=[]))
-        rc.tick(RemoteControllerCommand(buttons=[True] * 32, analog=[]))
+        rc.tick(RemoteControllerCommand(buttons=0, analog=b''))
+        rc.tick(RemoteControllerCommand(buttons=0xFFFFFFFF, analog=b''))
 
         self.assertEqual(1, mock.call_count)
         self.assertTrue(rc.is_button_pressed(1))
 
-        rc.tick(RemoteControllerCommand(buttons=[False] * 32, analog=[]))
+        rc.tick(RemoteControllerCommand(buttons=0, analog=b''))
         mock.reset_mock()
         rc.reset()
 
-        rc.tick(RemoteControllerCommand(buttons=[True] * 32, analog=[]))
-        rc.tick(RemoteControllerCommand(buttons=[True] * 32, analog=[]))
+        rc.tick(RemoteControllerCommand(buttons=0xFFFFFFFF, analog=b''))
+        rc.tick(RemoteControllerCommand(buttons=0xFFFFFFFF, analog=b''))
 
         self.assertEqual(0, mock.call_count)
         self.assertFalse(rc.is_button_pressed(1))
+
+    def test_only_changed_buttons_trigger_actions(self):
+        rc = RemoteController()
+        mocks = [Mock() for _ in range(3)]
+        for i, mock in enumerate(mocks):
+            rc.on_button_pressed(i, mock)
+
+        rc.tick(RemoteControllerCommand(buttons=0, analog=b''))
+        rc.tick(RemoteControllerCommand(buttons=0b011, analog=b''))
+        rc.tick(RemoteControllerCommand(buttons=0b110, analog=b''))
+
+        self.assertEqual([1, 1, 1], [mock.call_count for mock in mocks])
+        self.assertFalse(rc.is_button_pressed(0))
+        self.assertTrue(rc.is_button_pressed(1))
+        self.assertTrue(rc.is_button_pressed(2))
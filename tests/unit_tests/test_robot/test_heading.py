@@ -0,0 +1,72 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import struct
+import unittest
+
+from mock import Mock
+
+from revvy.robot.drivetrain import DifferentialDrivetrain
+from revvy.robot.heading import HeadingController, PidController, DriveSimulator
+from revvy.robot.imu import IMU
+
+
+class TestHeadingController(unittest.TestCase):
+    def test_robot_turning_clockwise_is_corrected_counter_clockwise(self):
+        set_speeds = Mock()
+        controller = HeadingController(set_speeds, PidController(kp=10))
+
+        controller.hold(90, 500, 500, power_limit=20)
+        controller.update(88, 0)
+
+        self.assertEqual([((500, 500, 20), {}), ((480, 520, 20), {})], set_speeds.call_args_list)
+
+    def test_no_correction_is_sent_after_release(self):
+        set_speeds = Mock()
+        controller = HeadingController(set_speeds, PidController(kp=10))
+
+        controller.hold(0, 500, 500)
+        controller.release()
+        controller.update(10, 0)
+
+        self.assertFalse(controller.is_active)
+        self.assertEqual(1, set_speeds.call_count)
+
+    def test_releasing_an_old_hold_keeps_the_new_one(self):
+        controller = HeadingController(Mock(), PidController(kp=10))
+
+        first = controller.hold(0, 500, 500)
+        controller.hold(0, 300, 300)
+        controller.release(first)
+
+        self.assertTrue(controller.is_active)
+
+    def test_drifting_robot_keeps_heading(self):
+        robot = DriveSimulator(bias=0.05)
+        controller = HeadingController(robot.set_speeds)
+
+        controller.hold(robot.measured_yaw, 900, 900)
+        for i in range(1, 251):
+            robot.step(0.02)
+            controller.update(robot.measured_yaw, i * 0.02)
+
+        self.assertLess(abs(robot.yaw), 3)
+
+
+class TestDrivetrainHeadingHold(unittest.TestCase):
+    def test_yaw_updates_correct_speeds_until_speeds_are_set(self):
+        interface = Mock()
+        imu = IMU()
+        imu.update_yaw_angles(struct.pack('<ll', 45, 0))
+        drivetrain = DifferentialDrivetrain(interface, 6, imu)
+
+        drivetrain.hold_heading(500, 500, 20)
+        imu.update_yaw_angles(struct.pack('<ll', 40, 0))
+        self.assertEqual(2, interface.set_drivetrain_speed.call_count)
+        (left, right, power_limit) = interface.set_drivetrain_speed.call_args[0]
+        self.assertLess(left, right)
+        self.assertEqual(20, power_limit)
+
+        drivetrain.set_speeds(0, 0)
+        imu.update_yaw_angles(struct.pack('<ll', 30, 0))
+        self.assertEqual(3, interface.set_drivetrain_speed.call_count)
+        interface.set_drivetrain_speed.assert_called_with(0, 0, 0)
@@ -0,0 +1,78 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import struct
+import unittest
+
+from mock import Mock
+
+from revvy.robot.imu import IMU
+
+
+class TestIMU(unittest.TestCase):
+    def test_latest_values_are_scaled(self):
+        imu = IMU()
+
+        imu.update_axl_data(struct.pack('<hhh', 1000, 0, -1000))
+        imu.update_gyro_data(struct.pack('<hhh', 0, 100, 0))
+        imu.update_yaw_angles(struct.pack('<ll', 90, -10))
+
+        self.assertAlmostEqual(61, imu.acceleration.x)
+        self.assertAlmostEqual(-61, imu.acceleration.z)
+        self.assertAlmostEqual(3.5, imu.rotation.y)
+        self.assertEqual(90, imu.yaw_angle)
+        self.assertEqual(-10, imu.relative_yaw_angle)
+
+    def test_history_keeps_last_samples(self):
+        imu = IMU()
+
+        for i in range(imu.history_length + 10):
+            imu.update_yaw_angles(struct.pack('<ll', i, 0))
+
+        timestamps, values = imu.yaw_history.window(3)
+        self.assertEqual(3, len(timestamps))
+        n = imu.history_length + 10
+        self.assertEqual([n - 3, n - 2, n - 1], imu.yaw_history.channel(0, 3).tolist())
+        self.assertEqual(imu.history_length, len(imu.yaw_history.channel(0)))
+
+    def test_tilt_follows_gravity(self):
+        imu = IMU()
+
+        # lying flat, gravity along z
+        imu.update_axl_data(struct.pack('<hhh', 0, 0, 16000))
+        imu.update_gyro_data(struct.pack('<hhh', 0, 0, 0))
+        self.assertAlmostEqual(0, imu.roll)
+        self.assertAlmostEqual(0, imu.pitch)
+
+        # tilted to the side, the estimate approaches the measured angle
+        for _ in range(500):
+            imu.update_axl_data(struct.pack('<hhh', 0, 16000, 16000))
+            imu.update_gyro_data(struct.pack('<hhh', 0, 0, 0))
+
+        self.assertAlmostEqual(45, imu.roll, places=1)
+        self.assertAlmostEqual(0, imu.pitch)
+
+    def test_relative_yaw_is_measured_from_pinned_angle(self):
+        imu = IMU()
+        callback = Mock()
+        imu.on_yaw_changed(callback)
+
+        imu.update_yaw_angles(struct.pack('<ll', 30, 5))
+        imu.pin_yaw()
+        imu.update_yaw_angles(struct.pack('<ll', 20, 7))
+
+        self.assertEqual(-10, imu.relative_yaw_angle)
+        self.assertEqual(20, callback.call_args[0][0])
+
+        imu.unpin_yaw()
+        self.assertEqual(7, imu.relative_yaw_angle)
+
+    def test_vectors_are_snapshots(self):
+        imu = IMU()
+
+        imu.update_axl_data(struct.pack('<hhh', 1000, 0, 0))
+        before = imu.acceleration
+        imu.update_axl_data(struct.pack('<hhh', 2000, 0, 0))
+        (x, y, z) = imu.acceleration
+
+        self.assertAlmostEqual(61, before.x)
+        self.assertAlmostEqual(122, x)
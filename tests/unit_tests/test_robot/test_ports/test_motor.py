@@ -33,12 +33,12 @@ class TestMotorPortHandler(unittest.TestCase):
         ports = create_motor_port_handler(mock_control, configs)
 
         self.assertRaises(KeyError, lambda: ports[0])
-        self.assertIs(PortInstance, type(ports[1]))
-        self.assertIs(PortInstance, type(ports[2]))
-        self.assertIs(PortInstance, type(ports[3]))
-        self.assertIs(PortInstance, type(ports[4]))
-        self.assertIs(PortInstance, type(ports[5]))
-        self.assertIs(PortInstance, type(ports[6]))
+        self.assertIsInstance(ports[1], PortInstance)
+        self.assertIsInstance(ports[2], PortInstance)
+        self.assertIsInstance(ports[3], PortInstance)
+        self.assertIsInstance(ports[4], PortInstance)
+        self.assertIsInstance(ports[5], PortInstance)
+        self.assertIsInstance(ports[6], PortInstance)
         self.assertRaises(KeyError, lambda: ports[7])
 
     def test_configure_raises_error_if_driver_is_not_supported_in_mcu(self):
@@ -54,7 +54,7 @@ class TestMotorPortHandler(unittest.TestCase):
 
         ports = create_motor_port_handler(mock_control, configs)
 
-        self.assertIs(PortInstance, type(ports[1]))
+        self.assertIsInstance(ports[1], PortInstance)
         self.assertEqual(0, mock_control.set_motor_port_type.call_count)
 
         self.assertRaises(KeyError, lambda: ports[1].configure("Test"))
@@ -73,7 +73,7 @@ class TestMotorPortHandler(unittest.TestCase):
 
         ports = create_motor_port_handler(mock_control, configs)
 
-        self.assertIs(PortInstance, type(ports[1]))
+        self.assertIsInstance(ports[1], PortInstance)
         self.assertEqual(0, mock_control.set_motor_port_type.call_count)
 
         ports[1].configure("NotConfigured")
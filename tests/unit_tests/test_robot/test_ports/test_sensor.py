@@ -2,7 +2,7 @@
 
 import unittest
 
-from mock import Mock
+from mock import Mock, patch
 
 from revvy.robot.ports.common import PortInstance
 from revvy.robot.ports.sensor import create_sensor_port_handler, BaseSensorPortDriver, bumper_switch, hcsr04
@@ -33,10 +33,10 @@ class TestSensorPortHandler(unittest.TestCase):
         ports = create_sensor_port_handler(mock_control, configs)
 
         self.assertRaises(KeyError, lambda: ports[0])
-        self.assertIs(PortInstance, type(ports[1]))
-        self.assertIs(PortInstance, type(ports[2]))
-        self.assertIs(PortInstance, type(ports[3]))
-        self.assertIs(PortInstance, type(ports[4]))
+        self.assertIsInstance(ports[1], PortInstance)
+        self.assertIsInstance(ports[2], PortInstance)
+        self.assertIsInstance(ports[3], PortInstance)
+        self.assertIsInstance(ports[4], PortInstance)
         self.assertRaises(KeyError, lambda: ports[5])
 
     def test_configure_raises_error_if_driver_is_not_supported_in_mcu(self):
@@ -52,7 +52,7 @@ class TestSensorPortHandler(unittest.TestCase):
 
         ports = create_sensor_port_handler(mock_control, configs)
 
-        self.assertIs(PortInstance, type(ports[1]))
+        self.assertIsInstance(ports[1], PortInstance)
         self.assertEqual(0, mock_control.set_sensor_port_type.call_count)
 
         self.assertRaises(KeyError, lambda: ports[1].configure("Test"))
@@ -71,12 +71,39 @@ class TestSensorPortHandler(unittest.TestCase):
 
         ports = create_sensor_port_handler(mock_control, configs)
 
-        self.assertIs(PortInstance, type(ports[1]))
+        self.assertIsInstance(ports[1], PortInstance)
         self.assertEqual(0, mock_control.set_motor_port_type.call_count)
 
         ports[1].configure("NotConfigured")
         self.assertEqual(0, mock_control.set_motor_port_type.call_count)
 
+    def test_configured_port_forwards_to_driver(self):
+        configs = {
+            "NotConfigured": {'driver': 'NotConfigured', 'config': {}},
+            "Distance": {'driver': "HC_SR04", 'config': {}}
+        }
+
+        mock_control = Mock()
+        mock_control.get_sensor_port_amount = Mock(return_value=4)
+        mock_control.get_sensor_port_types = Mock(return_value={"NotConfigured": 0, "HC_SR04": 1})
+        mock_control.get_sensor_port_value = Mock(return_value=bytes([5, 0, 0, 0]))
+
+        ports = create_sensor_port_handler(mock_control, configs)
+        self.assertEqual(0, ports[1].value)
+
+        ports[1].configure("Distance")
+        ports[2].configure("Distance")
+        reading = ports[1].read()
+
+        self.assertEqual(5, reading.converted)
+        self.assertEqual(5, ports[1].value)
+        self.assertIsNone(ports[2].value)
+        self.assertIs(type(ports[1]), type(ports[2]))
+        self.assertIs(reading, ports[1].read())
+
+        ports[1].uninitialize()
+        self.assertEqual(0, ports[1].value)
+
 
 def create_port():
 
@@ -93,16 +120,16 @@ class TestBaseSensorPortDriver(unittest.TestCase):
     def test_port_has_no_data_before_first_read(self):
         port = create_port()
 
-        sensor = BaseSensorPortDriver(port)
+        decoder = Mock(return_value=5)
+        sensor = BaseSensorPortDriver(port, decoder)
         port.interface.get_sensor_port_value.return_value = [1, 2, 3, 4]
-        sensor.convert_sensor_value = Mock(return_value=5)
 
         self.assertFalse(sensor.has_data)
         sensor.read()
         self.assertEqual(1, port.interface.get_sensor_port_value.call_count)
         self.assertEqual(3, port.interface.get_sensor_port_value.call_args[0][0])
 
-        self.assertEqual(1, sensor.convert_sensor_value.call_count)
+        self.assertEqual(1, decoder.call_count)
         self.assertTrue(sensor.has_data)
 
 
@@ -152,3 +179,39 @@ class TestHcSr04(unittest.TestCase):
         sensor.read()
         self.assertTrue(sensor.has_data)
         self.assertEqual(5, sensor.value)
+
+    def test_wrong_data_length_is_reported_once(self):
+        port = create_port()
+        port.interface.get_sensor_port_value.side_effect = [bytes([1, 2]), bytes([3, 4]), bytes([5, 0, 0, 0])]
+
+        sensor = hcsr04(port, None)
+
+        with patch('revvy.robot.ports.sensor.print', create=True) as mock_print:
+            sensor.read()
+            sensor.read()
+            self.assertFalse(sensor.has_data)
+
+            sensor.read()
+            self.assertEqual(5, sensor.value)
+
+        self.assertEqual(1, mock_print.call_count)
+
+    def test_filters_and_history_are_updated_with_every_valid_sample(self):
+        port = create_port()
+
+        port.interface.get_sensor_port_value.side_effect = [
+            bytes([10, 0, 0, 0]),
+            bytes([0, 0, 0, 0]),
+            bytes([200, 0, 0, 0]),
+            bytes([10, 0, 0, 0]),
+            bytes([10, 0, 0, 0])]
+
+        sensor = hcsr04(port, {'history_length': 3, 'median_window': 3, 'ema_alpha': 0.5})
+
+        for _ in range(5):
+            sensor.read()
+
+        self.assertEqual([200, 10, 10], sensor.history)
+        self.assertEqual(10, sensor.filtered_value('median'))
+        self.assertEqual(10, sensor.value)
+        self.assertEqual(10 + (200 - 10) / 8, sensor.filtered_value('ema'))
@@ -3,7 +3,7 @@
 import unittest
 
 from revvy.functions import b64_encode_str
-from revvy.robot_config import RobotConfig
+from revvy.robot_config import RobotConfig, RobotConfigDiff
 
 
 class TestRobotConfig(unittest.TestCase):
@@ -411,3 +411,87 @@ class TestRobotConfig(unittest.TestCase):
 
         config = RobotConfig.from_string(json)
         self.assertIsNotNone(config)
+
+
+class TestRobotConfigDiff(unittest.TestCase):
+    @staticmethod
+    def create_config():
+        config = RobotConfig()
+        config.motors[1] = 'RevvyMotor'
+        config.motors[2] = 'RevvyMotor_CCW'
+        config.motors.names['left'] = 2
+        config.drivetrain['left'].append(2)
+        config.sensors[1] = 'HC_SR04'
+        config.scripts['user_script_0'] = {'script': 'some code', 'priority': 0}
+        config.scripts['user_script_1'] = {'script': 'other code', 'priority': 1}
+        config.controller.buttons[0] = 'user_script_0'
+        config.background_scripts.append('user_script_1')
+        return config
+
+    def test_identical_configs_have_no_difference(self):
+        diff = RobotConfigDiff(self.create_config(), self.create_config())
+
+        self.assertTrue(diff.is_empty)
+
+    def test_changed_ports_are_listed(self):
+        new = self.create_config()
+        new.motors[2] = 'NotConfigured'
+        new.motors[3] = 'RevvyMotor'
+        new.sensors[1] = 'BumperSwitch'
+
+        diff = RobotConfigDiff(self.create_config(), new)
+
+        self.assertEqual([2, 3], diff.motors)
+        self.assertEqual([1], diff.sensors)
+        self.assertFalse(diff.drivetrain)
+        self.assertEqual([], diff.scripts)
+
+    def test_drivetrain_change_is_detected(self):
+        new = self.create_config()
+        new.drivetrain['right'].append(1)
+
+        diff = RobotConfigDiff(self.create_config(), new)
+
+        self.assertTrue(diff.drivetrain)
+        self.assertEqual([], diff.motors)
+
+    def test_only_changed_scripts_are_listed(self):
+        new = self.create_config()
+        new.scripts['user_script_1'] = {'script': 'changed code', 'priority': 1}
+        new.scripts['user_script_2'] = {'script': 'new code', 'priority': 0}
+
+        old = self.create_config()
+        old.scripts['user_script_3'] = {'script': 'removed', 'priority': 0}
+
+        diff = RobotConfigDiff(old, new)
+
+        self.assertEqual(['user_script_1', 'user_script_2'], diff.scripts)
+        self.assertEqual(['user_script_3'], diff.removed_scripts)
+        self.assertFalse(diff.controller)
+
+    def test_priority_change_is_a_script_change(self):
+        new = self.create_config()
+        new.scripts['user_script_0'] = {'script': 'some code', 'priority': 3}
+
+        diff = RobotConfigDiff(self.create_config(), new)
+
+        self.assertEqual(['user_script_0'], diff.scripts)
+
+    def test_renamed_ports_change_every_script(self):
+        new = self.create_config()
+        new.motors.names['right'] = 2
+        del new.motors.names['left']
+
+        diff = RobotConfigDiff(self.create_config(), new)
+
+        self.assertEqual(['user_script_0', 'user_script_1'], diff.scripts)
+
+    def test_controller_binding_change_is_detected(self):
+        new = self.create_config()
+        new.controller.buttons[0] = None
+        new.controller.buttons[1] = 'user_script_0'
+
+        diff = RobotConfigDiff(self.create_config(), new)
+
+        self.assertTrue(diff.controller)
+        self.assertEqual([], diff.scripts)
@@ -1,9 +1,12 @@
 # SPDX-License-Identifier: GPL-3.0-only
 
+import time
 import unittest
 from mock import Mock
 
+from revvy.functions import map_values
 from revvy.scripting.builtin_scripts import drive_joystick, drive_2sticks
+from revvy.scripting.controllers import ControllerCurve, expo_joystick, normalize_analog
 
 
 class TestJoystickScripts(unittest.TestCase):
@@ -93,3 +96,33 @@ class TestStickDriveScripts(unittest.TestCase):
         args = {'robot': robot, 'input': [0, 0]}
         drive_2sticks(args)
         self.assertEqual((-900, -900), mock.call_args[0])
+
+
+class TestControllerCurve(unittest.TestCase):
+    def test_table_matches_controller_function(self):
+        curve = ControllerCurve(expo_joystick)
+
+        for x in range(0, 256, 5):
+            for y in range(0, 256, 5):
+                (sl, sr) = expo_joystick(normalize_analog(x), normalize_analog(y))
+                expected = (map_values(sl, 0, 1, 0, 900), map_values(sr, 0, 1, 0, 900))
+                self.assertEqual(expected, curve(x, y))
+
+    def test_batch_converts_every_sample(self):
+        curve = ControllerCurve(expo_joystick)
+        samples = [(127, 127), (127, 255), (0, 127), (30, 200)]
+
+        self.assertEqual([curve(x, y) for (x, y) in samples], curve.batch(samples))
+
+    def test_prepare_builds_tables_in_the_background(self):
+        curve = ControllerCurve(expo_joystick)
+        self.assertFalse(curve.is_ready)
+
+        curve.prepare()
+
+        start = time.time()
+        while not curve.is_ready and time.time() - start < 10:
+            time.sleep(0.01)
+
+        self.assertTrue(curve.is_ready)
+        self.assertEqual((0.0, 0.0), curve(127, 127))
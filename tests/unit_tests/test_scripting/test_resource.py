@@ -1,6 +1,8 @@
 # SPDX-License-Identifier: GPL-3.0-only
 
+import time
 import unittest
+from threading import Thread
 
 from mock import Mock
 
@@ -79,3 +81,124 @@ class TestResource(unittest.TestCase):
         handle2 = r.request(priority_high)
 
         self.assertEqual(handle, handle2)
+
+    def test_same_priority_request_does_not_create_new_owner(self):
+        r = Resource()
+
+        handle = r.request(priority_high)
+        generation = r.generation
+
+        self.assertIs(handle, r.request(priority_high))
+        self.assertEqual(generation, r.generation)
+        self.assertEqual(1, r.metrics.fast_path)
+
+    def test_interrupted_handle_is_not_returned(self):
+        r = Resource()
+
+        handle = r.request(priority_low)
+        handle2 = r.request(priority_high)
+        r.release(handle2)
+
+        handle3 = r.request(priority_low)
+        self.assertIsNot(handle, handle3)
+        self.assertGreater(handle3.generation, handle.generation)
+        self.assertFalse(handle3.is_interrupted)
+
+    def test_metrics_count_preemptions_and_denied_requests(self):
+        r = Resource()
+
+        r.request(priority_low)
+        r.request(priority_high)
+        r.request(priority_low)
+
+        metrics = r.metrics.as_dict()
+        self.assertEqual(3, metrics['requests'])
+        self.assertEqual(1, metrics['preemptions'])
+        self.assertEqual(1, metrics['denied'])
+
+    def test_waiting_request_gets_resource_when_released(self):
+        r = Resource()
+
+        handle = r.request(priority_high)
+        Thread(target=lambda: (time.sleep(0.05), handle.release())).start()
+
+        handle2 = r.request(priority_low, timeout=2)
+        self.assertIsNotNone(handle2)
+        self.assertFalse(handle2.is_interrupted)
+        self.assertEqual(1, r.metrics.queued)
+
+    def test_waiting_request_times_out(self):
+        r = Resource()
+
+        r.request(priority_high)
+
+        self.assertIsNone(r.request(priority_low, timeout=0.05))
+        self.assertEqual(1, r.metrics.timeouts)
+
+    def test_released_resource_is_handed_to_best_waiter_first(self):
+        r = Resource()
+        results = []
+
+        handle = r.request(0)
+
+        def _wait(priority):
+            h = r.request(priority, timeout=2)
+            results.append(priority)
+            h.release()
+
+        threads = [Thread(target=_wait, args=(priority,)) for priority in [3, 2]]
+        for thread in threads:
+            thread.start()
+
+        # wait until both requests are queued
+        start = time.time()
+        while r.metrics.queued < 2 and time.time() - start < 2:
+            time.sleep(0.01)
+
+        handle.release()
+        for thread in threads:
+            thread.join(2)
+
+        self.assertEqual([2, 3], results)
+
+    def test_resource_handed_to_interrupted_waiter_is_released(self):
+        r = Resource()
+        handle = r.request(priority_high)
+
+        def interrupted_wait(condition, predicate, timeout):
+            # the owner releases the resource just as the waiting script is stopped
+            handle.release()
+            raise InterruptedError
+
+        self.assertRaises(InterruptedError,
+                          lambda: r.request(priority_low, timeout=2, wait_for=interrupted_wait))
+
+        self.assertIsNotNone(r.request(priority_high))
+        self.assertEqual(['take', 'wait', 'release', 'take', 'release', 'take'], [t[1] for t in r.trace])
+
+    def test_waiters_are_released_on_reset(self):
+        r = Resource()
+
+        r.request(priority_high)
+        Thread(target=lambda: (time.sleep(0.05), r.reset())).start()
+
+        self.assertIsNone(r.request(priority_low, timeout=2))
+
+    def test_reset_interrupts_owner(self):
+        r = Resource()
+        taken_away = Mock()
+
+        handle = r.request(priority_low, taken_away)
+        r.reset()
+
+        self.assertTrue(handle.is_interrupted)
+        self.assertEqual(1, taken_away.call_count)
+
+    def test_trace_records_ownership_changes(self):
+        r = Resource()
+
+        handle = r.request(priority_low)
+        r.request(priority_high).release()
+        handle.release()
+
+        self.assertEqual(['take', 'preempt', 'take', 'release'], [event for _, event, _, _ in r.trace])
@@ -1,11 +1,23 @@
 # SPDX-License-Identifier: GPL-3.0-only
 
+import time
 import unittest
+from threading import Condition, Thread
+
 from mock import Mock
 
 from revvy.functions import hex2rgb
 from revvy.scripting.resource import Resource
-from revvy.scripting.robot_interface import RingLedWrapper, PortCollection, ResourceWrapper
+from revvy.scripting.robot_interface import RingLedWrapper, PortCollection, ResourceWrapper, SensorPortWrapper, \
+    MotorPortWrapper, MotorConstants, DriveTrainWrapper, MotionQueue
+from revvy.scripting.runtime import ScriptHandle
+
+
+def create_script_mock():
+    script = Mock()
+    script.is_stop_requested = False
+    script.wait_for = ScriptHandle._wait_for
+    return script
 
 
 class TestRingLed(unittest.TestCase):
@@ -70,3 +82,229 @@ class TestPortCollection(unittest.TestCase):
         self.assertEqual(3, pc['bar'])
         self.assertEqual(5, pc['baz'])
         self.assertRaises(KeyError, lambda: pc['foobar'])
+
+
+class TestStatusWaits(unittest.TestCase):
+    def test_sensor_read_returns_when_data_arrives(self):
+        sensor = Mock()
+        sensor.status_changed = Condition()
+        sensor.has_data = False
+        sensor.value = 5
+
+        def _update():
+            with sensor.status_changed:
+                sensor.has_data = True
+                sensor.status_changed.notify_all()
+
+        sw = SensorPortWrapper(create_script_mock(), sensor, ResourceWrapper(Resource(), 0))
+        Thread(target=_update).start()
+
+        self.assertEqual(5, sw.read())
+
+    def test_motor_move_waits_until_movement_finishes(self):
+        motor = Mock()
+        motor.status_changed = Condition()
+        motor.is_moving = True
+
+        def _set_position(*args, **kwargs):
+            Thread(target=_update).start()
+
+        def _update():
+            with motor.status_changed:
+                motor.is_moving = False
+                motor.status_changed.notify_all()
+
+        motor.set_position = Mock(side_effect=_set_position)
+
+        mw = MotorPortWrapper(create_script_mock(), motor, ResourceWrapper(Resource(), 0))
+        mw.move(MotorConstants.DIRECTION_FWD, 90, MotorConstants.UNIT_DEG, 20, MotorConstants.UNIT_SPEED_RPM)
+
+        self.assertEqual(1, motor.set_position.call_count)
+        self.assertFalse(motor.is_moving)
+
+
+class TestMotionCommands(unittest.TestCase):
+    def test_motor_commands_are_converted_to_mcu_units(self):
+        motor = Mock()
+        motor.is_moving = False
+        motor.status_changed = Condition()
+
+        mw = MotorPortWrapper(create_script_mock(), motor, ResourceWrapper(Resource(), 0))
+
+        mw.move(MotorConstants.DIRECTION_BACK, 2, MotorConstants.UNIT_ROT, 10, MotorConstants.UNIT_SPEED_RPM)
+        motor.set_position.assert_called_once_with(-720, speed_limit=60, pos_type='relative')
+
+        mw.spin(MotorConstants.DIRECTION_FWD, 50, MotorConstants.UNIT_SPEED_PWR)
+        motor.set_speed.assert_called_once_with(900, power_limit=50)
+
+        mw.stop(MotorConstants.ACTION_RELEASE)
+        motor.set_power.assert_called_once_with(0)
+
+    def test_invalid_units_are_rejected_before_taking_resource(self):
+        motor = Mock()
+        resource = Mock()
+
+        mw = MotorPortWrapper(create_script_mock(), motor, resource)
+
+        self.assertRaises(KeyError, lambda: mw.move(MotorConstants.DIRECTION_FWD, 1, MotorConstants.UNIT_TURN_ANGLE,
+                                                    10, MotorConstants.UNIT_SPEED_RPM))
+        self.assertEqual(0, resource.request.call_count)
+
+    def test_drivetrain_turn_directions(self):
+        drivetrain = Mock()
+        drivetrain.is_moving = False
+        drivetrain.status_changed = Condition()
+
+        dw = DriveTrainWrapper(create_script_mock(), drivetrain, ResourceWrapper(Resource(), 0))
+
+        dw.turn(MotorConstants.DIRECTION_RIGHT, 90, MotorConstants.UNIT_TURN_ANGLE, 10, MotorConstants.UNIT_SPEED_RPM)
+        drivetrain.turn.assert_called_once_with(-90, 60)
+
+        dw.turn(MotorConstants.DIRECTION_LEFT, 0, MotorConstants.UNIT_SEC, 20, MotorConstants.UNIT_SPEED_PWR)
+        self.assertEqual([((-900, 900), {'power_limit': 20}), ((0, 0), {})], drivetrain.set_speeds.call_args_list)
+
+    def test_heading_hold_is_released_when_timed_drive_is_interrupted(self):
+        drivetrain = Mock()
+        drivetrain.hold_heading = Mock(return_value=7)
+
+        script = create_script_mock()
+        script.sleep = Mock(side_effect=InterruptedError)
+
+        dw = DriveTrainWrapper(script, drivetrain, ResourceWrapper(Resource(), 0))
+
+        self.assertRaises(InterruptedError, lambda: dw.drive(MotorConstants.DIRECTION_FWD, 2, MotorConstants.UNIT_SEC,
+                                                             10, MotorConstants.UNIT_SPEED_RPM))
+        drivetrain.hold_heading.assert_called_once_with(60, 60)
+        drivetrain.release_heading.assert_called_once_with(7)
+        self.assertEqual(0, drivetrain.set_speeds.call_count)
+
+    def test_heading_hold_is_released_when_drivetrain_is_taken_away(self):
+        drivetrain = Mock()
+        drivetrain.hold_heading = Mock(return_value=7)
+        resource = Resource()
+
+        script = create_script_mock()
+        script.sleep = Mock(side_effect=lambda s: resource.request(0))
+
+        dw = DriveTrainWrapper(script, drivetrain, ResourceWrapper(resource, 1))
+        dw.drive(MotorConstants.DIRECTION_FWD, 2, MotorConstants.UNIT_SEC, 10, MotorConstants.UNIT_SPEED_RPM)
+
+        self.assertEqual(7, drivetrain.release_heading.call_args[0][0])
+        self.assertEqual(0, drivetrain.set_speeds.call_count)
+
+
+class TestMotionQueue(unittest.TestCase):
+    def test_timed_movements_are_sent_back_to_back(self):
+        drivetrain = Mock()
+        drivetrain.status_changed = None
+
+        queue = MotionQueue(create_script_mock(), drivetrain, ResourceWrapper(Resource(), 0))
+        first = queue.set_speeds(100, 100, 0.05)
+        second = queue.set_speeds(200, 200, 0.05)
+
+        self.assertTrue(queue.wait(2))
+
+        self.assertTrue(first.done)
+        self.assertFalse(first.cancelled)
+        self.assertTrue(second.done)
+        self.assertEqual([((100, 100), {}), ((200, 200), {}), ((0, 0), {})], drivetrain.set_speeds.call_args_list)
+
+    def test_positional_movement_finishes_on_status_update(self):
+        drivetrain = Mock()
+        drivetrain.status_changed = Condition()
+        drivetrain.is_moving = False
+
+        def _stop_moving():
+            time.sleep(0.01)
+            with drivetrain.status_changed:
+                drivetrain.is_moving = False
+                drivetrain.status_changed.notify_all()
+
+        def _move(*args, **kwargs):
+            drivetrain.is_moving = True
+            Thread(target=_stop_moving).start()
+
+        drivetrain.move = Mock(side_effect=_move)
+
+        queue = MotionQueue(create_script_mock(), drivetrain, ResourceWrapper(Resource(), 0))
+        handle = queue.drive(MotorConstants.DIRECTION_FWD, 1, MotorConstants.UNIT_ROT,
+                             10, MotorConstants.UNIT_SPEED_RPM)
+
+        self.assertTrue(handle.wait(2))
+        self.assertFalse(handle.cancelled)
+        drivetrain.move.assert_called_once_with(360, 360, left_speed=60, right_speed=60)
+        self.assertEqual(0, drivetrain.set_speeds.call_count)
+
+    def test_cancel_stops_current_and_queued_movements(self):
+        drivetrain = Mock()
+        drivetrain.status_changed = None
+
+        resource = Resource()
+        queue = MotionQueue(create_script_mock(), drivetrain, ResourceWrapper(resource, 0))
+        first = queue.set_speeds(100, 100, 10)
+        second = queue.set_speeds(200, 200, 10)
+
+        # wait for the first movement to start
+        start_time = time.time()
+        while not drivetrain.set_speeds.called and time.time() - start_time < 2:
+            time.sleep(0.01)
+
+        start_time = time.time()
+        queue.cancel()
+
+        self.assertTrue(queue.wait(2))
+        self.assertLess(time.time() - start_time, 1)
+        self.assertTrue(first.cancelled)
+        self.assertTrue(second.cancelled)
+        self.assertEqual(((0, 0), {}), drivetrain.set_speeds.call_args)
+
+        # resource is released when the queue is empty
+        self.assertIsNotNone(resource.request(1))
+
+    def test_queue_is_cancelled_when_script_is_stopped(self):
+        drivetrain = Mock()
+        drivetrain.status_changed = None
+
+        script = create_script_mock()
+        queue = MotionQueue(script, drivetrain, ResourceWrapper(Resource(), 0))
+        handle = queue.set_speeds(100, 100, 10)
+
+        # the script may have finished its run already, only the stop callback is called
+        (stop_requested_callback, ), _ = script.on_stop_requested.call_args
+        stop_requested_callback()
+
+        self.assertTrue(queue.wait(2))
+        self.assertTrue(handle.cancelled)
+        self.assertTrue(queue.is_idle)
+
+    def test_queue_is_aborted_when_resource_is_reset(self):
+        drivetrain = Mock()
+        drivetrain.status_changed = None
+
+        resource = Resource()
+        queue = MotionQueue(create_script_mock(), drivetrain, ResourceWrapper(resource, 0))
+        handle = queue.set_speeds(100, 100, 10)
+
+        start_time = time.time()
+        while not drivetrain.set_speeds.called and time.time() - start_time < 2:
+            time.sleep(0.01)
+
+        resource.reset()
+
+        self.assertTrue(handle.wait(2))
+        self.assertTrue(handle.cancelled)
+        self.assertTrue(queue.wait(2))
+
+    def test_movements_are_cancelled_if_resource_is_not_available(self):
+        drivetrain = Mock()
+        drivetrain.status_changed = None
+
+        resource = Resource()
+        resource.request(0)
+
+        queue = MotionQueue(create_script_mock(), drivetrain, ResourceWrapper(resource, 1))
+        handle = queue.set_speeds(100, 100, 1)
+
+        self.assertTrue(handle.wait(2))
+        self.assertTrue(handle.cancelled)
+        self.assertEqual(0, drivetrain.set_speeds.call_count)
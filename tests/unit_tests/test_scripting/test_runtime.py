@@ -1,11 +1,14 @@
 # SPDX-License-Identifier: GPL-3.0-only
 
+import time
 import unittest
 from mock import Mock
 
+from revvy.scripting.builtin_scripts import streaming
 from revvy.scripting.resource import Resource
 from revvy.scripting.robot_interface import RobotInterface
-from revvy.scripting.runtime import ScriptManager, Event
+from revvy.scripting.runtime import ScriptManager, Event, InputChannel
+from revvy.scripting.script_cache import ScriptCache
 
 
 class mockobj:
@@ -254,6 +257,28 @@ while not ctx.stop_requested:
         finally:
             sm.reset()
 
+    def test_script_with_syntax_error_is_rejected_when_added(self):
+        robot_mock = create_robot_mock()
+
+        sm = ScriptManager(robot_mock)
+
+        self.assertRaises(SyntaxError, lambda: sm.add_script('test', 'while'))
+        self.assertNotIn('test', sm)
+
+    def test_scripts_with_same_source_share_compiled_code(self):
+        robot_mock = create_robot_mock()
+
+        cache = ScriptCache()
+
+        sm = ScriptManager(robot_mock, cache)
+        try:
+            sm.add_script('test1', 'pass')
+            sm.add_script('test2', 'pass')
+
+            self.assertEqual(1, len(cache))
+        finally:
+            sm.reset()
+
     def test_new_stop_callback_is_called_even_after_script_is_stopped(self):
         robot_mock = create_robot_mock()
 
@@ -272,3 +297,177 @@ while not ctx.stop_requested:
 
         sm.reset()
         self.assertEqual(1, mock.call_count)
+
+    def test_reset_stops_scripts_in_parallel(self):
+        robot_mock = create_robot_mock()
+
+        def slow_to_stop(args):
+            evt = Event()
+            args['ctx'].on_stopped(evt.set)
+            evt.wait(2)
+            time.sleep(0.3)
+
+        sm = ScriptManager(robot_mock)
+        try:
+            for i in range(4):
+                sm.add_script('test{}'.format(i), slow_to_stop)
+                sm['test{}'.format(i)].start().wait(2)
+
+            start_time = time.time()
+            sm.reset()
+            self.assertLess(time.time() - start_time, 1)
+        finally:
+            sm.reset()
+
+    def test_reset_does_not_wait_for_scripts_that_ignore_stop(self):
+        robot_mock = create_robot_mock()
+        release = Event()
+
+        def hung(args):
+            release.wait(5)
+
+        sm = ScriptManager(robot_mock)
+        sm.stop_timeout = 0.1
+        try:
+            sm.add_script('hung', hung)
+            sm['hung'].start().wait(2)
+
+            start_time = time.time()
+            sm.reset()
+            self.assertLess(time.time() - start_time, 1)
+        finally:
+            release.set()
+            sm.reset()
+
+    def test_remove_scripts_only_removes_given_scripts(self):
+        robot_mock = create_robot_mock()
+
+        sm = ScriptManager(robot_mock)
+        try:
+            sm.add_script('test1', 'pass')
+            sm.add_script('test2', 'pass')
+            sm.add_script('test3', 'pass')
+
+            sm.remove_scripts(['test1', 'test3', 'nonexistent'])
+
+            self.assertEqual(['test2'], sm.names)
+        finally:
+            sm.reset()
+
+    def test_removed_script_stops_the_drivetrain_it_used(self):
+        robot_mock = create_robot_mock()
+        robot_mock.robot.drivetrain = Mock()
+
+        sm = ScriptManager(robot_mock)
+        try:
+            sm.add_script('driver', 'robot.drivetrain.set_speeds(100, 100)')
+            sm.add_script('idle', 'pass')
+
+            driver_finished = Event()
+            sm['driver'].on_stopped(driver_finished.set)
+            sm['driver'].start()
+            sm['idle'].start()
+            self.assertTrue(driver_finished.wait(2))
+
+            sm.remove_scripts(['idle'])
+            self.assertEqual([((100, 100), {})], robot_mock.robot.drivetrain.set_speeds.call_args_list)
+
+            sm.remove_scripts(['driver'])
+            self.assertEqual(((0, 0), {}), robot_mock.robot.drivetrain.set_speeds.call_args)
+        finally:
+            sm.reset()
+
+    def test_background_scripts_are_not_limited_by_running_scripts(self):
+        robot_mock = create_robot_mock()
+        started = Event()
+        sm = ScriptManager(robot_mock)
+
+        try:
+            running = []
+            for i in range(ScriptManager.max_running_per_priority + 1):
+                sm.add_script('endless_{}'.format(i), 'while not ctx.stop_requested: time.sleep(0.01)')
+                sm['endless_{}'.format(i)].is_background = True
+                running.append(sm['endless_{}'.format(i)].start())
+
+            sm.add_script('button', lambda args: started.set())
+            sm['button'].start()
+
+            self.assertTrue(all(evt.wait(2) for evt in running))
+            self.assertTrue(started.wait(2))
+        finally:
+            sm.reset()
+
+    def test_input_channel_returns_value_pushed_while_take_times_out(self):
+        channel = InputChannel()
+        channel.open()
+
+        def wait_for(condition, predicate, timeout):
+            # the value arrives after the wait timed out, but before take() returns
+            self.assertTrue(channel.push([1, 2]))
+            return False
+
+        self.assertEqual([1, 2], channel.take(wait_for, 0))
+        self.assertIsNone(channel.take(lambda condition, predicate, timeout: False, 0))
+        self.assertFalse(channel.push([3, 4]))
+
+    def test_input_pushed_while_streaming_script_finishes_is_not_lost(self):
+        robot_mock = create_robot_mock()
+
+        received = []
+        evt = Event()
+        sm = ScriptManager(robot_mock)
+
+        def single_take(args):
+            received.append(args['input_channel'].take(args['ctx'].wait_for, 0.01))
+            if len(received) == 1:
+                # the script is about to exit when this arrives
+                sm['test'].push_input([3, 4])
+            else:
+                evt.set()
+
+        single_take.streaming = True
+
+        try:
+            sm.add_script('test', single_take)
+            sm['test'].push_input([1, 2])
+
+            self.assertTrue(evt.wait(2))
+            self.assertEqual([[1, 2], [3, 4]], received)
+        finally:
+            sm.reset()
+
+    def test_streaming_script_consumes_inputs_without_restarting(self):
+        robot_mock = create_robot_mock()
+
+        received = []
+        evt = Event()
+
+        def consumer(args):
+            received.append(args['input'])
+            evt.set()
+
+        sm = ScriptManager(robot_mock)
+        try:
+            sm.add_script('test', streaming(consumer))
+            stopped = Mock(return_value=True)
+            sm['test'].on_stopped(stopped)
+
+            self.assertTrue(sm['test'].is_streaming)
+
+            sm['test'].push_input([1, 2])
+            self.assertTrue(evt.wait(2))
+            evt.clear()
+
+            sm['test'].push_input([3, 4])
+            self.assertTrue(evt.wait(2))
+
+            self.assertEqual([[1, 2], [3, 4]], received)
+            self.assertTrue(sm['test'].is_running)
+            self.assertEqual(0, stopped.call_count)
+
+            start_time = time.time()
+            sm.reset()
+            self.assertLess(time.time() - start_time, 0.5)
+            self.assertEqual(1, stopped.call_count)
+        finally:
+            sm.reset()
@@ -0,0 +1,76 @@
+# SPDX-License-Identifier: GPL-3.0-only
+
+import unittest
+from mock import Mock
+
+from revvy.file_storage import MemoryStorage
+from revvy.scripting.script_cache import ScriptCache
+
+
+class TestScriptCache(unittest.TestCase):
+    def test_same_source_is_compiled_once(self):
+        cache = ScriptCache()
+
+        code = cache.get('x = 1')
+
+        self.assertIs(code, cache.get('x = 1'))
+        self.assertIsNot(code, cache.get('x = 2'))
+        self.assertEqual(2, len(cache))
+
+    def test_least_recently_used_entry_is_dropped_when_full(self):
+        cache = ScriptCache(max_entries=2)
+
+        code = cache.get('x = 1')
+        cache.get('x = 2')
+        cache.get('x = 1')
+        cache.get('x = 3')
+
+        self.assertEqual(2, len(cache))
+        self.assertIs(code, cache.get('x = 1'))
+        self.assertEqual(2, len(cache))
+
+    def test_compiled_code_can_be_executed(self):
+        cache = ScriptCache()
+        variables = {}
+
+        exec(cache.get('x = 1 + 2'), variables)
+
+        self.assertEqual(3, variables['x'])
+
+    def test_syntax_error_is_raised_on_get(self):
+        cache = ScriptCache()
+
+        self.assertRaises(SyntaxError, lambda: cache.get('x = '))
+        self.assertEqual(0, len(cache))
+
+    def test_persisted_code_is_loaded_by_new_cache(self):
+        storage = MemoryStorage()
+        cache = ScriptCache(storage)
+        cache.get('x = 1')
+        cache.get('x = 2')
+        cache.persist(['x = 1'])
+
+        new_cache = ScriptCache(storage)
+
+        self.assertEqual(1, len(new_cache))
+        variables = {}
+        exec(new_cache.get('x = 1'), variables)
+        self.assertEqual(1, variables['x'])
+
+    def test_unchanged_set_is_not_written_again(self):
+        storage = Mock(wraps=MemoryStorage())
+        cache = ScriptCache(storage)
+        cache.get('x = 1')
+
+        cache.persist(['x = 1'])
+        cache.persist(['x = 1'])
+
+        self.assertEqual(1, storage.write.call_count)
+
+    def test_cache_from_other_python_version_is_ignored(self):
+        storage = MemoryStorage()
+        storage.write('script-cache', b'invalid', metadata={'magic': '00000000'})
+
+        cache = ScriptCache(storage)
+
+        self.assertEqual(0, len(cache))
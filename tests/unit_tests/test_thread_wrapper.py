@@ -2,11 +2,11 @@
 
 import time
 import unittest
-from threading import Event
+from threading import Event, Condition
 
-from mock import Mock
+from mock import Mock, patch, call
 
-from revvy.thread_wrapper import ThreadWrapper, ThreadContext
+from revvy.thread_wrapper import ThreadWrapper, ThreadContext, WorkerPool, PooledThreadWrapper
 
 
 class TestThreadWrapper(unittest.TestCase):
@@ -300,3 +300,254 @@ class TestThreadWrapper(unittest.TestCase):
                 self.assertEqual(1, mock.call_count)
         finally:
             tw.exit()
+
+    def test_wait_for_returns_when_predicate_becomes_true(self):
+        condition = Condition()
+        flag = Event()
+        mock = Mock()
+        done = Event()
+
+        def test_fn(ctx):
+            mock(ctx.wait_for(condition, flag.is_set, 2))
+            done.set()
+
+        tw = ThreadWrapper(test_fn)
+
+        try:
+            tw.start().wait()
+
+            flag.set()
+            with condition:
+                condition.notify_all()
+
+            self.assertTrue(done.wait(2))
+            mock.assert_called_once_with(True)
+        finally:
+            tw.exit()
+
+    def test_wait_for_is_interrupted_when_thread_is_stopped(self):
+        mock = Mock()
+        condition = Condition()
+
+        def test_fn(ctx):
+            try:
+                ctx.wait_for(condition, lambda: False)
+            except InterruptedError:
+                mock()
+                raise
+
+        tw = ThreadWrapper(test_fn)
+        start_time = time.time()
+        tw.start().wait()
+        tw.exit()
+        self.assertLess(time.time() - start_time, 2)
+        self.assertEqual(1, mock.call_count)
+
+
+class TestPooledThreadWrapper(unittest.TestCase):
+    def test_task_can_be_exited_if_not_started(self):
+        tw = PooledThreadWrapper(WorkerPool(), lambda ctx: None)
+        tw.exit()
+
+    def test_task_function_runs_once_per_start(self):
+        mock = Mock()
+        evt = Event()
+
+        def test_fn(ctx):
+            mock()
+            evt.set()
+
+        tw = PooledThreadWrapper(WorkerPool(), test_fn)
+
+        try:
+            for i in range(1, 3):
+                with self.subTest('Run #{}'.format(i)):
+                    evt.clear()
+                    tw.start()
+                    if not evt.wait(2):
+                        self.fail('Task function was not executed')
+
+                    self.assertEqual(i, mock.call_count)
+        finally:
+            tw.exit()
+
+    def test_finished_workers_are_reused(self):
+        pool = WorkerPool(max_idle_workers=1)
+        tasks = [PooledThreadWrapper(pool, lambda ctx: None) for _ in range(10)]
+
+        try:
+            for task in tasks:
+                task.start()
+                task.stop().wait(2)
+
+            # workers may still be returning to the pool, give them some time to settle
+            start_time = time.time()
+            while pool.worker_count > 1 and time.time() - start_time < 2:
+                time.sleep(0.01)
+
+            self.assertEqual(1, pool.worker_count)
+        finally:
+            for task in tasks:
+                task.exit()
+
+    def test_running_tasks_are_limited_per_priority(self):
+        pool = WorkerPool(max_per_priority=2)
+        started = Mock()
+
+        def test_fn(ctx):
+            started()
+            evt = Event()
+            ctx.on_stopped(evt.set)
+            evt.wait(2)
+
+        tasks = [PooledThreadWrapper(pool, test_fn, priority=0) for _ in range(3)]
+        other = PooledThreadWrapper(pool, test_fn, priority=1)
+
+        try:
+            running = [task.start() for task in tasks]
+            if not other.start().wait(2):
+                self.fail('Task with different priority was not started')
+
+            self.assertTrue(running[0].wait(2))
+            self.assertTrue(running[1].wait(2))
+            self.assertFalse(running[2].wait(0.1))
+            self.assertEqual(3, started.call_count)
+
+            # stopping a running task lets the queued one start
+            tasks[0].stop()
+            self.assertTrue(running[2].wait(2))
+            self.assertEqual(4, started.call_count)
+        finally:
+            for task in [*tasks, other]:
+                task.exit()
+
+    def test_unlimited_tasks_do_not_take_or_wait_for_slots(self):
+        pool = WorkerPool(max_per_priority=1)
+
+        def test_fn(ctx):
+            evt = Event()
+            ctx.on_stopped(evt.set)
+            evt.wait(2)
+
+        endless = [PooledThreadWrapper(pool, test_fn, limited=False) for _ in range(3)]
+        limited = PooledThreadWrapper(pool, test_fn)
+
+        try:
+            for task in endless:
+                self.assertTrue(task.start().wait(2))
+
+            self.assertTrue(limited.start().wait(2))
+        finally:
+            for task in [*endless, limited]:
+                task.exit()
+
+    def test_task_waiting_for_a_slot_is_reported(self):
+        pool = WorkerPool(max_per_priority=1, name='TestPool')
+
+        def test_fn(ctx):
+            evt = Event()
+            ctx.on_stopped(evt.set)
+            evt.wait(2)
+
+        running = PooledThreadWrapper(pool, test_fn)
+        queued = PooledThreadWrapper(pool, test_fn, 'QueuedTask')
+
+        try:
+            running.start().wait(2)
+            with patch('revvy.thread_wrapper.print', create=True) as mock_print:
+                queued.start()
+
+            self.assertIn(call('TestPool: QueuedTask waits, 1 tasks of priority 0 are running'),
+                          mock_print.call_args_list)
+
+            # a queued task that is no longer limited starts right away
+            queued.limited = False
+            self.assertTrue(queued.start().wait(2))
+        finally:
+            queued.exit()
+            running.exit()
+
+    def test_stopping_a_queued_task_does_not_wait_for_free_slot(self):
+        pool = WorkerPool(max_per_priority=1)
+        mock = Mock()
+
+        def blocking_fn(ctx):
+            evt = Event()
+            ctx.on_stopped(evt.set)
+            evt.wait(2)
+
+        def test_fn(ctx):
+            mock(ctx.stop_requested)
+
+        blocking = PooledThreadWrapper(pool, blocking_fn)
+        queued = PooledThreadWrapper(pool, test_fn)
+
+        try:
+            blocking.start().wait(2)
+            queued.start()
+
+            start_time = time.time()
+            self.assertTrue(queued.stop().wait(2))
+            self.assertLess(time.time() - start_time, 1)
+
+            # the task ran with the stop already requested
+            mock.assert_called_once_with(True)
+            self.assertTrue(blocking.is_running)
+        finally:
+            queued.exit()
+            blocking.exit()
+
+    def test_starting_a_running_task_runs_it_again(self):
+        mock = Mock()
+        allow_stop = Event()
+
+        def test_fn(ctx):
+            mock()
+            allow_stop.wait(2)
+
+        tw = PooledThreadWrapper(WorkerPool(), test_fn)
+
+        try:
+            tw.start().wait(2)
+            stopped = tw.stop()
+            tw.start()
+            tw.start()
+            allow_stop.set()
+
+            self.assertTrue(stopped.wait(2))
+            self.assertTrue(tw.stop().wait(2))
+        finally:
+            allow_stop.set()
+            tw.exit()
+
+        self.assertEqual(2, mock.call_count)
+
+    def test_stopping_a_starting_task_stops_it(self):
+        mock = Mock()
+
+        def test_fn(ctx):
+            evt = Event()
+            ctx.on_stopped(evt.set)
+            if not evt.wait(2):
+                self.fail('Task stop was not called')
+            mock()
+
+        tw = PooledThreadWrapper(WorkerPool(), test_fn)
+
+        try:
+            for i in range(200):
+                mock.reset_mock()
+                tw.start()
+                if not tw.stop().wait(2):
+                    self.fail('Failed to stop task')
+
+                self.assertEqual(1, mock.call_count)
+        finally:
+            tw.exit()
+
+    def test_sleep_on_context_is_interrupted_when_task_is_exited(self):
+        tw = PooledThreadWrapper(WorkerPool(), lambda ctx: ctx.sleep(10000))
+        start_time = time.time()
+        tw.start().wait()
+        tw.exit()
+        self.assertLess(time.time() - start_time, 2)
@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: GPL-3.0-only
+
+# create a firmware patch and print the matching catalog entry
+# start using 'python -m tools.create_firmware_patch' from the root directory
+import argparse
+import binascii
+import json
+from os import path
+
+from revvy.firmware_updater import create_firmware_patch
+from revvy.functions import bytestr_hash
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('base', help='Firmware image the patch applies to')
+    parser.add_argument('base_version', help='Version of the base firmware')
+    parser.add_argument('target', help='New firmware image')
+    parser.add_argument('output', help='Patch file to create')
+    parser.add_argument('--block-size', help='Size of compared blocks', type=int, default=256)
+
+    args = parser.parse_args()
+
+    with open(args.base, 'rb') as f:
+        base = f.read()
+    with open(args.target, 'rb') as f:
+        target = f.read()
+
+    patch = create_firmware_patch(base, target, args.block_size)
+
+    with open(args.output, 'wb') as f:
+        f.write(patch)
+
+    print('Patch size: {} bytes, full image: {} bytes'.format(len(patch), len(target)))
+    print('Add the following to the "patches" list of the catalog entry:')
+    print(json.dumps({
+        'base_version': args.base_version,
+        'base_crc': binascii.crc32(base),
+        'filename': path.basename(args.output),
+        'md5': bytestr_hash(patch),
+        'length': len(patch)
+    }, indent=4))
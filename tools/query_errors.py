@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: GPL-3.0-only
+import argparse
+
+from revvy.mcu.error_memory import ErrorLog, ErrorType, fw_version_string, error_address
+from tools.read_errors import format_error, exception_names
+
+
+def parse_error_type(value):
+    try:
+        return int(value, 0)
+    except ValueError:
+        return ErrorType[value]
+
+
+def error_name(error_id):
+    return exception_names[error_id] if error_id < len(exception_names) else 'Unknown error'
+
+
+def print_summary(entries):
+    """Group the errors by type, firmware version and address, most frequent first"""
+    groups = {}
+    for source, record in entries:
+        groups.setdefault((record.error_id, fw_version_string(record), error_address(record)), []).append(source)
+
+    line_format = '{:>6} {:>6}  {:<20} {:<10} {}'
+    print(line_format.format('count', 'robots', 'error', 'firmware', 'address'))
+    for (error_id, fw, address), sources in sorted(groups.items(), key=lambda item: -len(item[1])):
+        address_str = '0x{:08X}'.format(address) if address is not None else '-'
+        print(line_format.format(len(sources), len(set(sources)), error_name(error_id), fw or '?', address_str))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Filter the errors collected into error log files')
+    parser.add_argument('logs', nargs='+', help='Error log files')
+    parser.add_argument('--type', help='Error type, as a number or name (e.g. HardFault)', type=parse_error_type)
+    parser.add_argument('--fw', help='Firmware version (e.g. 0.2.10)')
+    parser.add_argument('--address', help='Hard fault address (PC)', type=lambda x: int(x, 0))
+    parser.add_argument('--source', help='Robot name')
+    parser.add_argument('--details', help='Print every matching error', action='store_true')
+
+    args = parser.parse_args()
+
+    matching = []
+    for log_file in args.logs:
+        log = ErrorLog(log_file)
+        matching += log.query(error_type=args.type, fw_version=args.fw, address=args.address, source=args.source)
+
+    print('{} matching errors'.format(len(matching)))
+    if args.details:
+        for source, record in matching:
+            print('----------------------------------------')
+            print('Robot: {}'.format(source))
+            print(format_error(record))
+    elif matching:
+        print_summary(matching)
@@ -1,35 +1,13 @@
 #!/usr/bin/python3
 # SPDX-License-Identifier: GPL-3.0-only
 import argparse
-import enum
 import traceback
 
-from revvy.hardware_dependent.rrrc_transport_i2c import RevvyTransportI2C
-from revvy.mcu.rrrc_control import RevvyControl
+from revvy.mcu.error_memory import ErrorType, ErrorRecord, ErrorLog, parse_error_record, read_error_records, \
+    hw_version_string, fw_version_string
 from revvy.version import Version
 from tools.utils import parse_cfsr
 
-
-class ErrorType(enum.IntEnum):
-    HardFault = 0
-    StackOverflow = 1
-    AssertFailure = 2
-    TestError = 3
-    ImuError = 4
-
-
-hw_formats = {
-    0: '1.0.0',
-    1: '1.0.1',
-    2: '2.0.0'
-}
-
-fw_formats = {
-    0: '0.1.{}',
-    1: '0.1.{}',
-    2: '0.2.{}'
-}
-
 exception_names = [
     'Hard fault',
     'Stack overflow',
@@ -40,13 +18,12 @@ exception_names = [
 ]
 
 
-def format_error(error, current_fw_version: Version, only_current=False):
+def format_error(error, current_fw_version: Version = None, only_current=False):
     # noinspection PyBroadException
     try:
-        error_id = error[0]
-        hw_version = error[1:5]
-        fw_version = error[5:9]
-        error_data = error[9:]
+        record = error if isinstance(error, ErrorRecord) else parse_error_record(error)
+        error_id = record.error_id
+        error_data = record.data
 
         if error_id == ErrorType.HardFault:
             pc = int.from_bytes(error_data[0:4], byteorder='little')
@@ -84,18 +61,17 @@ def format_error(error, current_fw_version: Version, only_current=False):
         else:
             details_str = '\nData: {}'.format(error_data)
 
-        hw = int.from_bytes(hw_version, byteorder='little')
-        fw = int.from_bytes(fw_version, byteorder='little')
-
-        hw_str = hw_formats[hw]
-        fw_str = fw_formats[hw].format(fw)
+        hw_str = hw_version_string(record)
+        fw_str = fw_version_string(record)
+        if fw_str is None:
+            raise KeyError('Unknown hardware version {}'.format(record.hw))
 
         try:
             exception_name = exception_names[error_id]
         except IndexError:
             exception_name = 'Unknown error'
 
-        if Version(fw_str) == current_fw_version:
+        if current_fw_version is None or Version(fw_str) == current_fw_version:
             error_template = '{} ({}, HW: {}, FW: {})\nDetails: {}'
         elif not only_current:
             error_template = '{} ({}, HW: {}, FW: {} (NOT CURRENT))\nDetails: {}'
@@ -110,21 +86,29 @@ def format_error(error, current_fw_version: Version, only_current=False):
 
 
 if __name__ == "__main__":
+    from revvy.hardware_dependent.rrrc_transport_i2c import RevvyTransportI2C
+    from revvy.mcu.rrrc_control import RevvyControl
+
     parser = argparse.ArgumentParser()
     parser.add_argument('--inject-test-error', help='Record an error', action='store_true')
     parser.add_argument('--clear', help='Clear the error memory', action='store_true')
     parser.add_argument('--only-current',
                         help='Only display errors that were recorded with the current firmware',
                         action='store_true')
+    parser.add_argument('--log', help='Append the errors to this error log file')
+    parser.add_argument('--source', help='Name of the robot in the error log, e.g. its serial number')
 
     args = parser.parse_args()
 
+    if args.log and not args.source:
+        parser.error('--log requires --source')
+
     with RevvyTransportI2C() as transport:
         robot_control = RevvyControl(transport.bind(0x2D))
 
         current_hw_version = robot_control.get_hardware_version()
         current_fw_version = robot_control.get_firmware_version()
-        print('Current version numbers: HW: {} FW: {}'.format(current_fw_version, current_fw_version))
+        print('Current version numbers: HW: {} FW: {}'.format(current_hw_version, current_fw_version))
 
         if args.inject_test_error:
             print('Recording a test error')
@@ -139,23 +123,21 @@ if __name__ == "__main__":
         else:
             print('There are {} errors stored'.format(error_count))
 
-        remaining = error_count
-        i = 0
-        while remaining > 0:
-            errors = robot_control.error_memory_read_errors(i)
-            if len(errors) == 0:
-                print('0 errors returned, exiting')
-                break
-
-            remaining -= len(errors)
-
-            for err in errors:
-                error = format_error(err, current_fw_version, only_current=args.only_current)
-                if error is not None:
-                    print('----------------------------------------')
-                    print('Error {}'.format(i))
-                    print(error)
-                i += 1
+        records = []
+        for i, err in read_error_records(robot_control):
+            records.append(err)
+            error = format_error(err, current_fw_version, only_current=args.only_current)
+            if error is not None:
+                print('----------------------------------------')
+                print('Error {}'.format(i))
+                print(error)
+
+        if len(records) < error_count:
+            print('Only {} errors could be read'.format(len(records)))
+
+        if args.log:
+            added = ErrorLog(args.log).append(args.source, records)
+            print('{} new errors added to {}'.format(added, args.log))
 
         if args.clear:
             print('Clearing error memory...')
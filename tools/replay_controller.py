@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: GPL-3.0-only
+import argparse
+import time
+
+from revvy.mcu.rrrc_control import RevvyControl
+from revvy.robot.controller_log import read_controller_log, SimulatedTransport, ControllerReplay, packet_latencies
+from revvy.robot.drivetrain import DifferentialDrivetrain
+from revvy.robot.remote_controller import RemoteController, RemoteControllerScheduler, create_remote_controller_thread
+from revvy.robot_config import RobotConfig
+from revvy.scripting.builtin_scripts import builtin_scripts
+from revvy.scripting.resource import Resource
+from revvy.scripting.runtime import ScriptManager
+
+
+class ReplayRobot:
+    """The parts of the robot manager that scripts need, with a drivetrain on a simulated transport"""
+
+    class LedRing:
+        count = 0
+
+    class Hardware:
+        def __init__(self, interface):
+            self.start_time = time.time()
+            self.motors = []
+            self.sensors = []
+            self.sound = None
+            self.led_ring = ReplayRobot.LedRing()
+            self.imu = None
+            self.drivetrain = DifferentialDrivetrain(interface, 6)
+
+    def __init__(self, interface):
+        self.robot = self.Hardware(interface)
+        self.config = RobotConfig()
+        self.resources = {'led_ring': Resource(), 'drivetrain': Resource(), 'sound': Resource()}
+
+
+def print_latencies(latencies):
+    measured = sorted(latency * 1000 for latency in latencies if latency is not None)
+    superseded = len(latencies) - len(measured)
+    print('Packets: {}, superseded before an MCU command was sent: {}'.format(len(latencies), superseded))
+    if measured:
+        print('Latency [ms]: min {:.3f} mean {:.3f} median {:.3f} p95 {:.3f} max {:.3f}'.format(
+            measured[0],
+            sum(measured) / len(measured),
+            measured[len(measured) // 2],
+            measured[min(len(measured) - 1, int(len(measured) * 0.95))],
+            measured[-1]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay a recorded controller session against a simulated MCU')
+    parser.add_argument('log', help='Controller log file, recorded when REVVY_CONTROLLER_LOG is set to its path')
+    parser.add_argument('--speed', help='Playback speed multiplier, 0 to replay without delays', type=float,
+                        default=1.0)
+    parser.add_argument('--script', help='Builtin script to drive with', choices=builtin_scripts.keys(),
+                        default='drive_joystick')
+    parser.add_argument('--channels', help='Analog channels of the script', type=int, nargs=2, default=[0, 1])
+    parser.add_argument('--response-time', help='Simulated MCU response time in seconds', type=float, default=0.0)
+
+    args = parser.parse_args()
+
+    with open(args.log, 'rb') as f:
+        records = read_controller_log(f)
+
+    transport = SimulatedTransport(args.response_time)
+    robot = ReplayRobot(RevvyControl(transport))
+
+    scripts = ScriptManager(robot)
+    scripts.add_script('replay', builtin_scripts[args.script])
+
+    rc = RemoteController()
+    rcs = RemoteControllerScheduler(rc)
+    rc_thread = create_remote_controller_thread(rcs)
+
+    rc.on_analog_values(args.channels, scripts['replay'].push_input)
+
+    rc_thread.start().wait()
+    try:
+        # give the scheduler time to start waiting for messages
+        time.sleep(0.1)
+
+        arrivals = ControllerReplay(records, args.speed or None).run(rcs.data_ready)
+
+        # let the last packets get through
+        time.sleep(0.2)
+    finally:
+        rc_thread.exit()
+        scripts.reset()
+
+    print_latencies(packet_latencies(arrivals, [timestamp for (timestamp, _, _) in transport.commands]))
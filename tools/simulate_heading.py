@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: GPL-3.0-only
+import argparse
+
+from revvy.robot.heading import HeadingController, PidController, DriveSimulator
+
+
+def simulate(args, hold):
+    """Drive straight for the given time, returns the trace of (time, yaw, lateral offset)"""
+    robot = DriveSimulator(args.bias, response_time=args.response_time)
+    pid = PidController(args.kp, args.ki, args.kd, args.max_correction, HeadingController.max_integral)
+    controller = HeadingController(robot.set_speeds, pid)
+
+    if hold:
+        controller.hold(robot.measured_yaw, args.speed, args.speed)
+    else:
+        robot.set_speeds(args.speed, args.speed)
+
+    trace = []
+    steps = int(args.duration / args.period)
+    for i in range(1, steps + 1):
+        robot.step(args.period)
+        timestamp = i * args.period
+        controller.update(robot.measured_yaw, timestamp)
+        trace.append((timestamp, robot.yaw, robot.y))
+
+    return trace
+
+
+def print_trace(name, trace, print_every):
+    print(name)
+    print('{:>8} {:>10} {:>12}'.format('time [s]', 'yaw [deg]', 'offset [cm]'))
+    for (timestamp, yaw, offset) in trace[print_every - 1::print_every]:
+        print('{:>8.2f} {:>10.2f} {:>12.2f}'.format(timestamp, yaw, offset * 100))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Simulate driving straight with and without heading hold')
+    parser.add_argument('--speed', help='Wheel speed in degrees/s', type=float, default=900)
+    parser.add_argument('--duration', help='Length of the drive in seconds', type=float, default=5)
+    parser.add_argument('--period', help='Time between yaw updates in seconds', type=float, default=0.02)
+    parser.add_argument('--bias', help='Relative speed error of the right side', type=float, default=0.05)
+    parser.add_argument('--response-time', help='Time constant of the motor speed control', type=float, default=0.1)
+    parser.add_argument('--kp', type=float, default=HeadingController.kp)
+    parser.add_argument('--ki', type=float, default=HeadingController.ki)
+    parser.add_argument('--kd', type=float, default=HeadingController.kd)
+    parser.add_argument('--max-correction', type=float, default=HeadingController.max_correction)
+
+    args = parser.parse_args()
+    print_every = max(1, int(0.5 / args.period))
+
+    print_trace('Without heading hold', simulate(args, hold=False), print_every)
+    print()
+    print_trace('With heading hold', simulate(args, hold=True), print_every)